@@ -1,6 +1,20 @@
 import sys
+import time
+
+IMPORTS_STARTED = time.perf_counter()  # --startup-profile reports the imports below as their own phase
+
 import json
+import argparse
+import multiprocessing
 import os
+import threading
+import csv
+import re
+import bisect
+import hashlib
+import atexit
+import functools
+from contextlib import nullcontext, contextmanager
 from PyQt5.QtWidgets import (
     QApplication,
     QWidget,
@@ -8,8 +22,7 @@ from PyQt5.QtWidgets import (
     QHBoxLayout,
     QPushButton,
     QLabel,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QMessageBox,
     QMainWindow,
     QTabWidget,
@@ -17,47 +30,3311 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QSizePolicy,
     QComboBox,
-    QAbstractItemView
+    QAbstractItemView,
+    QStyledItemDelegate,
+    QCheckBox,
+    QSpinBox,
+    QFileDialog,
+    QProgressDialog,
+    QShortcut,
+    QSplashScreen,
+    QDialog,
+    QDialogButtonBox,
+    QScrollArea
 )
-from PyQt5.QtGui import QFont, QPainter, QPixmap, QIcon  
-from PyQt5.QtCore import Qt, QSize, QSizeF, QRect
-from PyQt5.QtPrintSupport import QPrinter, QPrintDialog, QPrintPreviewDialog  
-from datetime import datetime
+from PyQt5.QtGui import QFont, QPainter, QPixmap, QIcon, QColor, QKeySequence
+from PyQt5.QtCore import (Qt, QSize, QSizeF, QRect, QAbstractTableModel, QModelIndex, QTimer, QEvent, pyqtSignal,
+                          pyqtSlot, QSocketNotifier)
+from datetime import datetime, timedelta
+from collections import namedtuple
+from array import array
+
+numpy = False  # Imported on first use by load_numpy(); None once it turns out not to be installed
+
+try:
+    import orjson
+except ImportError:  # Optional; JSON goes through the standard library instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional; needed only for the "msgpack" snapshot format
+    msgpack = None
+
+try:
+    import fcntl
+except ImportError:  # Windows locks through msvcrt instead
+    fcntl = None
+    import msvcrt
 
+# Print support, asyncio, sqlite3, sockets, process pools and openpyxl are imported where first used;
+# most runs never print, serve or touch SQLite and should not pay for loading them
+IMPORTS_FINISHED = time.perf_counter()
 
 
 
 DATA_FILE = "barbershop_data.json"
+JOURNAL_FILE = "barbershop_data.journal"
+COMPACTING_SUFFIX = ".compacting"
+LOCK_SUFFIX = ".lock"  # Side file every instance locks around journal appends, rotation and compaction
+COMPACT_THRESHOLD = 1000  # Journal entries written before the snapshot is rebuilt in the background
+LOCK_TIMEOUT = 60.0  # Seconds a blocking FileLock waits on Windows before giving up with TimeoutError
+ROTATE_ATTEMPTS = 50  # Tries, 20 ms apart, at renaming a journal another instance still has open on Windows
+WRITE_INTERVAL = 1.0  # Seconds the background writer waits to batch mutations into one disk write
+EARNINGS_ARCHIVE_DIR = "barbershop_earnings"  # One file per archived month of earnings
+JOURNAL_POLL_MS = 2000  # How often an idle window looks for changes another instance journaled
+IMPORT_BATCH = 1000  # Rows validated and added to the store per journal entry during a bulk import
+IMPORT_ERRORS_KEPT = 50  # Rejected rows described in the import report; the rest are only counted
+STARTUP_PROFILE_FILE = "barbershop_startup.txt"  # Where --startup-profile writes when the build has no console
+TRACE_REPORT_FILE = "barbershop_trace.txt"  # Where the BARBERSHOP_TRACE=1 report goes when the build has no console
+TRACE_ENV = "BARBERSHOP_TRACE"  # "1" prints a latency report on exit; any other value is where a Chrome trace is written
+TRACE_SHORTCUT = "Ctrl+Shift+F12"  # Hidden key that shows the performance overlay and starts tracing
+TRACE_OVERLAY_MS = 1000  # How often the overlay redraws its table
+TRACE_BUCKETS = 32  # Latency histogram buckets; bucket n counts calls under 2**n microseconds
+TRACE_EVENTS_KEPT = 100000  # Calls kept for the Chrome trace; the histograms keep counting after that
+
+COLLECTIONS = ("packages", "inventory", "earnings", "customers", "monthly_earnings", "expenses", "stock_movements")
+
+# Field each collection is naturally looked up by; duplicates are allowed
+NATURAL_KEYS = {
+    "packages": "description",
+    "inventory": "component",
+    "customers": "mobile",
+}
+
+# Why stock moved; each stock_movements record has one and lists its (inventory id, change) lines
+STOCK_SALE = "sale"  # Materials a checkout used, per the package's bill of materials
+STOCK_ADJUSTMENT = "adjustment"  # The inventory tab's +/- buttons
+LOW_STOCK_COLOR = QColor("#ffcdd2")  # Background of inventory rows at or under their min_quantity
+
+SEARCH_DEBOUNCE_MS = 200  # Quiet time after the last keystroke before the customer search runs
+
+# Harakat, superscript alef and tatweel are dropped; letter variants fold to one form
+ARABIC_DIACRITICS = re.compile("[\u064B-\u0652\u0670\u0640]")
+ARABIC_FOLDS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ة": "ه",
+    "ؤ": "و",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4", "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+
+NON_DIGITS = re.compile("[^0-9]")
+
+ARABIC_WEEKDAYS = ["الاثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت", "الأحد"]  # datetime.weekday() order
+
+ARABIC_MONTHS = ["يناير", "فبراير", "مارس", "أبريل", "مايو", "يونيو", "يوليو", "أغسطس", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر"]
+
+CONFIG_FILE = "barbershop_config.json"
+SQLITE_DATABASE = "barbershop_data.db"
+DEFAULT_CONFIG = {
+    "storage": "json",  # "json" or "sqlite"
+    "database": SQLITE_DATABASE,
+    "write_interval": WRITE_INTERVAL,
+    "prewarm_tabs": True,  # Build the remaining tabs one by one once the window is idle
+    "startup_report": False,  # Print how long the store and each tab took to load
+    "server": None,  # "host:port" or Unix socket path of a --serve process; None keeps the data in this process
+    "snapshot_format": "json",  # "json" or "msgpack" (binary, needs the msgpack package); either format is read back
+}
+
+SERVER_ADDRESS = "127.0.0.1:8765"  # Where --serve listens when neither the command line nor the config says
+
+# Fields of a bulk import or export, in file order: (key, column title, parse, default); no default means required
+IMPORT_FIELDS = {
+    "customers": (("name", "الاسم", "text", None), ("mobile", "رقم الموبايل", "text", None),
+                  ("visits", "عدد الزيارات", "int", 0)),
+    "inventory": (("component", "المكون", "text", None), ("quantity", "الكمية", "int", None),
+                  ("price", "السعر", "number", 0)),
+    "expenses": (("description", "الوصف", "text", None), ("amount", "المبلغ", "number", None),
+                 ("date", "التاريخ", "date", "")),
+}
+
+# Field kinds a loaded snapshot is normalized to, parsed as in import_value; absent fields stay absent
+SNAPSHOT_FIELDS = {
+    "packages": (("description", "text"), ("price", "number")),
+    "inventory": (("component", "text"), ("quantity", "int"), ("price", "number"), ("min_quantity", "int")),
+    "earnings": (("amount", "number"), ("package_id", "int"), ("customer_id", "int"), ("quantity", "int")),
+    "customers": (("name", "text"), ("mobile", "text"), ("visits", "int")),
+    "monthly_earnings": (("amount", "number"),),
+    "expenses": (("description", "text"), ("amount", "number")),
+    "stock_movements": (("reason", "text"), ("earning_id", "int")),
+}
+SNAPSHOT_TYPES = {"text": str, "number": float, "int": int}
+
+# Column layout of the SQLite backend; fields not listed here go to the JSON "extra" column
+SQLITE_COLUMNS = {
+    "packages": (("description", "TEXT"), ("price", "NUMERIC")),
+    "inventory": (("component", "TEXT"), ("quantity", "INTEGER"), ("price", "NUMERIC"), ("min_quantity", "INTEGER")),
+    "earnings": (("date", "TEXT"), ("amount", "NUMERIC"), ("package_id", "INTEGER"), ("customer_id", "INTEGER"),
+                 ("quantity", "INTEGER")),
+    "customers": (("name", "TEXT"), ("mobile", "TEXT"), ("visits", "INTEGER")),
+    "monthly_earnings": (("month", "TEXT"), ("amount", "NUMERIC")),
+    "expenses": (("description", "TEXT"), ("amount", "NUMERIC")),
+    "stock_movements": (("date", "TEXT"), ("reason", "TEXT"), ("earning_id", "INTEGER")),
+}
+SQLITE_INDEXES = (
+    ("earnings", "date"),
+    ("earnings", "package_id"),
+    ("earnings", "customer_id"),
+    ("customers", "name"),
+    ("customers", "mobile"),
+    ("inventory", "component"),
+)
+
+
+class Tracer:
+    """ In-memory latency histograms of the @traced entry points, and the calls themselves for a Chrome trace """
+
+    def __init__(self, setting=None):
+        self.setting = setting or None
+        self.enabled = self.setting is not None
+        self.lock = threading.Lock()
+        self.stats = {}  # name -> [calls, total ns, max ns, histogram]
+        self.events = []  # (name, start ns, duration ns, thread id)
+
+    def record(self, name, started, ended):
+        elapsed = ended - started
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = [0, 0, 0, [0] * TRACE_BUCKETS]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            stats[3][min((elapsed // 1000).bit_length(), TRACE_BUCKETS - 1)] += 1
+            if len(self.events) < TRACE_EVENTS_KEPT:
+                self.events.append((name, started, elapsed, threading.get_ident()))
+
+    def summary(self):
+        """ (name, calls, mean, p50, p95, max) rows in milliseconds, largest total time first; percentiles are bucket bounds """
+        def percentile(histogram, calls, fraction, largest):
+            seen = 0
+            for bucket, count in enumerate(histogram):
+                seen += count
+                if seen >= calls * fraction:
+                    return min(2 ** bucket / 1000, largest)
+            return largest
+
+        with self.lock:
+            stats = [(name, calls, total, largest, list(histogram))
+                     for name, (calls, total, largest, histogram) in self.stats.items()]
+        rows = []
+        for name, calls, total, largest, histogram in sorted(stats, key=lambda item: -item[2]):
+            largest /= 1e6
+            rows.append((name, calls, total / calls / 1e6, percentile(histogram, calls, 0.5, largest),
+                         percentile(histogram, calls, 0.95, largest), largest))
+        return rows
+
+    def report(self):
+        lines = [f"{'':36} {'calls':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+        for name, calls, mean, p50, p95, largest in self.summary():
+            lines.append(f"{name:36} {calls:7d} {mean:9.2f} {p50:9.2f} {p95:9.2f} {largest:9.2f}")
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path):
+        """ Complete events in the Trace Event format, for chrome://tracing or Perfetto """
+        pid = os.getpid()
+        with self.lock:
+            events = [{"name": name, "ph": "X", "ts": started / 1000, "dur": elapsed / 1000, "pid": pid, "tid": tid}
+                      for name, started, elapsed, tid in self.events]
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def dump(self):
+        """ At exit: the Chrome trace if the environment named a file, otherwise the report on stderr or to a file """
+        if not self.stats:
+            return
+        if self.setting not in (None, "1"):
+            self.write_chrome_trace(self.setting)
+        elif sys.stderr is not None:
+            sys.stderr.write(self.report() + "\n")
+        else:
+            with open(TRACE_REPORT_FILE, 'w', encoding='utf-8') as file:
+                file.write(self.report() + "\n")
+
+
+TRACER = Tracer(os.environ.get(TRACE_ENV))
+atexit.register(TRACER.dump)
+
+
+def traced(function):
+    """ Time every call into TRACER while it is enabled; disabled, a call costs one attribute check """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not TRACER.enabled:
+            return function(*args, **kwargs)
+        started = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            TRACER.record(name, started, time.perf_counter_ns())
+    return wrapper
+
+
+def encode_json(value):
+    """ Compact UTF-8 JSON, Arabic left unescaped; orjson writes the same text when it is installed """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode_json(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content.decode("utf-8") if isinstance(content, bytes) else content)
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, value):
+        return encode_json(value)
 
-def load_data():
+    def decode(self, content):
+        return decode_json(content)
+
+
+class MsgpackCodec:
+    """ Binary snapshots; smaller and faster to parse than JSON, but not editable by hand """
+
+    name = "msgpack"
+
+    def encode(self, value):
+        if msgpack is None:
+            raise ImportError("msgpack snapshots need the msgpack package")
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, content):
+        if msgpack is None:
+            raise SnapshotInvalid("written as msgpack, which needs the msgpack package (pip install msgpack)")
+        return msgpack.unpackb(content, raw=False, strict_map_key=False)
+
+
+SNAPSHOT_CODECS = {"json": JsonCodec(), "msgpack": MsgpackCodec()}
+snapshot_codec = SNAPSHOT_CODECS["json"]  # What save_data writes; set from the config by open_store
+ARCHIVE_SUFFIXES = tuple(f".{name}" for name in SNAPSHOT_CODECS)  # Month files are named after the codec they were written with
+
+def use_snapshot_format(name):
+    """ Write snapshots in the named format from now on; anything else, or msgpack without the package, is JSON """
+    global snapshot_codec
+    if name == "msgpack" and msgpack is None:
+        name = "json"
+    snapshot_codec = SNAPSHOT_CODECS.get(name, SNAPSHOT_CODECS["json"])
+
+def decode_snapshot(content):
+    """ Decode a snapshot or archive file in whichever format it was written; JSON always starts with text """
+    if content.startswith(b"\xef\xbb\xbf"):
+        content = content[3:]  # Byte order mark left by Windows editors
+    codec = SNAPSHOT_CODECS["json" if content[:64].lstrip()[:1] in (b"{", b"[") else "msgpack"]
     try:
-        with open(DATA_FILE, 'r') as file:
-            data = json.load(file)
-            if "packages" not in data:
-                data["packages"] = []
-            if "inventory" not in data:
-                data["inventory"] = []
-            if "earnings" not in data:
-                data["earnings"] = []
-            if "customers" not in data:
-                data["customers"] = []
-            if "monthly_earnings" not in data:  
-                data["monthly_earnings"] = []  
-            if "expenses" not in data:  # Add this line for expenses
-                data["expenses"] = []  # Initialize expenses if not present
-            return data
+        return codec.decode(content)
+    except SnapshotInvalid:
+        raise
+    except (ValueError, TypeError) as error:  # Truncated or garbled; msgpack's unpack errors are ValueErrors too
+        raise SnapshotInvalid(f"cannot be decoded as {codec.name}: {error}") from None
+
+
+class SnapshotInvalid(ValueError):
+    """ A snapshot or archive file that cannot be decoded, or holds a record that does not fit SNAPSHOT_FIELDS """
+
+
+def normalize_records(name, records, next_id=1):
+    """ Convert the fields of each record to their SNAPSHOT_FIELDS kind and give records without an id one.
+
+    Returns the next free id. A value that cannot be converted raises
+    SnapshotInvalid rather than being dropped.
+    """
+    if not isinstance(records, list):
+        raise SnapshotInvalid(f"{name}: not a list")
+    fields = [(key, kind, SNAPSHOT_TYPES[kind]) for key, kind in SNAPSHOT_FIELDS[name]]
+    for record in records:
+        if not isinstance(record, dict):
+            raise SnapshotInvalid(f"{name}: {record!r} is not a record")
+        for key, kind, expected in fields:
+            value = record.get(key)
+            if value is not None and type(value) is not expected:
+                try:
+                    record[key] = import_value(kind, value)
+                except (TypeError, ValueError):
+                    raise SnapshotInvalid(f"{name} {record.get('id')}: {key} = {value!r}")
+        if "id" not in record:
+            record["id"] = next_id
+        next_id = max(next_id, record["id"] + 1)
+    return next_id
+
+def normalize_snapshot(data):
+    """ One pass over a decoded snapshot: every collection present, fields normalized, next ids worked out """
+    if not isinstance(data, dict):
+        raise SnapshotInvalid("not an object")
+    next_ids = data.setdefault("next_ids", {})
+    for name in COLLECTIONS:
+        next_ids[name] = normalize_records(name, data.setdefault(name, []), next_ids.get(name, 1))
+    return data
+
+def read_snapshot(path=DATA_FILE):
+    """ The last compacted snapshot, normalized, and the digest of the file it came from """
+    try:
+        with open(path, 'rb') as file:
+            content = file.read()
+    except FileNotFoundError:
+        content = None
+    # An unreadable snapshot is refused rather than read as empty, which compaction would then write over it
+    try:
+        data = normalize_snapshot(decode_snapshot(content) if content else {})
+    except SnapshotInvalid as error:
+        raise SnapshotInvalid(f"{path}: {error}") from None
+    return data, content_digest(content)
+
+def load_snapshot(path=DATA_FILE):
+    return read_snapshot(path)[0]
+
+def content_digest(content):
+    return hashlib.sha1(content).hexdigest() if content is not None else None
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as file:
+            return content_digest(file.read())
+    except FileNotFoundError:
+        return None
+
+def assign_ids(data):
+    """ Give records saved before ids existed one, in list order, and work out the next free ids """
+    next_ids = data.setdefault("next_ids", {})
+    for name in COLLECTIONS:
+        next_id = next_ids.get(name, 1)
+        for record in data[name]:
+            if "id" not in record:
+                record["id"] = next_id
+            next_id = max(next_id, record["id"] + 1)
+        next_ids[name] = next_id
+
+def record_position(records, record_id):
+    """ Binary search by id; records are only ever appended, so ids ascend with position """
+    if isinstance(records, EarningsLedger):
+        return records.position(record_id)
+    low, high = 0, len(records)
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle]["id"] < record_id:
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(records) and records[low]["id"] == record_id:
+        return low
+    raise KeyError(record_id)
+
+def apply_mutation(data, entry):
+    """ Apply a single journal entry to the in-memory data """
+    name = entry["c"]
+    collection = data.setdefault(name, [])
+    op = entry["op"]
+    if op == "add":
+        collection.append(entry["r"])
+        next_ids = data.setdefault("next_ids", {})
+        next_ids[name] = max(next_ids.get(name, 1), entry["r"]["id"] + 1)
+    elif op == "bulk":
+        for record in entry["rs"]:
+            collection.append(record)
+        next_ids = data.setdefault("next_ids", {})
+        next_ids[name] = max(next_ids.get(name, 1), entry["rs"][-1]["id"] + 1)
+    elif op == "upd":
+        collection[record_position(collection, entry["id"])].update(entry["r"])
+    elif op == "del":
+        collection.pop(record_position(collection, entry["id"]))
+    elif op == "clear":
+        collection.clear()
+        if name == "earnings":
+            data.pop("earnings_archive", None)
+    data["journal_seq"] = entry["n"]
+
+def replay_journal(data, path, aggregates=None, archive=None):
+    """ Apply the journal entries newer than the snapshot.
+
+    Returns the number of entries applied and the byte offset of the end of
+    the last complete line, so a record torn by a crash can be cut off.
+    When aggregates is given the earnings rollup is carried along; with an
+    archive, edits to archived earnings load their month first.
+    """
+    applied = 0
+    end = 0
+    try:
+        with open(path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = decode_json(line)
+                except ValueError:
+                    break
+                end += len(line)
+                if entry["n"] > data.get("journal_seq", 0):
+                    if archive is not None and entry["c"] == "earnings":
+                        archive.prepare(data, entry)
+                    if aggregates is not None and entry["c"] == "earnings":
+                        aggregates.apply(data["earnings"], entry)
+                    apply_mutation(data, entry)
+                    applied += 1
+    except FileNotFoundError:
+        pass
+    return applied, end
+
+@traced
+def load_data(path=DATA_FILE, journal_path=JOURNAL_FILE, archive_dir=EARNINGS_ARCHIVE_DIR):
+    """ Load the snapshot and replay every journal entry written since, archived earnings included """
+    data = load_snapshot(path)
+    archive = JsonEarningsArchive(archive_dir, data)
+    replay_journal(data, journal_path + COMPACTING_SUFFIX, archive=archive)
+    replay_journal(data, journal_path, archive=archive)
+    for month in archive.months():
+        archive.load_into(data, month)
+    data.pop("earnings_archive", None)
+    return data
+
+class SnapshotChanged(Exception):
+    """ The file changed on disk since it was read, so writing over it would lose that change """
+
+
+@traced
+def save_data(data, path=DATA_FILE, expected_digest=None):
+    """ Write a full snapshot through a temporary file so a crash can't truncate it.
+
+    With expected_digest, the write is refused with SnapshotChanged unless
+    the file still holds what was read.
+    """
+    install_snapshot(write_snapshot_temp(data, path), path, expected_digest)
+
+def write_snapshot_temp(data, path):
+    """ Encode data into the temporary file next to path and fsync it; returns that file's path """
+    temp_path = path + ".tmp"
+    content = snapshot_codec.encode(data)
+    with open(temp_path, 'wb') as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    return temp_path
+
+def snapshot_stamp(path):
+    """ Identity, size and modification time of path, a cheap stand-in for rereading its digest """
+    try:
+        status = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return status.st_ino, status.st_size, status.st_mtime_ns
+
+def install_snapshot(temp_path, path, expected_digest=None, checked_stamp=None):
+    """ Move a written temporary file over path, unless path no longer holds expected_digest.
+
+    checked_stamp is the snapshot_stamp() taken when the digest was last
+    verified; while the file still matches it, the digest is not read again.
+    """
+    if expected_digest is not None and (checked_stamp is None or snapshot_stamp(path) != checked_stamp) \
+            and file_digest(path) != expected_digest:
+        os.remove(temp_path)
+        raise SnapshotChanged(path)
+    os.replace(temp_path, path)
+
+def load_rollup(data):
+    """ Earnings aggregates saved with the snapshot, None when missing or unusable """
+    rollup = data.pop("earnings_rollup", None)
+    if not rollup:
+        return None
+    try:
+        return EarningsAggregates.from_rollup(rollup)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def verified_rollup(aggregates, earnings, archive=None):
+    """ Fall back to a rebuild if the saved rollup does not match the ledger.
+
+    Archived months count through their own saved rollups, so they are not opened.
+    """
+    archived_count = archive.unloaded_count() if archive is not None else 0
+    if aggregates is None or aggregates.count != len(earnings) + archived_count:
+        aggregates = EarningsAggregates(earnings)
+        if archive is not None:
+            for rollup in archive.unloaded_rollups():
+                aggregates.absorb(rollup)
+    return aggregates
+
+def load_numpy():
+    """ numpy for the ledger's vectorized paths, or None; imported on first use, as it nearly doubles the import time """
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as module
+        except ImportError:  # Optional; the earnings ledger falls back to plain loops
+            module = None
+        numpy = module
+    return numpy
+
+def current_month():
+    return datetime.now().strftime("%Y-%m")
+
+@traced
+def compact_journal(path, compacting_path, archive_dir=EARNINGS_ARCHIVE_DIR, journal_lock=None):
+    """ Fold a rotated journal into the snapshot, reading only what is on disk.
+
+    Earnings from before the current month move to the archive on the way.
+    Only one instance compacts at a time; if the snapshot is edited by hand
+    meanwhile, the journal is folded into the edited snapshot instead.
+    """
+    compaction_lock = FileLock(compacting_path + LOCK_SUFFIX)
+    if not compaction_lock.acquire(blocking=False):
+        compaction_lock.close()
+        return
+    try:
+        while os.path.exists(compacting_path):
+            data, digest = read_snapshot(path)
+            archive = JsonEarningsArchive(archive_dir, data)
+            aggregates = load_rollup(data)
+            replay_journal(data, compacting_path, aggregates, archive)
+            aggregates = verified_rollup(aggregates, data["earnings"], archive)
+            archive.archive_before(data, current_month())
+            data["earnings_rollup"] = aggregates.to_rollup()
+            # Encoding and fsyncing the snapshot take long on a big history, so they happen
+            # before the journal lock is taken; under it the file is only checked and moved.
+            temp_path = write_snapshot_temp(data, path)
+            stamp = snapshot_stamp(path)
+            if file_digest(path) != digest:
+                os.remove(temp_path)
+                continue
+            # The new month files only count once this snapshot, which lists them, is in place.
+            # Instances loading from disk hold the journal lock, so they see both files or neither.
+            with journal_lock or nullcontext():
+                try:
+                    install_snapshot(temp_path, path, digest, stamp)
+                except SnapshotChanged:
+                    continue
+                os.remove(compacting_path)
+    finally:
+        compaction_lock.release()
+        compaction_lock.close()
+
+
+class FileLock:
+    """ Advisory lock on a side file, held against both other instances and other threads.
+
+    Instances that ignore it (an editor, an older version) are not kept out;
+    that is what the snapshot digest check is for.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a+b')
+        self.thread_lock = threading.Lock()
+
+    def acquire(self, blocking=True):
+        if not self.thread_lock.acquire(blocking):
+            return False
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.lock_msvcrt(blocking)
+        except OSError:
+            self.thread_lock.release()
+            if blocking:
+                raise
+            return False
+        return True
+
+    def lock_msvcrt(self, blocking):
+        # LK_LOCK gives up after ten tries a second apart, so a slow compaction elsewhere
+        # would fail the caller; keep trying until LOCK_TIMEOUT instead
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            self.file.seek(0)
+            try:
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if not blocking:
+                    raise
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{self.file.name} is held by another instance") from None
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.thread_lock.release()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class MergeConflict(Exception):
+    """ A mutation that no longer applies once another instance's changes are merged in """
+
+    def __init__(self, entry, reason):
+        super().__init__(reason)
+        self.entry = entry
+        self.reason = reason
+
+
+class EarningsAggregates:
+    """ Running earnings totals, kept up to date on every insert and delete """
+
+    def __init__(self, earnings=()):
+        self.rebuild(earnings)
+
+    def rebuild(self, earnings):
+        self.total = 0.0
+        self.count = 0
+        self.by_day = {}  # "YYYY-MM-DD" -> [amount, count]
+        self.by_week = {}  # ISO week "YYYY-Www" -> [amount, count]
+        self.by_month = {}  # "YYYY-MM" -> [amount, count]
+        self.by_package = {}  # package -> [amount, count]
+        self.by_hour = {}  # "00".."23" -> [amount, count]
+        self.by_weekday = {}  # "0" (Monday).."6" -> [amount, count]
+        self.by_package_id = {}  # str(package id) -> [amount, count]
+        self.by_customer = {}  # str(customer id) -> [amount, count]
+        for earning in earnings:
+            self.add(earning)
+
+    @classmethod
+    def from_rollup(cls, rollup):
+        """ Restore the buckets persisted by to_rollup() without touching the ledger """
+        aggregates = cls.__new__(cls)
+        aggregates.total = float(rollup["total"])
+        aggregates.count = int(rollup["count"])
+        aggregates.by_day = rollup["day"]
+        aggregates.by_week = rollup["week"]
+        aggregates.by_month = rollup["month"]
+        aggregates.by_package = rollup["package"]
+        aggregates.by_hour = rollup["hour"]
+        aggregates.by_weekday = rollup["weekday"]
+        aggregates.by_package_id = rollup["package_id"]
+        aggregates.by_customer = rollup["customer"]
+        return aggregates
+
+    def to_rollup(self):
+        return {"total": self.total, "count": self.count, "day": self.by_day, "week": self.by_week,
+                "month": self.by_month, "package": self.by_package, "hour": self.by_hour,
+                "weekday": self.by_weekday, "package_id": self.by_package_id, "customer": self.by_customer}
+
+    def buckets(self, period):
+        """ The bucket dict for a to_rollup() key: "day", "week", "month", "package", "hour", "weekday",
+        "package_id" or "customer" """
+        return {"day": self.by_day, "week": self.by_week, "month": self.by_month, "package": self.by_package,
+                "hour": self.by_hour, "weekday": self.by_weekday, "package_id": self.by_package_id,
+                "customer": self.by_customer}[period]
+
+    def package_total(self, package_id):
+        return self.by_package_id.get(str(package_id), (0.0, 0))[0]
+
+    def customer_total(self, customer_id):
+        return self.by_customer.get(str(customer_id), (0.0, 0))[0]
+
+    def customer_count(self, customer_id):
+        return self.by_customer.get(str(customer_id), (0.0, 0))[1]
+
+    def add(self, earning, sign=1):
+        amount = float(earning["amount"]) * sign
+        self.total += amount
+        self.count += sign
+        date = earning["date"]
+        day = datetime.strptime(date[:10], "%Y-%m-%d")
+        year, week, _ = day.isocalendar()
+        hour = date[11:13] or None
+        package_id, customer_id = earning.get("package_id"), earning.get("customer_id")
+        for buckets, key in ((self.by_day, date[:10]), (self.by_week, f"{year}-W{week:02d}"),
+                             (self.by_month, date[:7]), (self.by_package, earning.get("package")),
+                             (self.by_hour, hour), (self.by_weekday, str(day.weekday())),
+                             (self.by_package_id, None if package_id is None else str(package_id)),
+                             (self.by_customer, None if customer_id is None else str(customer_id))):
+            if key is None:
+                continue
+            bucket = buckets.setdefault(key, [0.0, 0])
+            bucket[0] += amount
+            bucket[1] += sign
+            if bucket[1] == 0:
+                del buckets[key]
+        if self.count == 0:
+            self.total = 0.0  # Don't let float drift survive an empty ledger
+
+    def remove(self, earning):
+        self.add(earning, -1)
+
+    def absorb(self, rollup):
+        """ Add in the totals of another rollup, such as an archived month's """
+        self.total += float(rollup["total"])
+        self.count += int(rollup["count"])
+        for buckets, saved in ((self.by_day, rollup["day"]), (self.by_week, rollup["week"]),
+                               (self.by_month, rollup["month"]), (self.by_package, rollup["package"]),
+                               (self.by_hour, rollup["hour"]), (self.by_weekday, rollup["weekday"]),
+                               (self.by_package_id, rollup["package_id"]), (self.by_customer, rollup["customer"])):
+            for key, (amount, count) in saved.items():
+                bucket = buckets.setdefault(key, [0.0, 0])
+                bucket[0] += amount
+                bucket[1] += count
+
+    def apply(self, earnings, entry):
+        """ Account for a journal entry before it is applied to the earnings list """
+        op = entry["op"]
+        if op == "add":
+            self.add(entry["r"])
+        elif op == "bulk":
+            for record in entry["rs"]:
+                self.add(record)
+        elif op == "del":
+            self.remove(earnings[record_position(earnings, entry["id"])])
+        elif op == "upd":
+            earning = earnings[record_position(earnings, entry["id"])]
+            self.remove(earning)
+            self.add(dict(earning, **entry["r"]))
+        elif op == "clear":
+            self.rebuild(())
+
+    def day_total(self, day):
+        return self.by_day.get(day, (0.0, 0))[0]
+
+    def month_total(self, month):
+        return self.by_month.get(month, (0.0, 0))[0]
+
+
+EPOCH = datetime(1970, 1, 1)
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def date_stamp(text):
+    """ Seconds since the epoch for a "YYYY-MM-DD HH:MM:SS" date, read as naive wall-clock time """
+    return int((datetime.fromisoformat(text) - EPOCH).total_seconds())
+
+def stamp_date(stamp):
+    return (EPOCH + timedelta(seconds=stamp)).isoformat(" ")
+
+def month_bounds(month):
+    """ First second of a "YYYY-MM" month and of the month after it """
+    year, number = int(month[:4]), int(month[5:7])
+    following = f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+    return date_stamp(month + "-01"), date_stamp(following + "-01")
+
+
+class LedgerRecord(dict):
+    """ An earning as the tabs expect it; update() writes the change back to its ledger """
+
+    def __init__(self, ledger, fields):
+        super().__init__(fields)
+        self.ledger = ledger
+
+    def update(self, fields):
+        super().update(fields)
+        self.ledger.set_fields(self["id"], fields)
+
+
+class EarningsLedger:
+    """ The earnings list stored column-wise: ids, timestamps and amounts in typed arrays.
+
+    Indexing and iteration still produce one dict per earning, so the ledger
+    stands in for the list wherever data["earnings"] is read. Fields besides
+    the date, amount, package, package and customer ids and quantity go to a
+    sparse per-id dict. The ledger is also its own repository, since ids are
+    found by bisecting the id column.
+    """
+
+    def __init__(self, records=()):
+        self.ids = array('q')
+        self.stamps = array('q')  # Seconds since the epoch, see date_stamp()
+        self.amounts = array('d')
+        self.package_codes = array('l')  # Index into self.packages, -1 for no package
+        # Record ids and counts start at 1, so 0 stands for a field the record doesn't have
+        self.package_ids = array('q')
+        self.customer_ids = array('q')
+        self.quantities = array('l')
+        self.packages = []
+        self.package_index = {}
+        self.extras = {}  # id -> fields that have no column, or don't round-trip through one
+        self.stamps_ascending = True
+        for record in records:
+            self.append(record)
+
+    def columns(self):
+        return (self.ids, self.stamps, self.amounts, self.package_codes, self.package_ids, self.customer_ids,
+                self.quantities)
+
+    def pack(self, record):
+        """ Column values and leftover fields for one record """
+        extra = {key: value for key, value in record.items() if key not in ("id", "date", "amount", "package")}
+        counters = []
+        for key in ("package_id", "customer_id", "quantity"):
+            value = extra.get(key)
+            if type(value) is int and 0 < value < 2 ** 31:
+                counters.append(extra.pop(key))
+            else:
+                counters.append(0)
+        date = record.get("date", "")
+        try:
+            stamp = date_stamp(date)
+        except (TypeError, ValueError):
+            stamp = 0
+        # Anything but the exact DATE_FORMAT layout is kept verbatim
+        if len(date) != 19 or date[10] != " " or stamp_date(stamp) != date:
+            extra["date"] = date
+        try:
+            amount = float(record.get("amount", 0.0))
+        except (TypeError, ValueError):
+            amount = 0.0
+            extra["amount"] = record["amount"]
+        package = record.get("package")
+        if package is None:
+            code = -1
+        else:
+            code = self.package_index.get(package)
+            if code is None:
+                code = self.package_index[package] = len(self.packages)
+                self.packages.append(package)
+        return (record["id"], stamp, amount, code, *counters), extra
+
+    def insert(self, position, record):
+        values, extra = self.pack(record)
+        for column, value in zip(self.columns(), values):
+            column.insert(position, value)
+        if extra:
+            self.extras[values[0]] = extra
+        stamps = self.stamps
+        if (position and stamps[position - 1] > stamps[position]) or \
+                (position + 1 < len(stamps) and stamps[position] > stamps[position + 1]):
+            self.stamps_ascending = False
+
+    def append(self, record):
+        # New ids are the largest, but keep id order whatever arrives
+        if self.ids and record["id"] < self.ids[-1]:
+            self.insert(bisect.bisect_left(self.ids, record["id"]), record)
+            return
+        values, extra = self.pack(record)
+        if self.stamps and values[1] < self.stamps[-1]:
+            self.stamps_ascending = False
+        for column, value in zip(self.columns(), values):
+            column.append(value)
+        if extra:
+            self.extras[values[0]] = extra
+
+    def merge(self, records):
+        """ Add the records whose ids are not here yet, keeping id order; returns how many were added """
+        records = sorted((record for record in records if not self.has_id(record["id"])),
+                         key=lambda record: record["id"])
+        if not records:
+            return 0
+        if records[-1]["id"] < (self.ids[0] if self.ids else records[-1]["id"] + 1):
+            # The usual case: an older month goes in front, as whole-column concatenations
+            older = EarningsLedger()
+            older.packages, older.package_index = self.packages, self.package_index
+            for record in records:
+                older.append(record)
+            if self.stamps and older.stamps[-1] > self.stamps[0]:
+                self.stamps_ascending = False
+            self.stamps_ascending = self.stamps_ascending and older.stamps_ascending
+            for column, old_column in zip(self.columns(), older.columns()):
+                column[0:0] = old_column
+            self.extras.update(older.extras)
+        else:
+            for record in records:
+                self.append(record)
+        return len(records)
+
+    def has_id(self, record_id):
+        position = bisect.bisect_left(self.ids, record_id)
+        return position < len(self.ids) and self.ids[position] == record_id
+
+    def position(self, record_id):
+        position = bisect.bisect_left(self.ids, record_id)
+        if position < len(self.ids) and self.ids[position] == record_id:
+            return position
+        raise KeyError(record_id)
+
+    def record(self, position):
+        record_id = self.ids[position]
+        fields = {"id": record_id, "date": stamp_date(self.stamps[position]), "amount": self.amounts[position]}
+        code = self.package_codes[position]
+        if code >= 0:
+            fields["package"] = self.packages[code]
+        for key, column in (("package_id", self.package_ids), ("customer_id", self.customer_ids),
+                            ("quantity", self.quantities)):
+            if column[position]:
+                fields[key] = column[position]
+        fields.update(self.extras.get(record_id, ()))
+        return LedgerRecord(self, fields)
+
+    def set_fields(self, record_id, fields):
+        position = self.position(record_id)
+        record = dict(self.record(position), **fields)
+        for column in self.columns():
+            del column[position]
+        self.extras.pop(record_id, None)
+        self.insert(position, record)
+
+    def pop(self, position=-1):
+        record = self.record(position)
+        for column in self.columns():
+            del column[position]
+        self.extras.pop(record["id"], None)
+        return record
+
+    def clear(self):
+        for column in self.columns():
+            del column[:]
+        self.extras.clear()
+        self.stamps_ascending = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.record(index) for index in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self.record(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.record(position)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    # Repository interface; there is no natural key and nothing to index
+    def get(self, record_id):
+        try:
+            return self.record(self.position(record_id))
+        except KeyError:
+            return None
+
+    def find(self, value):
+        return []
+
+    def apply(self, entry):
+        pass
+
+    def reindex(self):
+        pass
+
+    def span(self, start, end):
+        """ Positions of the earnings stamped in [start, end), as a slice when the stamps are in order """
+        if self.stamps_ascending:
+            return slice(bisect.bisect_left(self.stamps, start), bisect.bisect_left(self.stamps, end))
+        numpy = load_numpy()
+        if numpy is not None:
+            stamps = numpy.frombuffer(self.stamps, dtype=numpy.int64)
+            return numpy.flatnonzero((stamps >= start) & (stamps < end)).tolist()
+        return [position for position, stamp in enumerate(self.stamps) if start <= stamp < end]
+
+    def positions_between(self, start, end):
+        span = self.span(start, end)
+        return list(range(span.start, span.stop)) if isinstance(span, slice) else span
+
+    def sum_between(self, start, end):
+        """ Total amount and count of the earnings stamped in [start, end) """
+        span = self.span(start, end)
+        if isinstance(span, slice):
+            numpy = load_numpy()
+            if numpy is not None:
+                amounts = numpy.frombuffer(self.amounts, dtype=numpy.float64)[span]
+                return float(amounts.sum()), len(amounts)
+            return sum(self.amounts[span]), span.stop - span.start
+        return sum(self.amounts[position] for position in span), len(span)
+
+    def breakdown(self, start, end):
+        """ Hour-of-day, weekday and package buckets ({key: [amount, count]}) for [start, end),
+        keyed like the matching EarningsAggregates buckets """
+        span = self.span(start, end)
+        numpy = load_numpy()
+        if numpy is not None:
+            stamps = numpy.frombuffer(self.stamps, dtype=numpy.int64)[span]
+            amounts = numpy.frombuffer(self.amounts, dtype=numpy.float64)[span]
+            codes = numpy.frombuffer(self.package_codes, dtype=numpy.dtype(f"i{self.package_codes.itemsize}"))[span]
+            # The epoch fell on a Thursday, weekday() 3
+            hours, weekdays = stamps % 86400 // 3600, (stamps // 86400 + 3) % 7
+            with_package = codes >= 0
+            columns = {
+                "hour": (hours, amounts, 24, lambda key: f"{key:02d}"),
+                "weekday": (weekdays, amounts, 7, str),
+                "package": (codes[with_package], amounts[with_package], len(self.packages),
+                            lambda key: self.packages[key]),
+            }
+            result = {}
+            for name, (keys, weights, size, label) in columns.items():
+                sums = numpy.bincount(keys, weights=weights, minlength=size).tolist()
+                counts = numpy.bincount(keys, minlength=size).tolist()
+                result[name] = {label(key): [sums[key], counts[key]] for key in range(size) if counts[key]}
+            return result
+        result = {"hour": {}, "weekday": {}, "package": {}}
+        positions = range(span.start, span.stop) if isinstance(span, slice) else span
+        for position in positions:
+            stamp, amount, code = self.stamps[position], self.amounts[position], self.package_codes[position]
+            keys = [("hour", f"{stamp % 86400 // 3600:02d}"), ("weekday", str((stamp // 86400 + 3) % 7))]
+            if code >= 0:
+                keys.append(("package", self.packages[code]))
+            for name, key in keys:
+                bucket = result[name].setdefault(key, [0.0, 0])
+                bucket[0] += amount
+                bucket[1] += 1
+        return result
+
+    def positions_of(self, column, value):
+        """ Positions whose package_ids or customer_ids column holds value, in id order """
+        numpy = load_numpy()
+        if numpy is not None:
+            return numpy.flatnonzero(numpy.frombuffer(column, dtype=numpy.int64) == value).tolist()
+        return [position for position, held in enumerate(column) if held == value]
+
+    def customer_history(self, customer_id):
+        """ The earnings recorded against a customer, oldest first """
+        return [self.record(position) for position in self.positions_of(self.customer_ids, customer_id)]
+
+    def daily_totals(self, start, end):
+        """ {"YYYY-MM-DD": [amount, count]} for the earnings stamped in [start, end) """
+        span = self.span(start, end)
+        totals = {}
+        numpy = load_numpy()
+        if numpy is not None:
+            stamps = numpy.frombuffer(self.stamps, dtype=numpy.int64)[span]
+            amounts = numpy.frombuffer(self.amounts, dtype=numpy.float64)[span]
+            days, inverse, counts = numpy.unique(stamps // 86400, return_inverse=True, return_counts=True)
+            sums = numpy.bincount(inverse, weights=amounts, minlength=len(days))
+            for day, amount, count in zip(days.tolist(), sums.tolist(), counts.tolist()):
+                totals[stamp_date(day * 86400)[:10]] = [amount, count]
+            return totals
+        positions = range(span.start, span.stop) if isinstance(span, slice) else span
+        for position in positions:
+            bucket = totals.setdefault(self.stamps[position] // 86400, [0.0, 0])
+            bucket[0] += self.amounts[position]
+            bucket[1] += 1
+        return {stamp_date(day * 86400)[:10]: bucket for day, bucket in totals.items()}
+
+
+class EarningsArchive:
+    """ Earnings of past months kept out of memory until a month is asked for.
+
+    This base class archives nothing; the store backends provide the storage.
+    """
+
+    def __init__(self):
+        self.loaded = set()  # Archived months already merged into data["earnings"]
+
+    def months(self):
+        return []
+
+    def read(self, month):
+        return []
+
+    def unloaded_months(self):
+        return [month for month in self.months() if month not in self.loaded]
+
+    def unloaded_count(self):
+        return 0
+
+    def unloaded_rollups(self):
+        return []
+
+    def load_into(self, data, month):
+        """ Merge an archived month into the earnings list, keeping it in id order; returns the count added """
+        if month in self.loaded:
+            return 0
+        self.loaded.add(month)
+        earnings = data["earnings"]
+        if isinstance(earnings, EarningsLedger):
+            return earnings.merge(self.read(month))
+        present = {earning["id"] for earning in earnings}
+        records = [record for record in self.read(month) if record["id"] not in present]
+        if records:
+            earnings.extend(records)
+            earnings.sort(key=lambda earning: earning["id"])
+        return len(records)
+
+    def prepare(self, data, entry):
+        """ Make sure the earning a journal entry edits is in memory """
+        if entry["op"] == "clear":
+            self.loaded.clear()
+
+    def clear(self):
+        self.loaded.clear()
+
+
+def id_runs(ids):
+    """ Sorted ids as [first, last] runs of consecutive values """
+    runs = []
+    for record_id in sorted(ids):
+        if runs and runs[-1][1] == record_id - 1:
+            runs[-1][1] = record_id
+        else:
+            runs.append([record_id, record_id])
+    return runs
+
+
+class JsonEarningsArchive(EarningsArchive):
+    """ One JSON file per past month, listed in the snapshot's "earnings_archive" index.
+
+    Each index entry names its file, the id runs it holds and its rollup, so
+    totals and counts never need the file itself.
+    """
+
+    def __init__(self, directory, data):
+        super().__init__()
+        self.directory = directory
+        self.data = data
+
+    @property
+    def index(self):
+        return self.data.get("earnings_archive", {})
+
+    def months(self):
+        return sorted(self.index)
+
+    def read(self, month):
+        entry = self.index.get(month)
+        if entry is None:
+            return []
+        path = os.path.join(self.directory, entry["file"])
+        with open(path, 'rb') as file:
+            content = file.read()
+        try:
+            records = decode_snapshot(content)
+            normalize_records("earnings", records)
+        except SnapshotInvalid as error:
+            raise SnapshotInvalid(f"{path}: {error}") from None
+        return records
+
+    def unloaded_count(self):
+        return sum(entry["rollup"]["count"] for month, entry in self.index.items() if month not in self.loaded)
+
+    def unloaded_rollups(self):
+        rollups = []
+        for month, entry in self.index.items():
+            if month not in self.loaded:
+                if entry["rollup"].keys() != EarningsAggregates().to_rollup().keys():
+                    # Saved before the rollup grew more buckets
+                    entry["rollup"] = EarningsAggregates(self.read(month)).to_rollup()
+                rollups.append(entry["rollup"])
+        return rollups
+
+    def month_of(self, record_id):
+        for month, entry in self.index.items():
+            for first, last in entry["runs"]:
+                if first <= record_id <= last:
+                    return month
+        return None
+
+    def prepare(self, data, entry):
+        super().prepare(data, entry)
+        if entry["op"] in ("upd", "del"):
+            month = self.month_of(entry["id"])
+            if month is not None:
+                self.load_into(data, month)
+
+    def write(self, month, records):
+        """ Write a month to a new file and point the index at it; the old file stays until cleanup """
+        index = self.data.setdefault("earnings_archive", {})
+        if not records:
+            index.pop(month, None)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{month}.{time.time_ns()}.{snapshot_codec.name}"
+        save_data(sorted(records, key=lambda earning: earning["id"]), os.path.join(self.directory, name))
+        index[month] = {"file": name, "runs": id_runs(record["id"] for record in records),
+                        "rollup": EarningsAggregates(records).to_rollup()}
+
+    def archive_before(self, data, month):
+        """ Move earnings dated before month out of data["earnings"] into their month files """
+        old = {}
+        live = []
+        for earning in data["earnings"]:
+            earning_month = earning["date"][:7]
+            if earning_month < month:
+                old.setdefault(earning_month, []).append(earning)
+            else:
+                live.append(earning)
+        for earning_month in sorted(set(old) | (self.loaded & set(self.index))):
+            records = old.get(earning_month, [])
+            if earning_month in self.index and earning_month not in self.loaded:
+                # Late arrivals for a month that was archived already
+                present = {record["id"] for record in records}
+                records = [record for record in self.read(earning_month) if record["id"] not in present] + records
+            self.write(earning_month, records)
+        data["earnings"][:] = live
+
+    def remove_unreferenced(self):
+        """ Delete month files no index entry points at any more """
+        referenced = {entry["file"] for entry in self.index.values()}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith(ARCHIVE_SUFFIXES) and name not in referenced:
+                os.remove(os.path.join(self.directory, name))
+
+
+class SqliteEarningsArchive(EarningsArchive):
+    """ Past months of the earnings table, read with range queries on the indexed date column """
+
+    def __init__(self, db_path, before_month, flush=None):
+        super().__init__()
+        self.db_path = db_path
+        self.before_month = before_month
+        self.flush = flush  # Lets queued writes land before a month is read
+
+    def query(self, sql, params=()):
+        import sqlite3
+
+        if self.flush is not None:
+            self.flush()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def months(self):
+        rows = self.query("SELECT DISTINCT substr(date, 1, 7) FROM earnings WHERE date < ?", (self.before_month,))
+        return sorted(row[0] for row in rows)
+
+    def read(self, month):
+        names = ", ".join(column for column, _ in SQLITE_COLUMNS["earnings"])
+        rows = self.query(f"SELECT id, {names}, extra FROM earnings WHERE date >= ? AND date < ? ORDER BY id",
+                          (month, month + "~"))
+        return [sqlite_record("earnings", row) for row in rows]
+
+    def unloaded_count(self):
+        # Only asked before any month is loaded
+        return self.query("SELECT COUNT(*) FROM earnings WHERE date < ?", (self.before_month,))[0][0]
+
+    def unloaded_rollups(self):
+        import sqlite3
+
+        names = ", ".join(column for column, _ in SQLITE_COLUMNS["earnings"])
+        aggregates = EarningsAggregates()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for row in conn.execute(f"SELECT id, {names}, extra FROM earnings WHERE date < ?", (self.before_month,)):
+                aggregates.add(sqlite_record("earnings", row))
+        finally:
+            conn.close()
+        return [aggregates.to_rollup()]
+
+
+def normalize_arabic(text):
+    """ Fold Arabic spelling variants and diacritics so searches match loosely """
+    return ARABIC_DIACRITICS.sub("", text).translate(ARABIC_FOLDS).lower()
+
+def phone_digits(text):
+    return NON_DIGITS.sub("", text.translate(ARABIC_FOLDS))
+
+
+class CustomerSearchIndex:
+    """ Word-prefix index over customer names plus a digit trie over mobile numbers.
+
+    Results are positions in data["customers"]. New customers are indexed as
+    they are added; anything that moves positions marks the index stale and
+    it is rebuilt on the next search.
+    """
+
+    def __init__(self, store):
+        self.customers = store.data["customers"]
+        self.stale = True
+        store.subscribe(self.on_store_change)
+
+    def rebuild(self):
+        self.words = []  # Sorted (normalized word, position) pairs
+        self.name_words = []  # Normalized words of each customer, by position
+        self.phones = {}  # Trie of digit -> node; "$" holds the positions ending there
+        for position, customer in enumerate(self.customers):
+            self.index_customer(position, customer, bulk=True)
+        self.words.sort()
+        self.stale = False
+
+    def index_customer(self, position, customer, bulk=False):
+        words = set(normalize_arabic(customer.get("name", "")).split())
+        self.name_words.append(words)
+        for word in words:
+            if bulk:
+                self.words.append((word, position))
+            else:
+                bisect.insort(self.words, (word, position))
+        node = self.phones
+        for digit in phone_digits(str(customer.get("mobile", ""))):
+            node = node.setdefault(digit, {})
+        node.setdefault("$", []).append(position)
+
+    def on_store_change(self, entry, position):
+        if entry["c"] != "customers" or self.stale:
+            return
+        if entry["op"] == "add":
+            self.index_customer(len(self.customers) - 1, entry["r"])
+        elif entry["op"] != "upd" or {"name", "mobile"} & entry["r"].keys():
+            self.stale = True
+
+    def search(self, text):
+        """ Sorted positions of the customers matching text, None when text is empty """
+        text = text.strip()
+        if not text:
+            return None
+        if self.stale:
+            self.rebuild()
+        digits = phone_digits(text)
+        if digits and not any(char.isalpha() for char in text):
+            return sorted(self.phone_prefix(digits))
+        prefixes = normalize_arabic(text).split()
+        if not prefixes:
+            return []  # Only tatweel or diacritics, which normalizing drops
+        # Walk only the narrowest prefix range, then check the other words per candidate
+        ranges = sorted(((self.prefix_range(prefix), prefix) for prefix in prefixes),
+                        key=lambda item: item[0][1] - item[0][0])
+        (start, end), _ = ranges[0]
+        others = [prefix for _, prefix in ranges[1:]]
+        matches = set()
+        for _, position in self.words[start:end]:
+            words = self.name_words[position]
+            if all(any(word.startswith(prefix) for word in words) for prefix in others):
+                matches.add(position)
+        return sorted(matches)
+
+    def prefix_range(self, prefix):
+        start = bisect.bisect_left(self.words, (prefix,))
+        return start, bisect.bisect_left(self.words, (prefix + "\uffff",))
+
+    def phone_prefix(self, digits):
+        node = self.phones
+        for digit in digits:
+            node = node.get(digit)
+            if node is None:
+                return []
+        found = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == "$":
+                    found.extend(child)
+                else:
+                    stack.append(child)
+        return found
+
+
+class Repository:
+    """ Id and natural-key indexes over one collection list """
+
+    def __init__(self, records, key=None):
+        self.records = records
+        self.key = key
+        self.reindex()
+
+    def reindex(self):
+        self.by_id = {record["id"]: record for record in self.records}
+        self.by_key = {}  # Natural key value -> ids, in insertion order
+        if self.key is not None:
+            for record in self.records:
+                self.by_key.setdefault(record.get(self.key), []).append(record["id"])
+
+    def get(self, record_id):
+        return self.by_id.get(record_id)
+
+    def find(self, value):
+        """ Every record whose natural key equals value """
+        return [self.by_id[record_id] for record_id in self.by_key.get(value, ())]
+
+    def apply(self, entry):
+        """ Keep the indexes in step with a journal entry, before it is applied """
+        op = entry["op"]
+        if op in ("add", "bulk"):
+            for record in entry["rs"] if op == "bulk" else (entry["r"],):
+                self.by_id[record["id"]] = record
+                if self.key is not None:
+                    self.by_key.setdefault(record.get(self.key), []).append(record["id"])
+        elif op == "del":
+            record = self.by_id.pop(entry["id"])
+            if self.key is not None:
+                self.unlink_key(record.get(self.key), entry["id"])
+        elif op == "upd":
+            if self.key is not None and self.key in entry["r"]:
+                self.unlink_key(self.by_id[entry["id"]].get(self.key), entry["id"])
+                self.by_key.setdefault(entry["r"][self.key], []).append(entry["id"])
+        elif op == "clear":
+            self.by_id.clear()
+            self.by_key.clear()
+
+    def unlink_key(self, value, record_id):
+        ids = self.by_key[value]
+        ids.remove(record_id)
+        if not ids:
+            del self.by_key[value]
+
+
+class LowStockMonitor:
+    """ Ids of the inventory components at or under their min_quantity, kept current change by change.
+
+    Only the record a mutation touched is checked again; the inventory is
+    scanned in full once, and again only when it is cleared or reloaded.
+    Components without a min_quantity are never low.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.low = set()
+        self.listeners = []
+        self.rescan()
+        store.subscribe(self.on_store_change)
+
+    def subscribe(self, listener):
+        """ Call listener() whenever the set of low components changes """
+        self.listeners.append(listener)
+
+    @staticmethod
+    def is_low(component):
+        threshold = component.get("min_quantity")
+        return threshold is not None and int(component.get("quantity", 0)) <= threshold
+
+    def rescan(self):
+        self.low = {component["id"] for component in self.store.data["inventory"] if self.is_low(component)}
+
+    def check(self, component):
+        """ Re-evaluate one component; returns whether its state flipped """
+        if self.is_low(component) == (component["id"] in self.low):
+            return False
+        self.low ^= {component["id"]}
+        return True
+
+    def on_store_change(self, entry, position):
+        if entry["c"] != "inventory":
+            return
+        op = entry["op"]
+        if op == "add":
+            changed = self.check(entry["r"])
+        elif op == "bulk":
+            changed = any([self.check(component) for component in entry["rs"]])
+        elif op == "upd":
+            changed = self.check(self.store.get("inventory", entry["id"]))
+        elif op == "del":
+            changed = entry["id"] in self.low
+            self.low.discard(entry["id"])
+        else:
+            before = self.low
+            self.rescan()
+            changed = before != self.low
+        if changed:
+            for listener in self.listeners:
+                listener()
+
+
+class DataStore:
+    """ Holds the app data in memory; subclasses decide how each mutation is persisted """
+
+    def __init__(self, data, aggregates=None, archive=None):
+        self.data = data
+        self.listeners = []
+        self.before_listeners = []
+        self.conflict_listeners = []
+        self.batch_depth = 0
+        self.deferred = {}  # collection -> [first entry, its position, changes] while batched
+        self.undo_log = None  # Inverse changes, newest last, inside all_or_nothing()
+        self.archive = archive if archive is not None else EarningsArchive()
+        data["earnings"] = EarningsLedger(data["earnings"])
+        self.repositories = {name: Repository(data[name], NATURAL_KEYS.get(name))
+                             for name in COLLECTIONS if name != "earnings"}
+        self.repositories["earnings"] = data["earnings"]
+        # At most one full pass over the earnings; from here on totals move with each mutation
+        self.aggregates = verified_rollup(aggregates, data["earnings"], self.archive)
+        self.low_stock = LowStockMonitor(self)
+
+    def subscribe(self, listener):
+        """ Call listener(entry, position) after every mutation has been applied.
+
+        position is where the record was added, updated or removed (-1 for clear).
+        """
+        self.listeners.append(listener)
+
+    def subscribe_before(self, listener):
+        """ Call listener(entry, position) just before a mutation is applied, as Qt models need.
+
+        Every such call is followed by the matching subscribe() call. Inside
+        batch() only the first change to each collection is announced, as a
+        "reset", since that is what the listeners hear once the batch ends.
+        """
+        self.before_listeners.append(listener)
+
+    def subscribe_conflicts(self, listener):
+        """ Call listener(conflict) with the MergeConflict of every mutation dropped while merging """
+        self.conflict_listeners.append(listener)
+
+    def poll(self):
+        """ Pick up changes made by other instances; stores without any have nothing to do """
+
+    def reset(self, data, aggregates=None, loaded=()):
+        """ Swap in freshly loaded data, keeping the list objects the tabs hold; listeners see "reset" """
+        for name in COLLECTIONS:
+            self.notify_before({"op": "reset", "c": name}, -1)
+        for key in [key for key in self.data if key not in COLLECTIONS and key not in data]:
+            del self.data[key]
+        self.data.update((key, value) for key, value in data.items() if key not in COLLECTIONS)
+        for name in COLLECTIONS:
+            records = self.data[name]
+            if name == "earnings":
+                records.clear()
+                records.merge(data[name])
+            else:
+                records[:] = data[name]
+            self.repositories[name].reindex()
+        self.archive.loaded = set(loaded)
+        self.aggregates = verified_rollup(aggregates, self.data["earnings"], self.archive)
+        for name in COLLECTIONS:
+            self.notify({"op": "reset", "c": name}, -1)
+
+    def get(self, collection, record_id):
+        return self.repositories[collection].get(record_id)
+
+    def find(self, collection, value):
+        return self.repositories[collection].find(value)
+
+    def load_month(self, month):
+        """ Bring an archived month of earnings into memory; listeners see a "load" entry """
+        if month in self.archive.loaded:
+            return 0
+        entry = {"op": "load", "c": "earnings", "month": month}
+        self.notify_before(entry, -1)
+        added = self.archive.load_into(self.data, month)
+        if added:
+            self.repositories["earnings"].reindex()
+        # Announced beforehand, so it is reported even when the month added nothing
+        self.notify(entry, -1)
+        return added
+
+    def load_months(self, first_month, last_month):
+        for month in self.archive.unloaded_months():
+            if first_month <= month <= last_month:
+                self.load_month(month)
+
+    def add(self, collection, record):
+        next_ids = self.data["next_ids"]
+        record["id"] = next_ids.get(collection, 1)
+        if self.commit({"op": "add", "c": collection, "r": record}) and self.undo_log is not None:
+            self.undo_log.append(lambda: self.remove(collection, record["id"]))
+        return record
+
+    def add_many(self, collection, records):
+        """ Add records as one journal entry; listeners see a single "bulk" entry, positioned at the first """
+        next_id = self.data["next_ids"].get(collection, 1)
+        for offset, record in enumerate(records):
+            record["id"] = next_id + offset
+        self.commit({"op": "bulk", "c": collection, "rs": records})
+        return records
+
+    def update(self, collection, record_id, fields):
+        current = self.get(collection, record_id) if self.undo_log is not None else None
+        previous = {key: current.get(key) for key in fields} if current is not None else None
+        if self.commit({"op": "upd", "c": collection, "id": record_id, "r": fields}) and previous is not None:
+            self.undo_log.append(lambda: self.update(collection, record_id, previous))
+
+    def remove(self, collection, record_id):
+        self.commit({"op": "del", "c": collection, "id": record_id})
+
+    def clear(self, collection):
+        self.commit({"op": "clear", "c": collection})
+
+    @traced
+    def commit(self, entry):
+        """ Persist and apply one entry; returns False if it was dropped as a conflict """
+        entry["n"] = self.data.get("journal_seq", 0) + 1
+        try:
+            self.persist(entry)
+        except MergeConflict as conflict:
+            for listener in self.conflict_listeners:
+                listener(conflict)
+            return False
+        self.apply_entry(entry)
+        return True
+
+    def apply_entry(self, entry):
+        """ Apply a persisted entry to the data, its indexes and the totals, then tell the listeners """
+        records = self.data[entry["c"]]
+        op = entry["op"]
+        if op in ("add", "bulk"):
+            position = len(records)
+        elif op == "clear":
+            position = -1
+        else:
+            position = record_position(records, entry["id"])
+        self.notify_before(entry, position)
+        if entry["c"] == "earnings":
+            self.aggregates.apply(records, entry)
+            if op == "clear":
+                self.archive.clear()
+        self.repositories[entry["c"]].apply(entry)
+        apply_mutation(self.data, entry)
+        self.notify(entry, position)
+
+    def notify_before(self, entry, position):
+        if self.batch_depth:
+            if entry["c"] in self.deferred:
+                return
+            entry, position = {"op": "reset", "c": entry["c"]}, -1
+        for listener in self.before_listeners:
+            listener(entry, position)
+
+    def notify(self, entry, position):
+        if self.batch_depth:
+            deferred = self.deferred.setdefault(entry["c"], [entry, position, 0])
+            deferred[2] += 1
+            return
+        for listener in self.listeners:
+            listener(entry, position)
+
+    @contextmanager
+    def batch(self):
+        """ Hold back listener calls until the block ends, for mutations made in bulk.
+
+        A collection changed once is then reported as usual; one changed more
+        than that gets a single "reset" entry instead of one call per change.
+        """
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                deferred, self.deferred = self.deferred, {}
+                for name, (entry, position, count) in deferred.items():
+                    if count > 1:
+                        entry, position = {"op": "reset", "c": name}, -1
+                    self.notify(entry, position)
+
+    @contextmanager
+    def all_or_nothing(self):
+        """ Keep the adds and updates made in the block only if none of them is dropped as a conflict.
+
+        Entries are persisted one by one, so on a conflict the ones already
+        written are reversed, newest first. Yields the list of conflicts,
+        which stays empty when everything was kept.
+        """
+        conflicts = []
+        self.undo_log = []
+        self.conflict_listeners.append(conflicts.append)
+        try:
+            yield conflicts
+        finally:
+            undo_log, self.undo_log = self.undo_log, None
+            self.conflict_listeners.remove(conflicts.append)
+        if conflicts:
+            for undo in reversed(undo_log):
+                undo()
+
+    def persist(self, entry):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class BackgroundWriter(threading.Thread):
+    """ Hands queued writes to sink(batch) off the UI thread, at most once per interval.
+
+    Everything submitted while the writer waits is coalesced into one batch;
+    flush() asks for an immediate write and blocks until it has happened.
+    """
+
+    def __init__(self, sink, interval=WRITE_INTERVAL, name="background-writer"):
+        super().__init__(name=name, daemon=True)
+        self.sink = sink
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.pending = []
+        self.submitted = 0
+        self.written = 0
+        self.flush_requested = False
+        self.closing = False
+        self.error = None
+        self.start()
+
+    def submit(self, item):
+        with self.condition:
+            self.pending.append(item)
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def run(self):
+        last_write = 0.0
+        while True:
+            with self.condition:
+                while not (self.pending or self.closing):
+                    self.condition.wait()
+                deadline = last_write + self.interval
+                while not (self.flush_requested or self.closing) and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                batch, self.pending = self.pending, []
+                self.flush_requested = False
+                closing = self.closing
+            if batch:
+                try:
+                    self.sink(batch)
+                    error = None
+                except Exception as exc:
+                    error = exc
+                last_write = time.monotonic()
+                with self.condition:
+                    if error is None:
+                        self.written += len(batch)
+                    else:
+                        # Keep the batch for the next attempt, in front of anything newer
+                        self.pending[:0] = batch
+                    self.error = error
+                    self.condition.notify_all()
+                if error is not None and closing:
+                    return
+            elif closing:
+                return
+
+    def flush(self):
+        with self.condition:
+            target = self.submitted
+            self.flush_requested = True
+            self.condition.notify_all()
+            while self.written < target and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class JournalStore(DataStore):
+    """ JSON snapshot plus an append-only journal holding one compact line per mutation.
+
+    Several instances may share the files. Appends happen under an advisory
+    lock, after merging in whatever the others appended since: their entries
+    are applied here first, then this entry takes the next id and sequence
+    number. An edit to a record the others deleted or just changed the same
+    fields of is dropped and reported to the conflict listeners.
+
+    Opened read_only, the files are only read: nothing is truncated, cleaned
+    up or compacted, and there is no writer thread to persist mutations.
+    """
+
+    def __init__(self, path=DATA_FILE, journal_path=JOURNAL_FILE, write_interval=WRITE_INTERVAL,
+                 archive_dir=EARNINGS_ARCHIVE_DIR, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.journal_path = journal_path
+        self.compacting_path = journal_path + COMPACTING_SUFFIX
+        self.archive_dir = archive_dir
+        self.compactor = None
+        self.lock = FileLock(journal_path + LOCK_SUFFIX)
+        self.merged = {}  # (collection, id) -> fields other instances changed, during one persist()
+
+        with self.lock:
+            data, aggregates, archive = self.load()
+            super().__init__(data, aggregates, archive)
+        if read_only:
+            self.writer = None
+            return
+        self.writer = BackgroundWriter(self.write_lines, write_interval, name="journal-writer")
+
+        # A compaction interrupted by a crash is picked up again, and past months get archived
+        stamps = self.data["earnings"].stamps
+        if os.path.exists(self.compacting_path) or (stamps and min(stamps) < month_bounds(current_month())[0]):
+            self.start_compaction()
+
+    @traced
+    def load(self):
+        """ Snapshot plus journals as on disk, cutting off a line torn by a crash; needs self.lock """
+        data = load_snapshot(self.path)
+        archive = JsonEarningsArchive(self.archive_dir, data)
+        # Month files left by compactions that never got their snapshot written, or replaced since,
+        # unless another instance is compacting and about to list its new files
+        if not self.read_only:
+            compaction_lock = FileLock(self.compacting_path + LOCK_SUFFIX)
+            if compaction_lock.acquire(blocking=False):
+                archive.remove_unreferenced()
+                compaction_lock.release()
+            compaction_lock.close()
+        aggregates = load_rollup(data)
+        replay_journal(data, self.compacting_path, aggregates, archive)
+        self.journal_entries, end = replay_journal(data, self.journal_path, aggregates, archive)
+        if self.read_only:
+            self.journal_inode = os.stat(self.journal_path).st_ino if os.path.exists(self.journal_path) else None
+            self.journal_offset = end
+            return data, aggregates, archive
+        with open(self.journal_path, 'ab') as journal:
+            if journal.tell() > end:
+                journal.truncate(end)
+        self.journal_inode = os.stat(self.journal_path).st_ino
+        self.journal_offset = end
+        return data, aggregates, archive
+
+    def persist(self, entry):
+        if self.read_only:
+            raise MergeConflict(entry, "البيانات مفتوحة للقراءة فقط")
+        try:
+            with self.lock:
+                self.merged = {}
+                self.sync()
+                self.rebase(entry)
+                line = encode_json(entry) + b"\n"
+                with open(self.journal_path, 'ab') as journal:
+                    journal.write(line)
+                self.journal_offset += len(line)
+                self.journal_entries += 1
+        except TimeoutError:
+            raise MergeConflict(entry, "ملفات البيانات مقفلة من نسخة أخرى من البرنامج") from None
+        # The line is in the file already; the writer only makes it durable, one fsync per batch
+        self.writer.submit(entry["n"])
+
+    def rebase(self, entry):
+        """ Renumber an entry made before the merge, or refuse it if the merge made it stale """
+        entry["n"] = self.data.get("journal_seq", 0) + 1
+        op = entry["op"]
+        collection = entry["c"]
+        if op == "add":
+            entry["r"]["id"] = self.data["next_ids"].get(collection, 1)
+        elif op == "bulk":
+            next_id = self.data["next_ids"].get(collection, 1)
+            for offset, record in enumerate(entry["rs"]):
+                record["id"] = next_id + offset
+        elif op in ("upd", "del"):
+            if self.get(collection, entry["id"]) is None:
+                raise MergeConflict(entry, "حذفت نسخة أخرى من البرنامج هذا السجل")
+            changed = self.merged.get((collection, entry["id"]), set())
+            if op == "upd" and changed & entry["r"].keys():
+                raise MergeConflict(entry, "عدّلت نسخة أخرى من البرنامج نفس البيانات")
+
+    def sync(self):
+        """ Apply what other instances journaled since we last looked; needs self.lock """
+        status = os.stat(self.journal_path) if os.path.exists(self.journal_path) else None
+        if status is not None and status.st_ino == self.journal_inode:
+            if status.st_size > self.journal_offset:
+                self.journal_offset = self.read_journal(self.journal_path, self.journal_offset)
+            return
+        # Another instance rotated the journal; the rest of ours is gone if it was compacted already
+        if os.path.exists(self.compacting_path) and os.stat(self.compacting_path).st_ino == self.journal_inode:
+            self.read_journal(self.compacting_path, self.journal_offset)
+            open(self.journal_path, 'ab').close()
+            self.journal_inode = os.stat(self.journal_path).st_ino
+            self.journal_offset = self.read_journal(self.journal_path, 0)
+        else:
+            self.reload()
+
+    def read_journal(self, path, offset):
+        """ Apply the entries after offset that are newer than ours; returns the offset read up to """
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = decode_json(line)
+                except ValueError:
+                    break
+                offset += len(line)
+                if entry["n"] <= self.data.get("journal_seq", 0):
+                    continue
+                if entry["c"] == "earnings" and entry["op"] in ("upd", "del") and \
+                        not self.data["earnings"].has_id(entry["id"]):
+                    month = self.archive.month_of(entry["id"])
+                    if month is not None:
+                        self.load_month(month)
+                self.apply_entry(entry)
+                self.journal_entries += 1
+                if entry["op"] in ("upd", "del"):
+                    self.merged.setdefault((entry["c"], entry["id"]), set()).update(entry.get("r", ()))
+                    if entry["op"] == "del":
+                        self.merged[(entry["c"], entry["id"])].add("id")
+        return offset
+
+    def reload(self):
+        """ Start over from disk, after another instance compacted entries we never read; needs self.lock """
+        data, aggregates, archive = self.load()
+        self.reset(data, aggregates, archive.loaded)
+
+    def poll(self):
+        try:
+            with self.lock:
+                self.merged = {}
+                self.sync()
+        except TimeoutError:
+            pass  # Another instance holds the files for now; the next poll catches up
+
+    @traced
+    def write_lines(self, numbers):
+        # Runs on the writer thread, without the lock so appends go on during the fsync.
+        # A rotation in between is harmless: start_compaction() fsyncs the journal it
+        # renames, and a descriptor opened before the rename still syncs the same file.
+        # On Windows the rename waits for this descriptor to close, see rotate_journal().
+        with open(self.journal_path, 'ab') as journal:
+            os.fsync(journal.fileno())
+        if self.journal_entries >= COMPACT_THRESHOLD:
+            self.start_compaction()
+
+    def start_compaction(self):
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        # Rotate the journal so new mutations never wait on the snapshot write
+        with self.lock:
+            if not os.path.exists(self.compacting_path):
+                with open(self.journal_path, 'ab') as journal:
+                    os.fsync(journal.fileno())
+                    caught_up = journal.tell() == self.journal_offset
+                if not self.rotate_journal():
+                    return  # Still open elsewhere; the next batch written tries again
+                open(self.journal_path, 'ab').close()
+                # This may run on the writer thread, so entries of other instances not read yet are
+                # left for the next sync(), which finds them in the compacting file
+                if caught_up:
+                    self.journal_inode = os.stat(self.journal_path).st_ino
+                    self.journal_offset = 0
+                self.journal_entries = 0
+        self.compactor = threading.Thread(target=compact_journal,
+                                          args=(self.path, self.compacting_path, self.archive_dir, self.lock),
+                                          name="journal-compactor")
+        self.compactor.start()
+
+    def rotate_journal(self):
+        """ Rename the journal to the compacting file; returns False if it stayed open elsewhere.
+
+        Another instance's writer fsyncs the journal without the lock, and on
+        Windows a file open in another process cannot be renamed, so this
+        waits a little for that fsync to finish.
+        """
+        for _ in range(ROTATE_ATTEMPTS):
+            try:
+                os.replace(self.journal_path, self.compacting_path)
+                return True
+            except PermissionError:
+                time.sleep(0.02)
+        return False
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.compactor is not None:
+            self.compactor.join()
+        self.lock.close()
+
+
+def sqlite_record(collection, row):
+    """ Turn a (id, columns..., extra) row back into the dict the tabs expect """
+    record = {"id": row[0]}
+    for (column, _), value in zip(SQLITE_COLUMNS[collection], row[1:-1]):
+        if value is not None:
+            record[column] = value
+    if row[-1]:
+        record.update(json.loads(row[-1]))
+    return record
+
+def sqlite_row(collection, record):
+    """ Split a record into id, its indexed columns and a JSON blob for any other field """
+    columns = [column for column, _ in SQLITE_COLUMNS[collection]]
+    extra = {key: value for key, value in record.items() if key not in columns and key != "id"}
+    values = [record["id"]] + [record.get(column) for column in columns]
+    values.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return values
+
+def create_sqlite_schema(conn):
+    for collection, columns in SQLITE_COLUMNS.items():
+        definition = ", ".join(f"{column} {kind}" for column, kind in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {collection} (id INTEGER PRIMARY KEY, {definition}, extra TEXT)")
+        # Databases created before a column was added get it empty
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({collection})")}
+        for column, kind in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {collection} ADD COLUMN {column} {kind}")
+    for collection, column in SQLITE_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{collection}_{column} ON {collection} ({column})")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+def import_json_to_sqlite(db_path, json_path=DATA_FILE, journal_path=JOURNAL_FILE):
+    """ One-shot import of the JSON snapshot and journal into a SQLite database """
+    import sqlite3
+
+    data = load_data(json_path, journal_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        create_sqlite_schema(conn)
+        for collection, columns in SQLITE_COLUMNS.items():
+            names = ", ".join(column for column, _ in columns)
+            placeholders = ", ".join("?" * (len(columns) + 2))
+            conn.executemany(f"INSERT INTO {collection} (id, {names}, extra) VALUES ({placeholders})",
+                             (sqlite_row(collection, record) for record in data[collection]))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_ids', ?)", (json.dumps(data["next_ids"]),))
+    conn.close()
+
+
+class SqliteStore(DataStore):
+    """ One indexed SQLite table per collection; each mutation becomes a single statement.
+
+    Opened read_only, the database is opened with mode=ro and has no writer thread.
+    """
+
+    @traced
+    def __init__(self, db_path=SQLITE_DATABASE, write_interval=WRITE_INTERVAL, read_only=False):
+        import sqlite3
+
+        self.db_path = db_path
+        self.read_only = read_only
+        self.writer_conn = None
+        if read_only:
+            from urllib.request import pathname2url
+
+            conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True)
+        else:
+            if not os.path.exists(db_path) and os.path.exists(DATA_FILE):
+                import_json_to_sqlite(db_path)
+            conn = sqlite3.connect(db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                create_sqlite_schema(conn)
+
+        # The table's INTEGER PRIMARY KEY is the record id; past months of earnings stay on disk.
+        # Next ids are kept in the meta table, as the JSON store keeps them in its snapshot, so the
+        # id of a deleted record is never handed out again; MAX(id) only covers databases without them.
+        month = current_month()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'next_ids'").fetchone()
+        saved_ids = json.loads(row[0]) if row else {}
+        data = {"next_ids": {}}
+        for collection, columns in SQLITE_COLUMNS.items():
+            names = ", ".join(column for column, _ in columns)
+            if collection == "earnings":
+                rows = conn.execute(f"SELECT id, {names}, extra FROM earnings WHERE date >= ? ORDER BY id", (month,))
+            else:
+                rows = conn.execute(f"SELECT id, {names}, extra FROM {collection} ORDER BY id")
+            data[collection] = [sqlite_record(collection, row) for row in rows]
+            largest = conn.execute(f"SELECT MAX(id) FROM {collection}").fetchone()[0] or 0
+            data["next_ids"][collection] = max(largest + 1, saved_ids.get(collection, 1))
+        assign_ids(data)
+
+        # The rollup saved on close is only trusted if the earnings table still holds what it did
+        aggregates = None
+        row = conn.execute("SELECT value FROM meta WHERE key = 'earnings_rollup'").fetchone()
+        if row:
+            saved = json.loads(row[0])
+            if saved.get("next_id") == data["next_ids"]["earnings"]:
+                aggregates = load_rollup(saved)
+        conn.close()
+        super().__init__(data, aggregates, SqliteEarningsArchive(db_path, month))
+        if read_only:
+            self.writer = None
+            return
+        self.writer = BackgroundWriter(self.execute_statements, write_interval, name="sqlite-writer")
+        self.archive.flush = self.flush
+
+    def persist(self, entry):
+        if self.read_only:
+            raise MergeConflict(entry, "البيانات مفتوحة للقراءة فقط")
+        # The statement is built now, against the data as it is before the entry is applied
+        collection = entry["c"]
+        columns = [column for column, _ in SQLITE_COLUMNS[collection]]
+        op = entry["op"]
+        if op in ("upd", "del") and self.get(collection, entry["id"]) is None:
+            # Removed first by another terminal of the same data server
+            raise MergeConflict(entry, "حذف جهاز آخر هذا السجل")
+        if op in ("add", "bulk"):
+            placeholders = ", ".join("?" * (len(columns) + 2))
+            records = entry["rs"] if op == "bulk" else (entry["r"],)
+            for record in records:
+                self.writer.submit((f"INSERT INTO {collection} (id, {', '.join(columns)}, extra) VALUES ({placeholders})",
+                                    sqlite_row(collection, record)))
+            # Written along with the insert, so a restart never hands these ids out again
+            next_ids = dict(self.data["next_ids"], **{collection: records[-1]["id"] + 1})
+            self.writer.submit(("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_ids', ?)",
+                                (json.dumps(next_ids),)))
+        elif op == "upd":
+            record = dict(self.get(collection, entry["id"]), **entry["r"])
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            values = sqlite_row(collection, record)
+            self.writer.submit((f"UPDATE {collection} SET {assignments}, extra = ? WHERE id = ?",
+                                values[1:] + values[:1]))
+        elif op == "del":
+            self.writer.submit((f"DELETE FROM {collection} WHERE id = ?", (entry["id"],)))
+        elif op == "clear":
+            self.writer.submit((f"DELETE FROM {collection}", ()))
+
+    @traced
+    def execute_statements(self, statements):
+        # Runs on the writer thread with its own connection; one transaction per batch
+        if self.writer_conn is None:
+            import sqlite3
+
+            self.writer_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.writer_conn.execute("PRAGMA synchronous=NORMAL")
+        with self.writer_conn:
+            for sql, params in statements:
+                self.writer_conn.execute(sql, params)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer is None:
+            return
+        saved = {"earnings_rollup": self.aggregates.to_rollup(), "next_id": self.data["next_ids"]["earnings"]}
+        self.writer.submit(("INSERT OR REPLACE INTO meta (key, value) VALUES ('earnings_rollup', ?)",
+                            (json.dumps(saved, ensure_ascii=False),)))
+        self.writer.close()
+        if self.writer_conn is not None:
+            self.writer_conn.close()
+
+
+def parse_address(address):
+    """ (host, port) for "host:port", otherwise the address as a Unix socket path """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+def send_message(stream, message):
+    stream.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class StoreServer:
+    """ Owns the store on behalf of every terminal, over newline-delimited JSON.
+
+    Requests are handled one at a time on the event loop, so mutations from
+    different terminals are applied and journaled in arrival order. Each
+    applied entry goes to every terminal, the sender included, before the
+    sender gets its reply.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.clients = set()  # Stream writers of terminals past their hello
+        self.committed = []
+        self.conflicts = []
+        store.subscribe(self.on_store_change)
+        store.subscribe_conflicts(self.conflicts.append)
+
+    def on_store_change(self, entry, position):
+        if entry["op"] in ("add", "bulk", "upd", "del", "clear"):
+            self.committed.append(entry)
+
+    def snapshot(self):
+        """ Everything but the earnings of past months, which terminals read a month at a time """
+        data = self.store.data
+        month = current_month()
+        earnings = data["earnings"]
+        snapshot = {name: data[name] for name in COLLECTIONS if name != "earnings"}
+        snapshot["earnings"] = [earnings.record(position)
+                                for position in earnings.positions_between(month_bounds(month)[0], 2 ** 62)]
+        snapshot["next_ids"] = data["next_ids"]
+        snapshot["journal_seq"] = data.get("journal_seq", 0)
+        months = {key: count for key, (amount, count) in self.store.aggregates.by_month.items() if key < month}
+        return {"data": snapshot, "rollup": self.store.aggregates.to_rollup(), "months": months}
+
+    def handle_request(self, request):
+        op = request["op"]
+        if op == "hello":
+            return self.snapshot()
+        if op == "read":
+            self.store.load_month(request["month"])
+            earnings = self.store.data["earnings"]
+            start, end = month_bounds(request["month"])
+            return {"records": [earnings.record(position) for position in earnings.positions_between(start, end)]}
+        collection = request["c"]
+        old = None
+        try:
+            if op in ("upd", "del") and collection == "earnings":
+                # Sent along so terminals that never loaded an archived earning can still apply the change
+                old = self.store.get(collection, request["id"])
+            if op == "add":
+                self.store.add(collection, request["r"])
+            elif op == "bulk":
+                self.store.add_many(collection, request["rs"])
+            elif op == "upd":
+                self.store.update(collection, request["id"], request["r"])
+            elif op == "del":
+                self.store.remove(collection, request["id"])
+            elif op == "clear":
+                self.store.clear(collection)
+            else:
+                return {"error": f"unknown request {op}"}
+        except KeyError:
+            # Another terminal removed the record first
+            return {"error": "missing record"}
+        if self.conflicts:
+            # Dropped while merging with another instance sharing the files
+            conflict = self.conflicts.pop()
+            self.broadcast()
+            return {"error": conflict.reason}
+        entry = self.committed[-1]
+        if old is not None:
+            self.committed[-1] = dict(entry, old=old)
+        self.broadcast()
+        first = entry["rs"][0] if entry["op"] == "bulk" else entry.get("r", {})
+        return {"n": entry["n"], "id": entry.get("id", first.get("id"))}
+
+    def broadcast(self):
+        """ Send every applied entry to the terminals, including those merged in from other instances """
+        for entry in self.committed:
+            for client in self.clients:
+                send_message(client, {"event": entry})
+        self.committed = []
+
+    async def poll_store(self):
+        import asyncio
+
+        while True:
+            await asyncio.sleep(JOURNAL_POLL_MS / 1000)
+            self.store.poll()
+            self.broadcast()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    # A malformed or torn line fails only its own request, like a store error
+                    request = json.loads(line)
+                    reply = self.handle_request(request)
+                    if request["op"] == "hello":
+                        self.clients.add(writer)
+                except Exception as error:
+                    # One bad request must not cost the terminal its connection
+                    import traceback
+
+                    traceback.print_exc()
+                    self.broadcast()
+                    reply = {"error": f"{type(error).__name__}: {error}"}
+                send_message(writer, {"reply": reply})
+                await writer.drain()
+        except (ConnectionError, ValueError):  # ValueError: a line longer than the stream's limit
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def run(self, address):
+        import asyncio
+
+        target = parse_address(address)
+        if isinstance(target, tuple):
+            server = await asyncio.start_server(self.handle_client, *target)
+        else:
+            server = await asyncio.start_unix_server(self.handle_client, target)
+        async with server:
+            poller = asyncio.ensure_future(self.poll_store())
+            try:
+                await server.serve_forever()
+            finally:
+                poller.cancel()
+
+
+def serve(config, address=None):
+    """ Run the data server until interrupted; terminals point their "server" config key at it """
+    import asyncio
+
+    store = open_store(dict(config, server=None))
+    address = address or config["server"] or SERVER_ADDRESS
+    print(f"serving {type(store).__name__} on {address}")
+    try:
+        asyncio.run(StoreServer(store).run(address))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+class RemoteEarningsArchive(EarningsArchive):
+    """ Past months held by the server, fetched when a month is asked for """
+
+    def __init__(self, store, counts):
+        super().__init__()
+        self.store = store
+        self.counts = counts  # "YYYY-MM" -> earnings the server holds for it
+
+    def months(self):
+        return sorted(self.counts)
+
+    def read(self, month):
+        return self.store.request({"op": "read", "month": month})["records"]
+
+    def unloaded_count(self):
+        return sum(count for month, count in self.counts.items() if month not in self.loaded)
+
+    def unloaded_rollups(self):
+        return [EarningsAggregates(self.read(month)).to_rollup() for month in self.unloaded_months()]
+
+
+class RemoteStore(DataStore):
+    """ A terminal working on the data owned by a --serve process.
+
+    Mutations are sent to the server and only applied here as the server
+    broadcasts them, so every terminal sees the same entries in the same
+    order. Changes from other terminals wait in the socket until poll().
+    """
+
+    def __init__(self, address):
+        import socket
+
+        target = parse_address(address)
+        if isinstance(target, tuple):
+            self.socket = socket.create_connection(target)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX)
+            self.socket.connect(target)
+        self.buffer = b""
+        self.pending = []  # Broadcast entries received but not applied yet
+        hello = self.request({"op": "hello"})
+        super().__init__(hello["data"], load_rollup({"earnings_rollup": hello["rollup"]}),
+                         RemoteEarningsArchive(self, hello["months"]))
+        self.apply_pending()
+
+    def receive(self, blocking):
+        """ Messages from the complete lines read by one recv(), [] if nothing is waiting """
+        self.socket.setblocking(blocking)
+        try:
+            chunk = self.socket.recv(65536)
+        except BlockingIOError:
+            return []
+        finally:
+            self.socket.setblocking(True)
+        if not chunk:
+            raise ConnectionError("the data server closed the connection")
+        *lines, self.buffer = (self.buffer + chunk).split(b"\n")
+        return [json.loads(line) for line in lines]
+
+    def request(self, message):
+        """ Send a request and wait for its reply; broadcasts met on the way are queued in order """
+        self.socket.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        reply = None
+        while reply is None:
+            for received in self.receive(blocking=True):
+                if "event" in received:
+                    self.pending.append(received["event"])
+                else:
+                    reply = received["reply"]
+        return reply
+
+    def apply_pending(self):
+        while self.pending:
+            self.apply_entry(self.pending.pop(0))
+
+    def apply_entry(self, entry):
+        old = entry.pop("old", None)
+        if old is not None and not self.data["earnings"].has_id(old["id"]):
+            # An archived earning this terminal never loaded; the tables hear of it like a loaded month
+            loaded = {"op": "load", "c": "earnings"}
+            self.notify_before(loaded, -1)
+            self.data["earnings"].merge([old])
+            self.notify(loaded, -1)
+        super().apply_entry(entry)
+
+    def poll(self):
+        """ Apply whatever other terminals changed since the last call """
+        self.pending.extend(received["event"] for received in self.receive(blocking=False))
+        self.apply_pending()
+
+    @traced
+    def commit(self, entry):
+        try:
+            reply = self.request(entry)
+        except OSError:
+            # The server is gone; like a change dropped while merging, this one was not saved
+            for listener in self.conflict_listeners:
+                listener(MergeConflict(entry, "انقطع الاتصال بخادم البيانات"))
+            return False
+        if "error" not in reply and entry["op"] == "add":
+            entry["r"]["id"] = reply["id"]
+        elif "error" not in reply and entry["op"] == "bulk":
+            for offset, record in enumerate(entry["rs"]):
+                record["id"] = reply["id"] + offset
+        # A change to a record another terminal removed first is dropped; its removal is in pending
+        self.apply_pending()
+        if "error" in reply:
+            for listener in self.conflict_listeners:
+                listener(MergeConflict(entry, reply["error"]))
+            return False
+        return True
+
+    def load_month(self, month):
+        added = super().load_month(month)
+        self.apply_pending()
+        return added
+
+    def close(self):
+        self.socket.close()
+
+
+def load_config(path=CONFIG_FILE):
+    """ Read barbershop_config.json on top of the defaults """
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            config.update(json.load(file))
     except (FileNotFoundError, json.JSONDecodeError):
-        return {
-            "packages": [], "inventory": [], "earnings": [], 
-            "customers": [], "monthly_earnings": [], "expenses": []  # Include expenses
-        }
+        pass
+    return config
+
+@traced
+def open_store(config, read_only=False):
+    """ Connect to the "server" config key if set, otherwise open the backend named by "storage".
+
+    read_only is for readers such as the receipts export: a local store then
+    writes nothing, compacts nothing and starts no writer thread.
+    """
+    use_snapshot_format(config["snapshot_format"])
+    if config["server"]:
+        return RemoteStore(config["server"])
+    if config["storage"] == "sqlite":
+        return SqliteStore(config["database"], config["write_interval"], read_only=read_only)
+    return JournalStore(write_interval=config["write_interval"], read_only=read_only)
+
+
+# How a table shows one record field; parse is set for columns the user may edit
+TableColumn = namedtuple("TableColumn", "title key text parse default", defaults=(str, None, ""))
+
+
+class RecordTableModel(QAbstractTableModel):
+    """ Table model reading straight from one of the store's collections """
+
+    edit_rejected = pyqtSignal(int, int)
+
+    def __init__(self, store, collection, columns, font=None, highlight=None):
+        super().__init__()
+        self.store = store
+        self.collection = collection
+        self.records = store.data[collection]
+        self.columns = columns
+        self.font = font
+        self.highlight = highlight  # highlight(record) -> background QColor of its row, or None
+        self.rows = None  # Record positions shown while filtered, None shows every record
+        self.pending = None  # The end*() call owed for a begin*() made before the store changed
+        store.subscribe_before(self.before_store_change)
+        store.subscribe(self.on_store_change)
+
+    @traced
+    def set_filter(self, rows):
+        """ Show only the given record positions; whoever filters re-applies it after changes """
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def source_row(self, row):
+        return row if self.rows is None else self.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.records) if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section].title
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        column = self.columns[index.column()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column.key is None:
+                return None
+            return column.text(self.record(index.row()).get(column.key, column.default))
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        if role == Qt.FontRole:
+            return self.font
+        if role == Qt.BackgroundRole and self.highlight is not None:
+            return self.highlight(self.record(index.row()))
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self.columns[index.column()].parse is not None:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        column = self.columns[index.column()]
+        if role != Qt.EditRole or column.parse is None:
+            return False
+        try:
+            value = column.parse(value)
+        except ValueError:
+            self.edit_rejected.emit(index.row(), index.column())
+            return False
+        record = self.record(index.row())
+        if value != record.get(column.key):
+            self.store.update(self.collection, record["id"], {column.key: value})
+        return True
+
+    def record(self, row):
+        return self.records[self.source_row(row)]
+
+    def refresh_column(self, column):
+        """ Repaint a column whose text does not come from the record alone, such as a running total """
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0, column), self.index(self.rowCount() - 1, column))
+
+    def before_store_change(self, entry, position):
+        if entry["c"] != self.collection or self.rows is not None:
+            return
+        op = entry["op"]
+        if op == "add":
+            self.beginInsertRows(QModelIndex(), position, position)
+            self.pending = self.endInsertRows
+        elif op == "bulk":
+            self.beginInsertRows(QModelIndex(), position, position + len(entry["rs"]) - 1)
+            self.pending = self.endInsertRows
+        elif op == "del":
+            self.beginRemoveRows(QModelIndex(), position, position)
+            self.pending = self.endRemoveRows
+        elif op != "upd":
+            self.beginResetModel()
+            self.pending = self.endResetModel
+
+    def on_store_change(self, entry, position):
+        if entry["c"] != self.collection:
+            return
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending()
+        elif entry["op"] == "upd" and self.rows is None:
+            self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.columns) - 1))
+
+
+class RollupTableModel(QAbstractTableModel):
+    """ Earnings per month, week or day, read from the store's running aggregates """
+
+    HEADERS = ["الفترة", "الربح المحسوب", "عدد العمليات", "الربح المسجل يدويًا"]
+
+    def __init__(self, store, period="month"):
+        super().__init__()
+        self.store = store
+        self.period = period
+        self.keys = []
+        self.rows = {}
+        self.reload()
+        store.subscribe(self.on_store_change)
+
+    def set_period(self, period):
+        self.period = period
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self.keys = sorted(self.store.aggregates.buckets(self.period), reverse=True)
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        key = self.keys[index.row()]
+        if role == Qt.DisplayRole:
+            column = index.column()
+            if column == 0:
+                return self.period_title(key)
+            amount, count = self.store.aggregates.buckets(self.period).get(key, (0.0, 0))
+            if column == 1:
+                return f"{amount:.2f}"
+            if column == 2:
+                return str(count)
+            if self.period == "month":
+                manual = manual_month_total(self.store.data, key)
+                return str(manual) if manual is not None else ""
+            return ""
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def period_title(self, key):
+        if self.period == "month":
+            return f"{ARABIC_MONTHS[int(key[5:7]) - 1]} {key[:4]}"
+        return key
+
+    def on_store_change(self, entry, position):
+        if entry["c"] == "monthly_earnings" and self.period == "month":
+            self.dataChanged.emit(self.index(0, 3), self.index(len(self.keys) - 1, 3))
+            return
+        if entry["c"] != "earnings" or entry["op"] == "load":
+            return
+        if entry["op"] == "add":
+            date = entry["r"]["date"]
+            if self.period == "month":
+                key = date[:7]
+            elif self.period == "day":
+                key = date[:10]
+            else:
+                year, week, _ = datetime.strptime(date[:10], "%Y-%m-%d").isocalendar()
+                key = f"{year}-W{week:02d}"
+            row = self.rows.get(key)
+            if row is not None:
+                self.dataChanged.emit(self.index(row, 1), self.index(row, 2))
+                return
+        self.reload()
+
+
+class StepperDelegate(QStyledItemDelegate):
+    """ Paints a +/- pair in every cell of its column and reports clicks as stepped(row, change) """
+    stepped = pyqtSignal(int, int)
+
+    BUTTON_SIZE = 40
+    SPACING = 5
+    BUTTONS = ((1, "+", "#4CAF50"), (-1, "-", "#f44336"))
+
+    def button_rects(self, option):
+        # Laid out like the QHBoxLayout it replaces: "+" first, mirrored for right-to-left
+        size = self.BUTTON_SIZE
+        rect = option.rect
+        left = rect.center().x() - size - self.SPACING // 2
+        top = rect.center().y() - size // 2
+        rects = [QRect(left, top, size, size), QRect(left + size + self.SPACING, top, size, size)]
+        if option.direction == Qt.RightToLeft:
+            rects.reverse()
+        return [(change, text, color, button) for (change, text, color), button in zip(self.BUTTONS, rects)]
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        font = QFont(option.font)
+        font.setBold(True)
+        painter.setFont(font)
+        painter.setPen(Qt.NoPen)
+        for _, _, color, button in self.button_rects(option):
+            painter.setBrush(QColor(color))
+            painter.drawRoundedRect(button, 5, 5)
+        painter.setPen(Qt.white)
+        for _, text, _, button in self.button_rects(option):
+            painter.drawText(button, Qt.AlignCenter, text)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(2 * self.BUTTON_SIZE + self.SPACING, self.BUTTON_SIZE)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() not in (QEvent.MouseButtonPress, QEvent.MouseButtonRelease, QEvent.MouseButtonDblClick):
+            return False
+        for change, _, _, button in self.button_rects(option):
+            if button.contains(event.pos()):
+                # Presses are swallowed so a click on a button does not move the selection
+                if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+                    self.stepped.emit(index.row(), change)
+                return True
+        return False
+
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+
+class ReceiptRenderer:
+    """ Draws receipts with the logo, fonts and header layout prepared once per paper size """
+
+    TITLE = "Beko Barber"
+    LOGO_SIZE = 100
+    CONTENT_TOP = 170
+    LINE_HEIGHT = 30
+    LINE_SPACING = 35  # Line height plus padding so Arabic text is not cut
+
+    def __init__(self, logo_path="beko.ico"):
+        self.logo = QIcon(resource_path(logo_path)).pixmap(self.LOGO_SIZE, self.LOGO_SIZE)
+        self.title_font = QFont("Arial", 18, QFont.Bold)
+        self.content_font = QFont("Arial", 10)
+        self.headers = {}
+
+    def header(self, painter, page_width):
+        """ Logo and title positions for a page width, measured with the device's font metrics """
+        key = (page_width, painter.device().logicalDpiX())
+        if key not in self.headers:
+            painter.setFont(self.title_font)
+            title_x = (page_width - painter.fontMetrics().width(self.TITLE)) // 2
+            self.headers[key] = ((page_width - self.logo.width()) // 2, title_x)
+        return self.headers[key]
+
+    def paint(self, painter, page_width, message):
+        logo_x, title_x = self.header(painter, page_width)
+        painter.drawPixmap(logo_x, 10, self.logo)
+        painter.setFont(self.title_font)
+        painter.drawText(title_x, 130, self.TITLE)
+
+        # Only the sale lines change from one receipt to the next
+        painter.setFont(self.content_font)
+        y = self.CONTENT_TOP
+        for line in message.split('\n'):
+            rect = QRect(10, y, page_width - 20, self.LINE_HEIGHT)
+            painter.drawText(rect, Qt.AlignRight | Qt.AlignVCenter, line)
+            y += self.LINE_SPACING
+
+    def render(self, printer, message):
+        return self.render_pages(printer, [message]) == 1
+
+    def render_pages(self, printer, messages):
+        """ Paint each message on its own page of one print job; returns the number of pages """
+        painter = QPainter()
+        if not painter.begin(printer):
+            return 0
+        pages = 0
+        for message in messages:
+            if pages:
+                printer.newPage()
+            self.paint(painter, printer.pageRect().width(), message)
+            pages += 1
+        painter.end()
+        return pages
+
+
+def receipt_message(price, description, date=None):
+    """ Text of a checkout receipt; the date is added for receipts reprinted later """
+    lines = [f"السعر: {price}", f"الباقة: {description}", "صالون بيكو تشرف بوجود حضراتكم"]
+    if date is not None:
+        lines.insert(0, f"التاريخ: {date}")
+    return "\n\n".join(lines)
+
+
+def daily_summary_message(day, earnings):
+    """ End-of-day page: number of sales, total and the split by package """
+    aggregates = EarningsAggregates(earnings)
+    lines = [f"ملخص يوم {day}", f"عدد العمليات: {aggregates.count}", f"الإجمالي: {aggregates.total:.2f}"]
+    for package, (amount, count) in sorted(aggregates.by_package.items()):
+        lines.append(f"{package}: {amount:.2f} ({count})")
+    return "\n\n".join(lines)
+
+
+def earnings_by_day(ledger, first_day, last_day):
+    """ Earnings between two YYYY-MM-DD days inclusive, as sorted (day, earnings) pairs """
+    days = {}
+    for position in ledger.positions_between(date_stamp(first_day), date_stamp(last_day) + 86400):
+        earning = ledger[position]
+        days.setdefault(earning["date"][:10], []).append(dict(earning))
+    return sorted(days.items())
+
+
+def day_receipt_messages(day, earnings):
+    """ Each sale's receipt followed by the day's summary """
+    for earning in earnings:
+        yield receipt_message(earning["amount"], earning.get("package", ""), earning["date"])
+    yield daily_summary_message(day, earnings)
+
+
+def pdf_printer(path):
+    from PyQt5.QtPrintSupport import QPrinter
+
+    printer = QPrinter(QPrinter.HighResolution)
+    printer.setOutputFormat(QPrinter.PdfFormat)
+    printer.setOutputFileName(path)
+    printer.setPaperSize(QSizeF(80, 300), QPrinter.Millimeter)
+    return printer
+
+
+def start_headless_qt():
+    """ Painting fonts and pixmaps needs a QApplication, but no display """
+    global headless_app
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    headless_app = QApplication.instance() or QApplication(sys.argv[:1])
+
+
+def render_receipts_pdf(path, messages):
+    return ReceiptRenderer().render_pages(pdf_printer(path), messages)
+
+
+def render_day_pdf(path, day, earnings):
+    # Runs in a worker process; earnings arrive pickled
+    return render_receipts_pdf(path, day_receipt_messages(day, earnings))
+
+
+def export_receipts(output, first_day, last_day, jobs=1):
+    """ Reprint the receipts of a date range to PDF, streamed into one file or one file per day with jobs > 1 """
+    # Read only, so an export never compacts or rewrites the files a running terminal is using
+    store = open_store(load_config(), read_only=True)
+    try:
+        store.load_months(first_day[:7], last_day[:7])
+        days = earnings_by_day(store.data["earnings"], first_day, last_day)
+    finally:
+        store.close()
+
+    if jobs <= 1:
+        start_headless_qt()
+        messages = (message for day, earnings in days for message in day_receipt_messages(day, earnings))
+        return render_receipts_pdf(output, messages)
+
+    # Days are independent, so each worker renders whole days into their own files
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output, exist_ok=True)
+    with ProcessPoolExecutor(jobs, initializer=start_headless_qt) as pool:
+        pages = pool.map(render_day_pdf,
+                         [os.path.join(output, f"receipts-{day}.pdf") for day, _ in days],
+                         [day for day, _ in days],
+                         [earnings for _, earnings in days])
+        return sum(pages)
+
+
+def parse_day(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {text}")
+
+
+def manual_month_total(data, month):
+    """ Sum of the monthly earnings entered by hand for a "YYYY-MM" month, None if there are none.
+
+    Those entries carry only the Arabic month name, so they match that month in every year.
+    """
+    name = ARABIC_MONTHS[int(month[5:7]) - 1]
+    manual = [float(entry["amount"]) for entry in data["monthly_earnings"] if entry["month"] == name]
+    return sum(manual) if manual else None
+
+
+def earnings_breakdown(store, year=None):
+    """ Revenue by hour of day, weekday and package as {"hour"|"weekday"|"package": {key: [amount, count]}}.
+
+    All time comes straight from the running aggregates; a single year loads
+    its months and is counted from the ledger columns in one pass.
+    """
+    if year is None:
+        return {name: store.aggregates.buckets(name) for name in ("hour", "weekday", "package")}
+    store.load_months(f"{year}-01", f"{year}-12")
+    return store.data["earnings"].breakdown(month_bounds(f"{year}-01")[0], month_bounds(f"{year}-12")[1])
+
+
+def revenue_by_hour(store, year=None):
+    """ [amount, count] for each hour of the day, 0 to 23 """
+    hours = earnings_breakdown(store, year)["hour"]
+    return [hours.get(f"{hour:02d}", [0.0, 0]) for hour in range(24)]
+
+
+def revenue_by_weekday(store, year=None):
+    """ [amount, count] for each weekday, Monday first """
+    weekdays = earnings_breakdown(store, year)["weekday"]
+    return [weekdays.get(str(weekday), [0.0, 0]) for weekday in range(7)]
+
+
+def revenue_by_day(store, year=None):
+    """ (day, amount, count) per "YYYY-MM-DD" with sales, newest first, and the [amount, count] of them all.
+
+    All time comes from the running aggregates; a single year loads its
+    months and is summed from the ledger columns.
+    """
+    if year is None:
+        days, total = store.aggregates.by_day, [store.aggregates.total, store.aggregates.count]
+    else:
+        store.load_months(f"{year}-01", f"{year}-12")
+        start, end = month_bounds(f"{year}-01")[0], month_bounds(f"{year}-12")[1]
+        ledger = store.data["earnings"]
+        days, total = ledger.daily_totals(start, end), list(ledger.sum_between(start, end))
+    return [(day, amount, count) for day, (amount, count) in sorted(days.items(), reverse=True)], total
+
+
+def top_packages(store, year=None, limit=10):
+    """ (package, amount, count) for the best-selling packages by revenue """
+    packages = earnings_breakdown(store, year)["package"]
+    ranked = sorted(packages.items(), key=lambda item: item[1][0], reverse=True)
+    return [(package, amount, count) for package, (amount, count) in ranked[:limit]]
+
+
+def expenses_by_month(expenses):
+    """ {"YYYY-MM" or None: amount}; expenses recorded before they were dated fall under None """
+    months = {}
+    for expense in expenses:
+        date = expense.get("date")
+        month = date[:7] if date else None
+        months[month] = months.get(month, 0.0) + float(expense.get("amount", 0) or 0)
+    return months
+
+
+def monthly_profit(store, year=None):
+    """ (month, revenue, manual, expenses, net) per "YYYY-MM", newest first; net is revenue less expenses """
+    revenue = store.aggregates.by_month
+    expenses = expenses_by_month(store.data["expenses"])
+    months = sorted((set(revenue) | set(expenses)) - {None}, reverse=True)
+    rows = []
+    for month in months:
+        if year is not None and not month.startswith(str(year)):
+            continue
+        amount = revenue.get(month, (0.0, 0))[0]
+        spent = expenses.get(month, 0.0)
+        rows.append((month, amount, manual_month_total(store.data, month), spent, amount - spent))
+    return rows
+
+
+def inventory_valuation(inventory):
+    """ (component, quantity, price, value) per item and the total stock value """
+    rows = []
+    for item in inventory:
+        quantity = float(item.get("quantity", 0) or 0)
+        price = float(item.get("price", 0) or 0)
+        rows.append((item.get("component", ""), quantity, price, quantity * price))
+    return rows, sum(row[3] for row in rows)
+
+
+@traced
+def record_earning(store, amount, package=None, package_id=None, customer_id=None, quantity=1):
+    """ Add an earning for now to the store, whether or not the earnings tab exists yet.
+
+    amount is what was charged in all, for quantity units of the package. A
+    customer's visits go up by one, looked up by id rather than by scanning.
+    """
+    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    earning_data = {"date": date, "amount": float(amount)}
+    if package is not None:
+        earning_data["package"] = package
+    if package_id is not None:
+        earning_data["package_id"] = package_id
+    if customer_id is not None:
+        earning_data["customer_id"] = customer_id
+    earning_data["quantity"] = quantity
+    earning = store.add("earnings", earning_data)
+    if customer_id is not None:
+        customer = store.get("customers", customer_id)
+        if customer is not None:
+            store.update("customers", customer_id, {"visits": int(customer.get("visits", 0)) + 1})
+    return earning
+
+
+def customer_earnings(store, customer_id):
+    """ Every earning recorded against a customer, oldest first.
+
+    Archived months are only loaded when the running totals show that some
+    of the customer's earnings are not in memory.
+    """
+    ledger = store.data["earnings"]
+    history = ledger.customer_history(customer_id)
+    if len(history) < store.aggregates.customer_count(customer_id) and store.archive.unloaded_months():
+        for month in store.archive.unloaded_months():
+            store.load_month(month)
+        history = ledger.customer_history(customer_id)
+    return history
+
+
+def post_stock_movement(store, lines, reason, earning_id=None):
+    """ Append a movement to the stock ledger and move each component's quantity by its line.
+
+    lines are (inventory id, change) pairs. The quantity on each inventory
+    record is the running balance of the ledger, so a movement costs one
+    update per component however long the ledger grows. Components deleted
+    since are left out.
+    """
+    lines = [[inventory_id, change] for inventory_id, change in lines
+             if change and store.get("inventory", inventory_id) is not None]
+    if not lines:
+        return None
+    movement = {"date": datetime.now().strftime(DATE_FORMAT), "reason": reason, "lines": lines}
+    if earning_id is not None:
+        movement["earning_id"] = earning_id
+    store.add("stock_movements", movement)
+    for inventory_id, change in lines:
+        component = store.get("inventory", inventory_id)
+        store.update("inventory", inventory_id, {"quantity": int(component.get("quantity", 0)) + change})
+    return movement
+
+
+def material_lines(package, units=1):
+    """ The (inventory id, change) lines selling units of a package takes out of stock """
+    return [(inventory_id, -amount * units) for inventory_id, amount in package.get("materials") or ()]
+
+
+def stock_shortages(store, lines):
+    """ The components a movement would take below zero, as (component, quantity missing) pairs """
+    shortages = []
+    for inventory_id, change in lines:
+        component = store.get("inventory", inventory_id)
+        if component is not None and int(component.get("quantity", 0)) + change < 0:
+            shortages.append((component, -(int(component.get("quantity", 0)) + change)))
+    return shortages
+
+
+def import_value(kind, value):
+    """ Parse one imported cell, given as a string from CSV or as a number or datetime from XLSX """
+    if kind == "date":
+        if isinstance(value, datetime):
+            return value.strftime(DATE_FORMAT)
+        for layout in (DATE_FORMAT, "%Y-%m-%d"):
+            try:
+                return datetime.strptime(value, layout).strftime(DATE_FORMAT)
+            except (TypeError, ValueError):
+                pass
+        raise ValueError(value)
+    if kind == "text":
+        # Spreadsheets turn phone numbers into floats
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value)
+    number = float(value)
+    if kind == "int":
+        if not number.is_integer():
+            raise ValueError(value)
+        return int(number)
+    return number
+
+
+def table_rows(path):
+    """ Stream a .csv or .xlsx file as (cell values, fraction of the file read) pairs """
+    if path.lower().endswith(".xlsx"):
+        import openpyxl  # Optional; the caller reports the ImportError when it is missing
+
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            total = sheet.max_row or 1
+            for number, row in enumerate(sheet.iter_rows(values_only=True), 1):
+                yield ["" if value is None else value for value in row], min(number / total, 1.0)
+        finally:
+            workbook.close()
+        return
+    size = os.path.getsize(path) or 1
+    read = 0
+    with open(path, 'rb') as file:
+        def lines():
+            nonlocal read
+            for line in file:
+                read += len(line)
+                yield line.decode('utf-8-sig')
+        for row in csv.reader(lines()):
+            yield row, read / size
+
+
+ImportProgress = namedtuple("ImportProgress", "fraction imported rejected errors")
+
+
+def import_table(store, collection, path, batch_size=IMPORT_BATCH):
+    """ Validate the rows of a file and add them to the store one batch at a time.
+
+    The header row names the fields by key or by column title. An
+    ImportProgress is yielded after every batch, with up to
+    IMPORT_ERRORS_KEPT (row number, reason) pairs for rejected rows; closing
+    the generator cancels the rest and keeps the batches already added.
+    """
+    fields = IMPORT_FIELDS[collection]
+    rows = table_rows(path)
+    header, fraction = next(rows, ([], 1.0))
+    names = [normalize_arabic(str(cell)).strip() for cell in header]
+    positions = []
+    for key, title, kind, default in fields:
+        matches = [index for index, name in enumerate(names) if name in (key, normalize_arabic(title))]
+        if not matches and default is None:
+            raise ValueError(f"العمود {title} غير موجود في الملف.")
+        positions.append(matches[0] if matches else None)
+
+    batch, errors, imported, rejected = [], [], 0, 0
+    for number, (row, fraction) in enumerate(rows, 2):
+        if not any(str(cell).strip() for cell in row):
+            continue
+        record = {}
+        try:
+            for (key, title, kind, default), position in zip(fields, positions):
+                value = row[position] if position is not None and position < len(row) else ""
+                if isinstance(value, str):
+                    value = value.strip()
+                if value == "":
+                    if default is None:
+                        raise ValueError(f"{title}: حقل مطلوب")
+                    record[key] = default
+                    continue
+                try:
+                    record[key] = import_value(kind, value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"{title}: قيمة غير صالحة ({value})")
+        except ValueError as error:
+            rejected += 1
+            if len(errors) < IMPORT_ERRORS_KEPT:
+                errors.append((number, str(error)))
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            store.add_many(collection, batch)
+            imported += len(batch)
+            batch = []
+            yield ImportProgress(fraction, imported, rejected, errors)
+    if batch:
+        store.add_many(collection, batch)
+        imported += len(batch)
+    yield ImportProgress(1.0, imported, rejected, errors)
+
+
+def export_table(records, collection, path):
+    """ Write records to a .csv or .xlsx file under their column titles, a row at a time; returns the count """
+    fields = IMPORT_FIELDS[collection]
+    header = [title for _, title, _, _ in fields]
+    count = 0
+    if path.lower().endswith(".xlsx"):
+        import openpyxl  # Optional; the caller reports the ImportError when it is missing
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for record in records:
+            sheet.append([record.get(key, default if default is not None else "") for key, _, _, default in fields])
+            count += 1
+        workbook.save(path)
+        return count
+    # The byte order mark lets Excel pick up the Arabic text
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for record in records:
+            writer.writerow([record.get(key, default if default is not None else "") for key, _, _, default in fields])
+            count += 1
+    return count
+
+
+@contextmanager
+def bulk_update(*views):
+    """ Hold back the views' repaints, sorting and signals while their models change wholesale """
+    saved = [(view.isSortingEnabled(), view.signalsBlocked()) for view in views]
+    for view in views:
+        view.setUpdatesEnabled(False)
+        view.setSortingEnabled(False)
+        view.blockSignals(True)
+    try:
+        yield
+    finally:
+        for view, (sorting, blocked) in zip(views, saved):
+            view.blockSignals(blocked)
+            view.setSortingEnabled(sorting)
+            view.setUpdatesEnabled(True)
+
+
+def run_import(parent, store, collection, table):
+    """ Ask for a file and import it behind a cancellable progress dialog; the table is refreshed once at the end """
+    path, _ = QFileDialog.getOpenFileName(parent, "استيراد", "", "جداول البيانات (*.csv *.xlsx)")
+    if not path:
+        return
+    progress = QProgressDialog("جاري الاستيراد...", "إلغاء", 0, 1000, parent)
+    progress.setWindowModality(Qt.WindowModal)
+    progress.setMinimumDuration(500)
+    job = import_table(store, collection, path)
+    result = None
+    canceled = False
+    try:
+        with bulk_update(table), store.batch():
+            for result in job:
+                progress.setValue(int(result.fraction * 1000))
+                QApplication.processEvents()
+                canceled = progress.wasCanceled()
+                if canceled:
+                    break
+    except ImportError:
+        QMessageBox.warning(parent, "خطأ في الاستيراد", "قراءة ملفات Excel تحتاج إلى مكتبة openpyxl.")
+        return
+    except (OSError, ValueError) as error:
+        QMessageBox.warning(parent, "خطأ في الاستيراد", str(error))
+        return
+    finally:
+        job.close()
+        progress.close()
+    if result is None:
+        return
+    lines = [f"تم استيراد {result.imported} سجل."]
+    if canceled:
+        lines.insert(0, "تم إلغاء الاستيراد.")
+    if result.rejected:
+        lines.append(f"تم تخطي {result.rejected} صف غير صالح:")
+        lines.extend(f"الصف {number}: {reason}" for number, reason in result.errors[:10])
+    QMessageBox.information(parent, "الاستيراد", "\n".join(lines))
+
+
+def run_export(parent, store, collection):
+    path, selected = QFileDialog.getSaveFileName(parent, "تصدير", "", "CSV (*.csv);;Excel (*.xlsx)")
+    if not path:
+        return
+    if not path.lower().endswith((".csv", ".xlsx")):
+        path += ".xlsx" if "xlsx" in selected else ".csv"
+    try:
+        count = export_table(store.data[collection], collection, path)
+    except ImportError:
+        QMessageBox.warning(parent, "خطأ في التصدير", "كتابة ملفات Excel تحتاج إلى مكتبة openpyxl.")
+        return
+    except OSError as error:
+        QMessageBox.warning(parent, "خطأ في التصدير", str(error))
+        return
+    QMessageBox.information(parent, "التصدير", f"تم تصدير {count} سجل إلى {path}")
+
+
+def transfer_buttons(parent, store, collection, table):
+    """ Import and export buttons for a tab's collection """
+    buttons = []
+    for text, action in (("استيراد", lambda: run_import(parent, store, collection, table)),
+                         ("تصدير", lambda: run_export(parent, store, collection))):
+        button = QPushButton(text)
+        button.setFixedSize(QSize(150, 50))
+        button.setStyleSheet("background-color: #607D8B; color: white; border: none; border-radius: 5px;")
+        button.clicked.connect(action)
+        buttons.append(button)
+    return buttons
+
+
+def current_row(view):
+    """ Row of the view's current index, -1 when nothing is selected """
+    index = view.currentIndex()
+    return index.row() if index.isValid() else -1
+
+
+class PerformanceOverlay(QLabel):
+    """ Live table of the tracer's latencies drawn over the top corner of the window """
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setLayoutDirection(Qt.LeftToRight)
+        self.setFont(QFont("Courier New", 9))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 180); color: #7CFC00; padding: 6px;")
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def refresh(self):
+        self.setText(TRACER.report())
+        self.adjustSize()
+        self.raise_()
+
+    def toggle(self):
+        """ Showing the overlay starts tracing; hiding it stops unless the environment asked for tracing """
+        if self.isVisible():
+            self.timer.stop()
+            self.hide()
+            TRACER.enabled = TRACER.setting is not None
+        else:
+            TRACER.enabled = True
+            self.refresh()
+            self.show()
+            self.timer.start(TRACE_OVERLAY_MS)
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as file:
-        json.dump(data, file, indent=4)
 
 class BarbershopApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, store=None, startup_timings=None):
         super().__init__()
 
         self.setWindowTitle("Beko Barber")
@@ -67,7 +3344,24 @@ class BarbershopApp(QMainWindow):
         font = QFont("Arial", 12)
         self.setFont(font)
 
-        self.data = load_data()
+        self.config = load_config()
+        self.startup_timings = [] if startup_timings is None else startup_timings
+        if store is None:
+            started = time.perf_counter()
+            store = open_store(self.config)
+            self.record_timing("store", started)
+        self.store = store
+        self.data = self.store.data
+        if isinstance(self.store, RemoteStore):
+            # Other terminals' changes are applied as soon as the server sends them
+            self.store_notifier = QSocketNotifier(self.store.socket.fileno(), QSocketNotifier.Read, self)
+            self.store_notifier.activated.connect(self.poll_store)
+        else:
+            # Other instances sharing the data files are only noticed when looked for
+            self.store_timer = QTimer(self)
+            self.store_timer.timeout.connect(self.poll_store)
+            self.store_timer.start(JOURNAL_POLL_MS)
+        self.store.subscribe_conflicts(self.report_conflict)
 
         # Set layout direction to right-to-left
         self.setLayoutDirection(Qt.RightToLeft)
@@ -79,55 +3373,121 @@ class BarbershopApp(QMainWindow):
         # Create a vertical layout
         self.layout = QVBoxLayout(self.central_widget)
 
-        # Add logo
+        # Add logo; the images are decoded once the window is on screen (see load_images)
         self.logo_label = QLabel()
-        self.logo_pixmap = QPixmap(self.resource_path("beko.jpg")).scaled(300, 100, Qt.KeepAspectRatio)
-        self.logo_label.setPixmap(self.logo_pixmap)
+        self.logo_label.setFixedHeight(100)
         self.logo_label.setAlignment(Qt.AlignCenter)
         self.layout.addWidget(self.logo_label)  # Don't forget to add logo_label to layout
 
-        # Set application icon
-        self.setWindowIcon(QIcon(self.resource_path("beko.ico")))  # Ensure you reference the ICO file
-
         # Create the tab widget
         self.tab_widget = QTabWidget()
         self.layout.addWidget(self.tab_widget) 
 
-        # Add tabs
-        self.earnings_tab = EarningsTab(self.data)
-        self.packages_tab = PackagesTab(self.data, self.earnings_tab)
-        self.inventory_tab = InventoryTab(self.data)
-        self.customer_tab = CustomersTab(self.data)
-        self.monthly_earnings_tab = MonthlyEarningsTab(self.data)
-        self.expenses_tab = ExpensesTab(self.data)  # Add the ExpensesTab
-
-        self.tab_widget.addTab(self.packages_tab, "الباقات")
-        self.tab_widget.addTab(self.inventory_tab, "المخزون")
-        self.tab_widget.addTab(self.earnings_tab, "الأرباح")
-        self.tab_widget.addTab(self.customer_tab, "العملاء")
-        self.tab_widget.addTab(self.monthly_earnings_tab, "الأرباح الشهرية")
-        self.tab_widget.addTab(self.expenses_tab, "المصروفات")  # Add the tab for المصروفات
-        
+        # Add tabs; each one is built the first time it is shown, starting with the packages tab
+        self.tab_factories = [
+            ("packages_tab", "الباقات", PackagesTab),
+            ("inventory_tab", "المخزون", InventoryTab),
+            ("earnings_tab", "الأرباح", EarningsTab),
+            ("customer_tab", "العملاء", CustomersTab),
+            ("monthly_earnings_tab", "الأرباح الشهرية", MonthlyEarningsTab),
+            ("expenses_tab", "المصروفات", ExpensesTab),
+            ("analytics_tab", "التحليلات", AnalyticsTab),
+        ]
+        for attribute, title, _ in self.tab_factories:
+            setattr(self, attribute, None)
+            self.tab_widget.addTab(QWidget(), title)
+        self.tab_widget.currentChanged.connect(self.ensure_tab)
+        self.ensure_tab(0)
+        self.shown = False
+
+        # Hidden performance overlay for looking into slow operations on the shop machine
+        self.performance_overlay = PerformanceOverlay(self)
+        self.trace_shortcut = QShortcut(QKeySequence(TRACE_SHORTCUT), self)
+        self.trace_shortcut.activated.connect(self.performance_overlay.toggle)
+
+    @traced
+    def ensure_tab(self, index):
+        """ Build the tab at index in place of its placeholder, unless it exists already """
+        attribute, title, factory = self.tab_factories[index]
+        if getattr(self, attribute) is not None:
+            return
+        started = time.perf_counter()
+        tab = factory(self.store)
+        setattr(self, attribute, tab)
+
+        # Swapping the placeholder must not look like the user switching tabs
+        current = self.tab_widget.currentIndex()
+        placeholder = self.tab_widget.widget(index)
+        self.tab_widget.blockSignals(True)
+        self.tab_widget.removeTab(index)
+        self.tab_widget.insertTab(index, tab, title)
+        self.tab_widget.setCurrentIndex(current)
+        self.tab_widget.blockSignals(False)
+        placeholder.deleteLater()
+        self.record_timing(title, started)
+
+    def prewarm_tabs(self):
+        """ Build the next missing tab, one per pass of the event loop so input is never held up """
+        for index, (attribute, _, _) in enumerate(self.tab_factories):
+            if getattr(self, attribute) is None:
+                self.ensure_tab(index)
+                QTimer.singleShot(0, self.prewarm_tabs)
+                return
+
+    def record_timing(self, label, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        self.startup_timings.append((label, elapsed))
+        if self.config["startup_report"]:
+            sys.stderr.write(f"startup: {label}: {elapsed:.1f} ms\n")
+
+    def load_images(self):
+        self.logo_pixmap = QPixmap(self.resource_path("beko.jpg")).scaled(300, 100, Qt.KeepAspectRatio)
+        self.logo_label.setPixmap(self.logo_pixmap)
+
+        # Set application icon
+        self.setWindowIcon(QIcon(self.resource_path("beko.ico")))  # Ensure you reference the ICO file
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.shown:
+            self.shown = True
+            QTimer.singleShot(0, self.load_images)
+            if self.config["prewarm_tabs"]:
+                QTimer.singleShot(0, self.prewarm_tabs)
+
     def resource_path(self, relative_path):
-        """ Get absolute path to resource, works for dev and for PyInstaller """
+        return resource_path(relative_path)
+
+    def poll_store(self):
         try:
-            base_path = sys._MEIPASS
-        except Exception:
-            base_path = os.path.abspath(".")
-        return os.path.join(base_path, relative_path)
+            # Whatever piled up arrives as one change per collection
+            with self.store.batch():
+                self.store.poll()
+        except ConnectionError:
+            self.store_notifier.setEnabled(False)
+            QMessageBox.warning(self, "خطأ في الاتصال", "انقطع الاتصال بخادم البيانات.")
+
+    def report_conflict(self, conflict):
+        QMessageBox.warning(self, "تعارض في البيانات", f"لم يتم حفظ التعديل: {conflict.reason}.\nيرجى المحاولة مرة أخرى.")
 
     def closeEvent(self, event):
-        save_data(self.data)
+        self.store.close()
         event.accept()
 
 
 class PackagesTab(QWidget):
-    def __init__(self, data, earnings_tab):
+    def __init__(self, store):
         super().__init__()
-        self.data = data
-        self.earnings_tab = earnings_tab
+        self.store = store
+        self.data = store.data
         self.layout = QVBoxLayout()
 
+        # Receipt printing state is built once and reused for every checkout
+        self.receipt_renderer = None
+        self.receipt_printer = None
+        self.preview_dialog = None
+        self.receipt_message = ""
+
         self.setLayoutDirection(Qt.RightToLeft)
         
         large_font = QFont("Arial", 16)
@@ -142,6 +3502,18 @@ class PackagesTab(QWidget):
         form_layout.addRow("السعر:", self.price_input)
         form_layout.setAlignment(Qt.AlignRight)
 
+        # Who the selected package is sold to, and how many
+        checkout_layout = QFormLayout()
+        self.customer_mobile_input = QLineEdit()
+        self.customer_mobile_input.setFont(large_font)
+        self.customer_mobile_input.setPlaceholderText("اختياري")
+        self.quantity_input = QSpinBox()
+        self.quantity_input.setFont(large_font)
+        self.quantity_input.setRange(1, 99)
+        checkout_layout.addRow("موبايل العميل:", self.customer_mobile_input)
+        checkout_layout.addRow("الكمية:", self.quantity_input)
+        checkout_layout.setAlignment(Qt.AlignRight)
+
         button_font = QFont("Arial", 14)
 
         self.add_package_button = QPushButton("أضف باقة")
@@ -192,16 +3564,41 @@ class PackagesTab(QWidget):
         """)
         self.delete_package_button.clicked.connect(self.delete_package)
 
-        self.packages_table = QTableWidget()
-        self.packages_table.setColumnCount(2)
-        self.packages_table.setHorizontalHeaderLabels(["الوصف", "السعر"])
+        self.materials_button = QPushButton("مكونات الباقة")
+        self.materials_button.setFont(button_font)
+        self.materials_button.setFixedSize(QSize(200, 50))
+        self.materials_button.setStyleSheet("""
+            QPushButton {
+                background-color: #FF9800; 
+                color: white; 
+                border: none; 
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #FB8C00;
+            }
+        """)
+        self.materials_button.clicked.connect(self.edit_materials)
+
+        self.packages_model = RecordTableModel(store, "packages", [
+            TableColumn("الوصف", "description", parse=str),
+            TableColumn("السعر", "price", parse=float),
+            TableColumn("المكونات", "materials", text=self.materials_text, default=None),
+            # All-time sales of the package, read from the running totals by its id
+            TableColumn("إجمالي المبيعات", "id", text=lambda package_id: f"{store.aggregates.package_total(package_id):.2f}"),
+        ])
+        self.packages_model.edit_rejected.connect(self.reject_package_edit)
+        store.subscribe(self.on_store_change)
+
+        self.packages_table = QTableView()
+        self.packages_table.setModel(self.packages_model)
         self.packages_table.setFont(QFont("Arial", 18, QFont.Bold))
         self.packages_table.setMinimumSize(900, 500)
         self.packages_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.packages_table.setColumnWidth(0, 400)
         self.packages_table.setColumnWidth(1, 400)
-        self.packages_table.setEditTriggers(QTableWidget.DoubleClicked | QTableWidget.EditKeyPressed)
-        self.packages_table.itemChanged.connect(self.edit_package)
+        self.packages_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.packages_table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
 
         header = self.packages_table.horizontalHeader()
         header.setStyleSheet("QHeaderView::section { background-color: #333; color: white; font-weight: bold; padding: 16px; }")
@@ -211,39 +3608,40 @@ class PackagesTab(QWidget):
         self.packages_table.verticalHeader().setDefaultSectionSize(50)
         self.packages_table.setAlternatingRowColors(True)
         self.packages_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 font-size: 18px;
                 border: 1px solid #ddd;
                 gridline-color: #ddd;
             }
         """)
 
+        # Components checkouts have run low on, kept current by store.low_stock
+        self.low_stock_label = QLabel()
+        self.low_stock_label.setFont(button_font)
+        self.low_stock_label.setStyleSheet("color: #c62828;")
+        self.low_stock_label.setWordWrap(True)
+        store.low_stock.subscribe(self.show_low_stock)
+        self.show_low_stock()
+
         self.layout.addWidget(self.packages_table)
+        self.layout.addWidget(self.low_stock_label)
         self.layout.addLayout(form_layout)
+        self.layout.addLayout(checkout_layout)
 
         button_layout = QHBoxLayout()
         button_layout.addStretch()
         button_layout.addWidget(self.add_package_button)
         button_layout.addWidget(self.checkout_button)
+        button_layout.addWidget(self.materials_button)
         button_layout.addWidget(self.delete_package_button)
         button_layout.addStretch()
         self.layout.addLayout(button_layout)
 
-        self.setLayout(self.layout)
-        self.load_packages_to_table()
-
-    def load_packages_to_table(self):
-        for package in self.data.get("packages", []):
-            row_position = self.packages_table.rowCount()
-            self.packages_table.insertRow(row_position)
+        self.direct_print_checkbox = QCheckBox("طباعة الإيصال مباشرة بدون معاينة")
+        self.direct_print_checkbox.setFont(button_font)
+        self.layout.addWidget(self.direct_print_checkbox, alignment=Qt.AlignCenter)
 
-            description_item = QTableWidgetItem(package["description"])
-            description_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-            self.packages_table.setItem(row_position, 0, description_item)
-
-            price_item = QTableWidgetItem(str(package["price"]))
-            price_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-            self.packages_table.setItem(row_position, 1, price_item)
+        self.setLayout(self.layout)
 
     def add_package(self):
         description = self.description_input.text()
@@ -260,133 +3658,207 @@ class PackagesTab(QWidget):
             return
 
         package_data = {"description": description, "price": price}
-        self.data.setdefault("packages", []).append(package_data)
-
-        row_position = self.packages_table.rowCount()
-        self.packages_table.insertRow(row_position)
-
-        description_item = QTableWidgetItem(description)
-        description_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-        self.packages_table.setItem(row_position, 0, description_item)
-
-        price_item = QTableWidgetItem(str(price))
-        price_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-        self.packages_table.setItem(row_position, 1, price_item)
+        self.store.add("packages", package_data)
 
         QMessageBox.information(self, "تم إضافة الباقة", f"تمت إضافة الباقة:\nالوصف: {description}\nالسعر: {price}")
 
         self.description_input.clear()
         self.price_input.clear()
 
-    def edit_package(self, item):
-        row = item.row()
-        column = item.column()
-
-        if column == 0:
-            self.data["packages"][row]["description"] = item.text()
-        elif column == 1:
-            try:
-                price = float(item.text())
-                self.data["packages"][row]["price"] = price
-            except ValueError:
-                QMessageBox.warning(self, "خطأ في الإدخال", "السعر يجب أن يكون رقمًا صالحًا.")
-                item.setText(str(self.data["packages"][row]["price"]))
-
+    def reject_package_edit(self, row, column):
+        QMessageBox.warning(self, "خطأ في الإدخال", "السعر يجب أن يكون رقمًا صالحًا.")
+
+    def on_store_change(self, entry, position):
+        if entry["c"] == "earnings" and entry["op"] != "load":
+            self.packages_model.refresh_column(3)
+
+    def materials_text(self, materials):
+        names = []
+        for inventory_id, amount in materials or ():
+            component = self.store.get("inventory", inventory_id)
+            if component is not None:
+                names.append(f"{component['component']} × {amount}")
+        return "، ".join(names)
+
+    def edit_materials(self):
+        row = current_row(self.packages_table)
+        if row == -1:
+            QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار باقة لتحديد مكوناتها.")
+            return
+        package = self.packages_model.record(row)
+        dialog = MaterialsDialog(self.store, package, self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.store.update("packages", package["id"], {"materials": dialog.materials()})
+
+    def show_low_stock(self):
+        names = sorted(self.store.get("inventory", component_id)["component"] for component_id in self.store.low_stock.low)
+        self.low_stock_label.setText(f"تنبيه - مخزون منخفض: {'، '.join(names)}" if names else "")
+        self.low_stock_label.setVisible(bool(names))
+
+    @pyqtSlot()  # The wrapper would otherwise be handed clicked's checked argument
+    @traced
     def checkout(self):
-        current_row = self.packages_table.currentRow()
-        if current_row != -1:
-            description = self.packages_table.item(current_row, 0).text()
-            price = self.packages_table.item(current_row, 1).text()
-
-            receipt_message = (
-                f"السعر: {price}\n\n"
-                f"الباقة: {description}\n\n"
-                "صالون بيكو تشرف بوجود حضراتكم"
-            )
-
-            self.preview_receipt(receipt_message)
-            self.earnings_tab.add_earning(float(price))
+        row = current_row(self.packages_table)
+        if row != -1:
+            package = self.packages_model.record(row)
+            description = package["description"]
+            price = package["price"]
+            quantity = self.quantity_input.value()
+
+            customer_id = None
+            mobile = self.customer_mobile_input.text().strip()
+            if mobile:
+                # Looked up through the mobile index; the first customer wins if a number is shared
+                customers = self.store.find("customers", mobile)
+                if not customers:
+                    QMessageBox.warning(self, "خطأ في الإدخال", "لا يوجد عميل بهذا الرقم.")
+                    return
+                customer_id = customers[0]["id"]
+
+            # The package's bill of materials comes out of stock with the sale
+            lines = material_lines(package, quantity)
+            shortages = stock_shortages(self.store, lines)
+            if shortages:
+                missing = "\n".join(f"{component['component']}: ينقص {amount}" for component, amount in shortages)
+                QMessageBox.warning(self, "المخزون غير كافٍ", f"لا يكفي المخزون لهذه الباقة:\n{missing}")
+                return
+
+            amount = float(price) * quantity
+            if quantity > 1:
+                description = f"{description} × {quantity}"
+            message = receipt_message(amount, description)
+
+            # The earning, the visit and the stock it used are kept together or not at all,
+            # so the stock ledger always matches the quantities; a conflict was reported already
+            with self.store.batch(), self.store.all_or_nothing() as conflicts:
+                earning = record_earning(self.store, amount, package["description"], package["id"], customer_id,
+                                         quantity)
+                if not conflicts:
+                    post_stock_movement(self.store, lines, STOCK_SALE, earning["id"])
+            if conflicts:
+                return
+            self.customer_mobile_input.clear()
+            self.quantity_input.setValue(1)
+            if self.direct_print_checkbox.isChecked():
+                self.direct_print_receipt(message)
+            else:
+                self.preview_receipt(message)
         else:
             QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار باقة للدفع.")
 
 
-    def preview_receipt(self, message):
-        # Create a printer object for previewing
-        printer = QPrinter(QPrinter.HighResolution)
-        
-        # Set the paper size to 80 mm width and a custom height for roll printing
-        custom_size = QSizeF(80, 300)  # 80 mm width, 300 mm height (or as needed)
-        printer.setPaperSize(custom_size, QPrinter.Millimeter)  # Set the custom size in millimeters
-
-        # Set up the print preview dialog
-        preview_dialog = QPrintPreviewDialog(printer, self)
-        preview_dialog.paintRequested.connect(lambda p: self.render_receipt(p, message))
-        preview_dialog.exec_()
-        
-
-    def render_receipt(self, printer, message):
-        painter = QPainter(printer)
-
-        # Draw the logo at a higher position with a larger size
-        logo = QIcon("beko.ico").pixmap(100, 100)  # Increased size for visibility on 80mm paper
-        logo_x = (printer.pageRect().width() - logo.width()) // 2
-        painter.drawPixmap(logo_x, 10, logo)  # Positioned near the top
-
-        # Draw the title below the logo with more space
-        font = QFont("Arial", 18, QFont.Bold)
-        painter.setFont(font)
-        title = "Beko Barber"
-        title_x = (printer.pageRect().width() - painter.fontMetrics().width(title)) // 2
-        painter.drawText(title_x, 130, title)  # Adjusted y-position to avoid overlapping
+    def receipt_setup(self):
+        if self.receipt_printer is None:
+            # Print support loads on the first checkout rather than with the window
+            from PyQt5.QtPrintSupport import QPrinter
 
-        # Set a smaller font size for the Arabic content
-        content_font = QFont("Arial", 10)
-        painter.setFont(content_font)
+            self.receipt_renderer = ReceiptRenderer()
+            self.receipt_printer = QPrinter(QPrinter.HighResolution)
+            # Set the paper size to 80 mm width and a custom height for roll printing
+            self.receipt_printer.setPaperSize(QSizeF(80, 300), QPrinter.Millimeter)
+        return self.receipt_printer
 
-        # Start drawing Arabic text with adjusted line height and padding to prevent cutting
-        y = 170  # Start position for the Arabic content after title
-
-        # Loop to draw each line with sufficient padding
-        for line in message.split('\n'):
-            rect = QRect(10, y, printer.pageRect().width() - 20, 30)  # 30px height per line for better fit
-            painter.drawText(rect, Qt.AlignRight | Qt.AlignVCenter, line)
-            y += 35  # Add extra padding between lines
+    def preview_receipt(self, message):
+        from PyQt5.QtPrintSupport import QPrintPreviewDialog, QPrintPreviewWidget
 
-        painter.end()
+        printer = self.receipt_setup()
+        self.receipt_message = message
+        if self.preview_dialog is None:
+            self.preview_dialog = QPrintPreviewDialog(printer, self)
+            self.preview_dialog.paintRequested.connect(lambda p: self.render_receipt(p, self.receipt_message))
+        else:
+            # A reused dialog only repaints its first preview by itself
+            self.preview_dialog.findChild(QPrintPreviewWidget).updatePreview()
+        self.preview_dialog.exec_()
 
+    def direct_print_receipt(self, message):
+        printer = self.receipt_setup()
+        if not self.receipt_renderer.render(printer, message):
+            QMessageBox.warning(self, "خطأ في الطباعة", "تعذر الوصول إلى الطابعة.")
 
+    @traced
+    def render_receipt(self, printer, message):
+        self.receipt_setup()
+        self.receipt_renderer.render(printer, message)
 
     def print_receipt(self, message):
-        # Create a printer object for actual printing
+        from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
+
+        # Actual printing with a dialog for printer selection
         printer = QPrinter(QPrinter.HighResolution)
         printer.setPaperSize(QSizeF(58, 200), QPrinter.Millimeter)  # Set size to match receipt printer width
-
-        # Show the print dialog for printer selection and preview
         dialog = QPrintDialog(printer, self)
         if dialog.exec_() == QPrintDialog.Accepted:
-            painter = QPainter(printer)
-
-            # Render receipt in the same way as preview
             self.render_receipt(printer, message)
-            
-            painter.end()
         
     def delete_package(self):
-        current_row = self.packages_table.currentRow()
-        if current_row != -1:
-            package_description = self.packages_table.item(current_row, 0).text()
-            self.data["packages"] = [pkg for pkg in self.data["packages"] if pkg["description"] != package_description]
-            self.packages_table.removeRow(current_row)
+        row = current_row(self.packages_table)
+        if row != -1:
+            package = self.packages_model.record(row)
+            package_description = package["description"]
+            self.store.remove("packages", package["id"])
             QMessageBox.information(self, "تم حذف الباقة", f"تم حذف الباقة: {package_description}")
         else:
             QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار باقة للحذف.")
 
 
 
+def parse_min_quantity(text):
+    """ A low-stock threshold typed into the table; empty turns the alert off """
+    text = text.strip()
+    if not text:
+        return None
+    value = int(text)
+    if value < 0:
+        raise ValueError(text)
+    return value
+
+
+class MaterialsDialog(QDialog):
+    """ Bill of materials of one package: how much of each inventory component a single sale uses """
+
+    def __init__(self, store, package, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"مكونات الباقة: {package['description']}")
+        self.setLayoutDirection(Qt.RightToLeft)
+        self.setMinimumSize(400, 400)
+
+        amounts = dict((inventory_id, amount) for inventory_id, amount in package.get("materials") or ())
+        form_layout = QFormLayout()
+        self.amount_inputs = []
+        for component in store.data["inventory"]:
+            amount_input = QSpinBox()
+            amount_input.setRange(0, 9999)
+            amount_input.setValue(amounts.get(component["id"], 0))
+            form_layout.addRow(f"{component['component']}:", amount_input)
+            self.amount_inputs.append((component["id"], amount_input))
+
+        content = QWidget()
+        content.setLayout(form_layout)
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(content)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("الكمية المستهلكة من كل مكون في البيع الواحد:"))
+        layout.addWidget(scroll_area)
+        layout.addWidget(buttons)
+
+    def materials(self):
+        """ [inventory id, amount] pairs of the components given an amount """
+        return [[inventory_id, amount_input.value()] for inventory_id, amount_input in self.amount_inputs
+                if amount_input.value()]
+
+
 class InventoryTab(QWidget):
-    def __init__(self, data):
+    def __init__(self, store):
         super().__init__()
-        self.data = data
+        self.store = store
+        self.data = store.data
 
         # Set layout direction to right-to-left
         self.setLayoutDirection(Qt.RightToLeft)
@@ -394,9 +3866,30 @@ class InventoryTab(QWidget):
         self.layout = QVBoxLayout()
 
         # Inventory table with enhanced style and layout
-        self.inventory_table = QTableWidget()
-        self.inventory_table.setColumnCount(4)  # Updated to 4 columns
-        self.inventory_table.setHorizontalHeaderLabels(["المكون", "الكمية", "السعر", "الاجرائات"])
+        # Components below their minimum are listed here and tinted in the table, both kept current by store.low_stock
+        self.low_stock_label = QLabel()
+        self.low_stock_label.setStyleSheet("color: #c62828; font-weight: bold;")
+        self.low_stock_label.setWordWrap(True)
+        self.layout.addWidget(self.low_stock_label)
+
+        self.inventory_model = RecordTableModel(store, "inventory", [
+            TableColumn("المكون", "component"),
+            TableColumn("الكمية", "quantity"),
+            TableColumn("السعر", "price", default="0"),
+            TableColumn("الحد الأدنى", "min_quantity", text=lambda value: "" if value is None else str(value),
+                        parse=parse_min_quantity, default=None),
+            TableColumn("الاجرائات", None),
+        ], highlight=lambda component: LOW_STOCK_COLOR if component["id"] in store.low_stock.low else None)
+        self.inventory_model.edit_rejected.connect(self.reject_min_quantity_edit)
+        store.low_stock.subscribe(self.show_low_stock)
+        self.show_low_stock()
+
+        self.inventory_table = QTableView()
+        self.inventory_table.setModel(self.inventory_model)
+        self.quantity_stepper = StepperDelegate(self.inventory_table)
+        self.quantity_stepper.stepped.connect(self.change_quantity)
+        self.inventory_table.setItemDelegateForColumn(4, self.quantity_stepper)
+        self.inventory_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.inventory_table.setMinimumSize(800, 400)
         self.inventory_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
@@ -404,7 +3897,8 @@ class InventoryTab(QWidget):
         self.inventory_table.setColumnWidth(0, 200)
         self.inventory_table.setColumnWidth(1, 200)
         self.inventory_table.setColumnWidth(2, 200)  # New column for السعر
-        self.inventory_table.setColumnWidth(3, 200)
+        self.inventory_table.setColumnWidth(3, 150)
+        self.inventory_table.setColumnWidth(4, 200)
 
         # Style the header
         header = self.inventory_table.horizontalHeader()
@@ -429,7 +3923,7 @@ class InventoryTab(QWidget):
 
         # Inventory table styling
         self.inventory_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 font-size: 18px;  /* Larger font size for table cells */
                 border: 1px solid #ddd;
                 gridline-color: #ddd;
@@ -442,31 +3936,32 @@ class InventoryTab(QWidget):
                 font-weight: bold;
                 padding: 15px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 10px;
                 min-width: 100px;  /* Minimum width for cells */
                 min-height: 50px;  /* Minimum height for cells */
                 font-weight: bold;  /* Bold font for table items */
                 text-align: center; /* Center align text */
             }
-            QTableWidget::item:alternate {
+            QTableView::item:alternate {
                 background-color: #f9f9f9;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #d9edf7;
             }
-            QTableWidget::item:hover {
+            QTableView::item:hover {
                 background-color: #f5f5f5;
             }
         """)
 
         self.layout.addWidget(self.inventory_table)
-        self.load_inventory_to_table()
 
         # Input fields for adding components
         self.component_input = QLineEdit()
         self.quantity_input = QLineEdit()
         self.price_input = QLineEdit()  # New input for price
+        self.min_quantity_input = QLineEdit()
+        self.min_quantity_input.setPlaceholderText("اختياري")
 
         # Customize button styles in InventoryTab
         self.add_component_button = QPushButton("أضف مكون")
@@ -486,11 +3981,17 @@ class InventoryTab(QWidget):
         self.layout.addWidget(self.quantity_input)
         self.layout.addWidget(QLabel("السعر:"))  # New label for price
         self.layout.addWidget(self.price_input)  # New input field for price
+        self.layout.addWidget(QLabel("الحد الأدنى للتنبيه:"))
+        self.layout.addWidget(self.min_quantity_input)
+
+        self.import_button, self.export_button = transfer_buttons(self, store, "inventory", self.inventory_table)
 
         button_layout = QHBoxLayout()
         button_layout.addStretch()
         button_layout.addWidget(self.add_component_button)
         button_layout.addWidget(self.remove_component_button)
+        button_layout.addWidget(self.import_button)
+        button_layout.addWidget(self.export_button)
         button_layout.addStretch()
         self.layout.addLayout(button_layout)
 
@@ -502,105 +4003,68 @@ class InventoryTab(QWidget):
         self.save_button.clicked.connect(self.save_data)
         self.layout.addWidget(self.save_button)
 
-    def load_inventory_to_table(self):
-        for item in self.data.get("inventory", []):
-            self.add_table_row(item["component"], item["quantity"], item.get("price", "0"))
-
-    def add_table_row(self, component, quantity, price="0"):
-        row_position = self.inventory_table.rowCount()
-        self.inventory_table.insertRow(row_position)
-
-        component_item = QTableWidgetItem(component)
-        component_item.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)  # Center align the text
-        self.inventory_table.setItem(row_position, 0, component_item)
-
-        quantity_item = QTableWidgetItem(str(quantity))
-        quantity_item.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)  # Center align the text
-        self.inventory_table.setItem(row_position, 1, quantity_item)
-
-        price_item = QTableWidgetItem(str(price))  # New price item
-        price_item.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)  # Center align the text
-        self.inventory_table.setItem(row_position, 2, price_item)
-
-        # Create the widget to hold the action buttons
-        button_widget = QWidget()
-        button_layout = QHBoxLayout(button_widget)
-        button_layout.setContentsMargins(0, 0, 0, 0)
-        button_layout.setSpacing(5)  # Add spacing between buttons
-
-        # Create and style the plus and minus buttons
-        plus_button = QPushButton("+")
-        plus_button.setFixedSize(40, 40)  # Increased size for better readability
-        plus_button.setStyleSheet("background-color: #4CAF50; color: white; border-radius: 5px; font-weight: bold;")
-        plus_button.clicked.connect(lambda: self.change_quantity(row_position, 1))
-
-        minus_button = QPushButton("-")
-        minus_button.setFixedSize(40, 40)  # Increased size for better readability
-        minus_button.setStyleSheet("background-color: #f44336; color: white; border-radius: 5px; font-weight: bold;")
-        minus_button.clicked.connect(lambda: self.change_quantity(row_position, -1))
-
-        # Add buttons to the layout
-        button_layout.addWidget(plus_button)
-        button_layout.addWidget(minus_button)
-
-        # Center align the buttons in the widget
-        button_layout.setAlignment(Qt.AlignCenter)
-        self.inventory_table.setCellWidget(row_position, 3, button_widget)  # Updated index for actions column
-
     def add_component(self):
         component_name = self.component_input.text()
         quantity = self.quantity_input.text()
         price = self.price_input.text()  # Retrieve the price input
         
-        if not component_name or not quantity.isdigit() or not price.isdigit():
+        min_quantity = self.min_quantity_input.text().strip()
+
+        if not component_name or not quantity.isdigit() or not price.isdigit() or (min_quantity and not min_quantity.isdigit()):
             QMessageBox.warning(self, "خطأ في الإدخال", "يرجى إدخال اسم مكون صحيح وكمية وسعر.")
             return
 
-        self.add_table_row(component_name, quantity, price)
-        self.data["inventory"].append({"component": component_name, "quantity": int(quantity), "price": int(price)})
+        component = {"component": component_name, "quantity": int(quantity), "price": int(price)}
+        if min_quantity:
+            component["min_quantity"] = int(min_quantity)
+        self.store.add("inventory", component)
         
         self.component_input.clear()
         self.quantity_input.clear()
         self.price_input.clear()  # Clear the price input after adding
+        self.min_quantity_input.clear()
 
     def remove_component(self):
-        current_row = self.inventory_table.currentRow()
-        if current_row != -1:
-            component_name = self.inventory_table.item(current_row, 0).text()
-            self.data["inventory"] = [item for item in self.data["inventory"] if item["component"] != component_name]
-            self.inventory_table.removeRow(current_row)
+        row = current_row(self.inventory_table)
+        if row != -1:
+            component = self.inventory_model.record(row)
+            component_name = component["component"]
+            self.store.remove("inventory", component["id"])
             QMessageBox.information(self, "تم حذف المكون", f"تم حذف المكون: {component_name}")
         else:
             QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار مكون للحذف.")
 
     def change_quantity(self, row, change):
-        current_item = self.inventory_table.item(row, 1)
-        if current_item:
-            current_quantity = int(current_item.text())
-            new_quantity = current_quantity + change
+        if row < self.inventory_model.rowCount():
+            component = self.inventory_model.record(row)
+            new_quantity = int(component["quantity"]) + change
             
             if new_quantity < 0:
                 QMessageBox.warning(self, "خطأ", "لا يمكن أن تكون الكمية أقل من صفر.")
                 return
             
-            self.inventory_table.item(row, 1).setText(str(new_quantity))
-            component_name = self.inventory_table.item(row, 0).text()
+            post_stock_movement(self.store, [(component["id"], change)], STOCK_ADJUSTMENT)
+
+    def reject_min_quantity_edit(self, row, column):
+        QMessageBox.warning(self, "خطأ في الإدخال", "الحد الأدنى يجب أن يكون عددًا صحيحًا، أو فارغًا لإلغاء التنبيه.")
 
-            for item in self.data["inventory"]:
-                if item["component"] == component_name:
-                    item["quantity"] = new_quantity
+    def show_low_stock(self):
+        names = sorted(self.store.get("inventory", component_id)["component"] for component_id in self.store.low_stock.low)
+        self.low_stock_label.setText(f"مخزون منخفض: {'، '.join(names)}" if names else "")
+        self.low_stock_label.setVisible(bool(names))
 
     def save_data(self):
-        save_data(self.data)
+        self.store.flush()
         QMessageBox.information(self, "تم الحفظ", "تم حفظ بيانات المخزون بنجاح.")
 
 
 
 
 class EarningsTab(QWidget):
-    def __init__(self, data):
+    def __init__(self, store):
         super().__init__()
-        self.data = data
+        self.store = store
+        self.data = store.data
 
         # Set layout direction to right-to-left for Arabic language support
         self.setLayoutDirection(Qt.RightToLeft)
@@ -612,10 +4076,24 @@ class EarningsTab(QWidget):
         self.total_earnings_label.setStyleSheet("font-size: 18px; font-weight: bold; color: #333;")
         self.layout.addWidget(self.total_earnings_label)
 
+        # Month filter; past months are listed from the running totals and only loaded when picked
+        month_layout = QHBoxLayout()
+        month_layout.addWidget(QLabel("الشهر:"))
+        self.month_combo = QComboBox()
+        self.month_combo.currentIndexChanged.connect(self.filter_month)
+        month_layout.addWidget(self.month_combo)
+        month_layout.addStretch()
+        self.layout.addLayout(month_layout)
+
         # Earnings table with styled header and rows
-        self.earnings_table = QTableWidget()
-        self.earnings_table.setColumnCount(2)
-        self.earnings_table.setHorizontalHeaderLabels(["التاريخ", "الأرباح"])
+        self.earnings_model = RecordTableModel(store, "earnings", [
+            TableColumn("التاريخ", "date"),
+            TableColumn("الأرباح", "amount", text=lambda amount: f"${amount:.2f}"),
+        ], font=QFont("Arial", 12, QFont.Bold))
+
+        self.earnings_table = QTableView()
+        self.earnings_table.setModel(self.earnings_model)
+        self.earnings_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.earnings_table.setMinimumSize(800, 400)
         self.earnings_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
@@ -632,15 +4110,20 @@ class EarningsTab(QWidget):
         self.earnings_table.verticalHeader().setDefaultSectionSize(40)
         self.earnings_table.setAlternatingRowColors(True)
         self.earnings_table.setStyleSheet("""
-            QTableWidget { border: 1px solid #ddd; gridline-color: #ddd; font-size: 14px; }
-            QTableWidget::item { padding: 8px; text-align: center; }  /* Center-align text in items */
-            QTableWidget::item:alternate { background-color: #f9f9f9; }
-            QTableWidget::item:selected { background-color: #d9edf7; }
-            QTableWidget::item:hover { background-color: #f5f5f5; }
+            QTableView { border: 1px solid #ddd; gridline-color: #ddd; font-size: 14px; }
+            QTableView::item { padding: 8px; text-align: center; }  /* Center-align text in items */
+            QTableView::item:alternate { background-color: #f9f9f9; }
+            QTableView::item:selected { background-color: #d9edf7; }
+            QTableView::item:hover { background-color: #f5f5f5; }
         """)
 
         self.layout.addWidget(self.earnings_table)
         self.load_earnings_to_table()
+        self.refresh_months()
+        store.subscribe(self.on_store_change)
+
+        # Scrolling up past the oldest loaded earning brings in the month before it
+        self.earnings_table.verticalScrollBar().valueChanged.connect(self.load_older_month)
 
         # Horizontal layout for buttons
         button_layout = QHBoxLayout()
@@ -665,60 +4148,67 @@ class EarningsTab(QWidget):
 
         self.setLayout(self.layout)
 
+    @traced
     def load_earnings_to_table(self):
-        total_earnings = 0
-        self.earnings_table.setRowCount(0)  # Clear the table before loading
-        for earning in self.data.get("earnings", []):
-            row_position = self.earnings_table.rowCount()
-            self.earnings_table.insertRow(row_position)
-
-            date_item = QTableWidgetItem(earning["date"])
-            date_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)  # Center-align text
-            date_item.setFont(QFont("Arial", 12, QFont.Bold))  # Set font to bold and size 12
-            self.earnings_table.setItem(row_position, 0, date_item)
-
-            amount_item = QTableWidgetItem(f"${earning['amount']:.2f}")
-            amount_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)  # Center-align text
-            amount_item.setFont(QFont("Arial", 12, QFont.Bold))  # Set font to bold and size 12
-            self.earnings_table.setItem(row_position, 1, amount_item)
-
-            total_earnings += earning["amount"]
+        self.update_total_earnings(self.store.aggregates.total)
 
-        self.update_total_earnings(total_earnings)
+    def add_earning(self, amount, package=None, package_id=None, customer_id=None, quantity=1):
+        return record_earning(self.store, amount, package, package_id, customer_id, quantity)
 
-    def add_earning(self, amount):
-        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        earning_data = {"date": date, "amount": float(amount)}
-        self.data["earnings"].append(earning_data)
-
-        row_position = self.earnings_table.rowCount()
-        self.earnings_table.insertRow(row_position)
-
-        date_item = QTableWidgetItem(date)
-        date_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)  # Center-align text
-        date_item.setFont(QFont("Arial", 12, QFont.Bold))  # Set font to bold and size 12
-        self.earnings_table.setItem(row_position, 0, date_item)
-
-        amount_item = QTableWidgetItem(f"${float(amount):.2f}")
-        amount_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)  # Center-align text
-        amount_item.setFont(QFont("Arial", 12, QFont.Bold))  # Set font to bold and size 12
-        self.earnings_table.setItem(row_position, 1, amount_item)
+    def on_store_change(self, entry, position):
+        # Checkouts from the packages tab land here too
+        if entry["c"] != "earnings":
+            return
+        self.update_total_earnings(self.store.aggregates.total)
+        if len(self.store.aggregates.by_month) != self.month_combo.count() - 1:
+            self.refresh_months()
+        elif self.earnings_model.rows is not None:
+            self.filter_month()
+
+    def refresh_months(self):
+        selected = self.month_combo.currentData()
+        self.month_combo.blockSignals(True)
+        self.month_combo.clear()
+        self.month_combo.addItem("كل الأشهر", None)
+        for month, (amount, count) in sorted(self.store.aggregates.by_month.items(), reverse=True):
+            self.month_combo.addItem(f"{ARABIC_MONTHS[int(month[5:7]) - 1]} {month[:4]} ({count}) ${amount:.2f}", month)
+        index = self.month_combo.findData(selected)
+        self.month_combo.setCurrentIndex(max(index, 0))
+        self.month_combo.blockSignals(False)
+        self.filter_month()
+
+    @pyqtSlot()
+    @traced
+    def filter_month(self):
+        month = self.month_combo.currentData()
+        if month is None:
+            if self.earnings_model.rows is not None:
+                self.earnings_model.set_filter(None)
+            return
+        self.store.load_month(month)
+        self.earnings_model.set_filter(self.store.data["earnings"].positions_between(*month_bounds(month)))
 
-        # Update total earnings
-        total_earnings = sum(earning["amount"] for earning in self.data.get("earnings", []))
-        self.update_total_earnings(total_earnings)
+    def load_older_month(self, value):
+        scroll_bar = self.earnings_table.verticalScrollBar()
+        months = self.store.archive.unloaded_months()
+        if value != scroll_bar.minimum() or not months or self.earnings_model.rows is not None:
+            return
+        # The loaded month lands above the rows on screen; keep those in view
+        before = self.earnings_model.rowCount()
+        self.store.load_month(months[-1])
+        self.earnings_table.updateGeometries()
+        scroll_bar.setValue(scroll_bar.minimum() + self.earnings_model.rowCount() - before)
 
     def update_total_earnings(self, total):
-        self.total_earnings_label.setText(f"إجمالي الأرباح: ${total:.2f}")
+        today = self.store.aggregates.day_total(datetime.now().strftime("%Y-%m-%d"))
+        self.total_earnings_label.setText(f"إجمالي الأرباح: ${total:.2f}    أرباح اليوم: ${today:.2f}")
 
     def remove_earning(self):
-        current_row = self.earnings_table.currentRow()
-        if current_row != -1:
-            amount = float(self.earnings_table.item(current_row, 1).text().replace("$", ""))
-            self.data["earnings"].pop(current_row)
-            self.earnings_table.removeRow(current_row)
-            total_earnings = sum(earning["amount"] for earning in self.data.get("earnings", []))
-            self.update_total_earnings(total_earnings)
+        row = current_row(self.earnings_table)
+        if row != -1:
+            earning = self.earnings_model.record(row)
+            amount = earning["amount"]
+            self.store.remove("earnings", earning["id"])
             QMessageBox.information(self, "تمت الإزالة", f"تمت إزالة ربح قدره ${amount:.2f} بنجاح.")
         else:
             QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار ربح للإزالة.")
@@ -727,17 +4217,48 @@ class EarningsTab(QWidget):
         confirm = QMessageBox.question(self, "تأكيد الإزالة", "هل أنت متأكد أنك تريد إزالة جميع الأرباح؟", 
                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if confirm == QMessageBox.Yes:
-            self.data["earnings"].clear()
-            self.earnings_table.setRowCount(0)
-            self.update_total_earnings(0)
+            self.store.clear("earnings")
             QMessageBox.information(self, "تمت الإزالة", "تمت إزالة جميع الأرباح.")
-            
-            
-            
+
+
+
+class CustomerHistoryDialog(QDialog):
+    """ Every visit of one customer, newest first, with what they came to """
+
+    def __init__(self, store, customer, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"سجل العميل: {customer['name']}")
+        self.setLayoutDirection(Qt.RightToLeft)
+        self.setMinimumSize(700, 450)
+
+        history = customer_earnings(store, customer["id"])
+        self.history_model = ReportTableModel(["التاريخ", "الباقة", "الكمية", "المبلغ"], [
+            (earning["date"], earning.get("package", ""), str(earning.get("quantity", 1)), f"{earning['amount']:.2f}")
+            for earning in reversed(history)])
+        history_table = QTableView()
+        history_table.setModel(self.history_model)
+        history_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        history_table.horizontalHeader().setStretchLastSection(True)
+        history_table.setColumnWidth(0, 200)
+        history_table.setColumnWidth(1, 200)
+
+        total_label = QLabel(f"الإجمالي: ${store.aggregates.customer_total(customer['id']):.2f} في {len(history)} عملية")
+        total_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #333;")
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(total_label)
+        layout.addWidget(history_table)
+        layout.addWidget(buttons)
+
+
 class CustomersTab(QWidget):
-    def __init__(self, data):
+    def __init__(self, store):
         super().__init__()
-        self.data = data
+        self.store = store
+        self.data = store.data
 
         # Set layout direction to right-to-left
         self.setLayoutDirection(Qt.RightToLeft)
@@ -745,14 +4266,26 @@ class CustomersTab(QWidget):
         self.layout = QVBoxLayout()
 
         # Customers table with enhanced style and layout
-        self.customers_table = QTableWidget()
-        self.customers_table.setColumnCount(4)
-        self.customers_table.setHorizontalHeaderLabels(["الاسم", "رقم الموبايل", "عدد الزيارات", "الاجرائات"])
+        self.customers_model = RecordTableModel(store, "customers", [
+            TableColumn("الاسم", "name"),
+            TableColumn("رقم الموبايل", "mobile"),
+            TableColumn("عدد الزيارات", "visits", default=0),
+            # All-time spending, read from the running totals by the customer's id
+            TableColumn("إجمالي المدفوع", "id", text=lambda customer_id: f"{store.aggregates.customer_total(customer_id):.2f}"),
+            TableColumn("الاجرائات", None),
+        ])
+
+        self.customers_table = QTableView()
+        self.customers_table.setModel(self.customers_model)
+        self.visits_stepper = StepperDelegate(self.customers_table)
+        self.visits_stepper.stepped.connect(self.change_visits)
+        self.customers_table.setItemDelegateForColumn(4, self.visits_stepper)
+        self.customers_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.customers_table.setMinimumSize(800, 400)
         self.customers_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
         # Set equal column widths
-        for i in range(4):
+        for i in range(5):
             self.customers_table.setColumnWidth(i, 200)  # Adjust width as needed
 
         # Style the header
@@ -764,7 +4297,7 @@ class CustomersTab(QWidget):
         self.customers_table.verticalHeader().setDefaultSectionSize(50)  # Set row height
         self.customers_table.setAlternatingRowColors(True)
         self.customers_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 font-size: 18px;
                 border: 1px solid #ddd;
                 gridline-color: #ddd;
@@ -777,32 +4310,37 @@ class CustomersTab(QWidget):
                 font-weight: bold;
                 padding: 15px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 10px;
                 min-width: 100px;
                 min-height: 50px;
                 font-weight: bold;
                 text-align: center;
             }
-            QTableWidget::item:alternate {
+            QTableView::item:alternate {
                 background-color: #f9f9f9;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #d9edf7;
             }
-            QTableWidget::item:hover {
+            QTableView::item:hover {
                 background-color: #f5f5f5;
             }
         """)
 
         self.layout.addWidget(self.customers_table)
-        self.load_customers_to_table()
 
         # Search bar
         self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("ابحث عن عميل")
+        self.search_input.setPlaceholderText("ابحث عن عميل بالاسم أو رقم الموبايل")
         self.search_input.setStyleSheet("font-size: 20px; padding: 8px;")  # Make the text more readable
-        self.search_input.textChanged.connect(self.search_customer)
+        self.search_index = CustomerSearchIndex(store)
+        store.subscribe(self.on_store_change)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.search_customer)
+        self.search_input.textChanged.connect(lambda _: self.search_timer.start())
         self.layout.addWidget(self.search_input, alignment=Qt.AlignTop | Qt.AlignCenter)
 
         self.name_input = QLineEdit()
@@ -819,6 +4357,11 @@ class CustomersTab(QWidget):
         self.remove_customer_button.setStyleSheet("background-color: #f44336; color: white; border: none; border-radius: 5px; font-weight: bold; font-size: 16px;")
         self.remove_customer_button.clicked.connect(self.remove_customer)
 
+        self.history_button = QPushButton("سجل العميل")
+        self.history_button.setFixedSize(QSize(220, 50))
+        self.history_button.setStyleSheet("background-color: #FF9800; color: white; border: none; border-radius: 5px; font-weight: bold; font-size: 16px;")
+        self.history_button.clicked.connect(self.show_history)
+
         self.save_changes_button = QPushButton("احفظ التغييرات")
         self.save_changes_button.setFixedSize(QSize(220, 50))
         self.save_changes_button.setStyleSheet("background-color: #2196F3; color: white; border: none; border-radius: 5px; font-weight: bold; font-size: 16px;")
@@ -833,9 +4376,14 @@ class CustomersTab(QWidget):
         button_layout = QVBoxLayout()
 
         # Centering the "أضف عميل" and "احذف عميل" buttons side by side
+        self.import_button, self.export_button = transfer_buttons(self, store, "customers", self.customers_table)
+
         center_buttons_layout = QHBoxLayout()
         center_buttons_layout.addWidget(self.add_customer_button)
         center_buttons_layout.addWidget(self.remove_customer_button)
+        center_buttons_layout.addWidget(self.history_button)
+        center_buttons_layout.addWidget(self.import_button)
+        center_buttons_layout.addWidget(self.export_button)
         center_buttons_layout.setAlignment(Qt.AlignCenter)
 
         # Add the save button to the bottom left
@@ -845,65 +4393,40 @@ class CustomersTab(QWidget):
         self.layout.addLayout(button_layout)
         self.setLayout(self.layout)
 
+    @traced
     def search_customer(self):
-        search_text = self.search_input.text().lower()
-        for row in range(self.customers_table.rowCount()):
-            item = self.customers_table.item(row, 0)  # Assuming name is in the first column
-            self.customers_table.setRowHidden(row, search_text not in item.text().lower())
+        self.search_timer.stop()
+        self.customers_model.set_filter(self.search_index.search(self.search_input.text()))
+
+    def on_store_change(self, entry, position):
+        # A filtered view holds positions, so it is re-run after every customer change
+        if entry["c"] == "customers" and self.customers_model.rows is not None:
+            self.search_customer()
+        elif entry["c"] == "earnings" and entry["op"] != "load":
+            self.customers_model.refresh_column(3)
+
+    def show_history(self):
+        row = current_row(self.customers_table)
+        if row == -1:
+            QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار عميل لعرض سجله.")
+            return
+        CustomerHistoryDialog(self.store, self.customers_model.record(row), self).exec_()
 
-    def load_customers_to_table(self):
-        for customer in self.data.get("customers", []):
-            name = customer["name"]
-            mobile = customer["mobile"]
-            visits = customer.get("visits", 0)  # Default to 0 if not in data
-            self.add_table_row(name, mobile, visits)
-
-    def add_table_row(self, name, mobile, visits=0):
-        row_position = self.customers_table.rowCount()
-        self.customers_table.insertRow(row_position)
-
-        name_item = QTableWidgetItem(name)
-        name_item.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)
-        self.customers_table.setItem(row_position, 0, name_item)
-
-        mobile_item = QTableWidgetItem(mobile)
-        mobile_item.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)
-        self.customers_table.setItem(row_position, 1, mobile_item)
-
-        visits_item = QTableWidgetItem(str(visits))
-        visits_item.setTextAlignment(Qt.AlignCenter | Qt.AlignVCenter)
-        self.customers_table.setItem(row_position, 2, visits_item)
-
-        # Create action buttons
-        button_widget = QWidget()
-        button_layout = QHBoxLayout(button_widget)
-        button_layout.setContentsMargins(0, 0, 0, 0)
-        button_layout.setSpacing(5)
-
-        plus_button = QPushButton("+")
-        plus_button.setFixedSize(40, 40)
-        plus_button.setStyleSheet("background-color: #4CAF50; color: white; border-radius: 5px; font-weight: bold;")
-        plus_button.clicked.connect(lambda _, row=row_position: self.increment_visits(row))
-
-        minus_button = QPushButton("-")
-        minus_button.setFixedSize(40, 40)
-        minus_button.setStyleSheet("background-color: #f44336; color: white; border-radius: 5px; font-weight: bold;")
-        minus_button.clicked.connect(lambda _, row=row_position: self.decrement_visits(row))
-
-        button_layout.addWidget(plus_button)
-        button_layout.addWidget(minus_button)
-        button_layout.setAlignment(Qt.AlignCenter)
-        self.customers_table.setCellWidget(row_position, 3, button_widget)
+    def change_visits(self, row, change):
+        if change > 0:
+            self.increment_visits(row)
+        else:
+            self.decrement_visits(row)
 
     def increment_visits(self, row):
-        visits_item = self.customers_table.item(row, 2)
-        current_visits = int(visits_item.text())
-        visits_item.setText(str(current_visits + 1))
+        customer = self.customers_model.record(row)
+        self.store.update("customers", customer["id"], {"visits": int(customer.get("visits", 0)) + 1})
 
     def decrement_visits(self, row):
-        visits_item = self.customers_table.item(row, 2)
-        current_visits = int(visits_item.text())
-        visits_item.setText(str(max(current_visits - 1, 0)))  # Prevent negative values
+        customer = self.customers_model.record(row)
+        current_visits = int(customer.get("visits", 0))
+        if current_visits > 0:  # Prevent negative values
+            self.store.update("customers", customer["id"], {"visits": current_visits - 1})
 
     def add_customer(self):
         name = self.name_input.text()
@@ -913,42 +4436,33 @@ class CustomersTab(QWidget):
             QMessageBox.warning(self, "خطأ في الإدخال", "يرجى إدخال اسم ورقم موبايل صحيح.")
             return
 
-        self.add_table_row(name, mobile)
-        self.data["customers"].append({"name": name, "mobile": mobile, "visits": 0})
+        self.store.add("customers", {"name": name, "mobile": mobile, "visits": 0})
 
         self.name_input.clear()
         self.mobile_input.clear()
 
     def remove_customer(self):
-        current_row = self.customers_table.currentRow()
-        if current_row != -1:
-            name = self.customers_table.item(current_row, 0).text()
-            self.data["customers"] = [customer for customer in self.data["customers"] if customer["name"] != name]
-            self.customers_table.removeRow(current_row)
+        row = current_row(self.customers_table)
+        if row != -1:
+            customer = self.customers_model.record(row)
+            name = customer["name"]
+            self.store.remove("customers", customer["id"])
             QMessageBox.information(self, "تم حذف العميل", f"تم حذف العميل: {name}")
         else:
             QMessageBox.warning(self, "خطأ في الاختيار", "يرجى اختيار عميل للحذف.")
 
     def save_changes(self):
-        # Update visits in the data dictionary
-        for row in range(self.customers_table.rowCount()):
-            name = self.customers_table.item(row, 0).text()
-            visits = int(self.customers_table.item(row, 2).text())
-            for customer in self.data["customers"]:
-                if customer["name"] == name:
-                    customer["visits"] = visits
+        # Visit changes are journaled as they happen, make sure they reached the disk
+        self.store.flush()
 
         QMessageBox.information(self, "حفظ التغييرات", "تم حفظ التغييرات بنجاح.")
         
         
 class MonthlyEarningsTab(QWidget):
-    def __init__(self, data):
+    def __init__(self, store):
         super().__init__()
-        self.data = data
-
-        # Ensure 'monthly_earnings' key exists in data
-        if "monthly_earnings" not in self.data:
-            self.data["monthly_earnings"] = []
+        self.store = store
+        self.data = store.data
 
         # Set layout direction to right-to-left for Arabic language support
         self.setLayoutDirection(Qt.RightToLeft)
@@ -956,9 +4470,14 @@ class MonthlyEarningsTab(QWidget):
         self.layout = QVBoxLayout()
 
         # Table for displaying monthly earnings (remove the "إجراء" column)
-        self.earnings_table = QTableWidget()
-        self.earnings_table.setColumnCount(2)  # Remove the "إجراء" column
-        self.earnings_table.setHorizontalHeaderLabels(["الشهر", "الربح"])
+        self.earnings_model = RecordTableModel(store, "monthly_earnings", [
+            TableColumn("الشهر", "month"),
+            TableColumn("الربح", "amount"),
+        ], font=QFont("Arial", 12, QFont.Bold))
+
+        self.earnings_table = QTableView()
+        self.earnings_table.setModel(self.earnings_model)
+        self.earnings_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.earnings_table.setMinimumSize(800, 400)
         self.earnings_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
@@ -975,17 +4494,47 @@ class MonthlyEarningsTab(QWidget):
         self.earnings_table.verticalHeader().setDefaultSectionSize(40)
         self.earnings_table.setAlternatingRowColors(True)
         self.earnings_table.setStyleSheet("""
-            QTableWidget { border: 1px solid #ddd; gridline-color: #ddd; font-size: 14px; }
-            QTableWidget::item { padding: 8px; text-align: center; }
-            QTableWidget::item:alternate { background-color: #f9f9f9; }
-            QTableWidget::item:selected { background-color: #d9edf7; }
-            QTableWidget::item:hover { background-color: #f5f5f5; }
+            QTableView { border: 1px solid #ddd; gridline-color: #ddd; font-size: 14px; }
+            QTableView::item { padding: 8px; text-align: center; }
+            QTableView::item:alternate { background-color: #f9f9f9; }
+            QTableView::item:selected { background-color: #d9edf7; }
+            QTableView::item:hover { background-color: #f5f5f5; }
         """)
 
         self.layout.addWidget(self.earnings_table)
 
-        # Load existing earnings data into the table
-        self.load_earnings_table()
+        # Earnings computed from the checkout ledger, next to the manual entries
+        self.rollup_label = QLabel("الأرباح المحسوبة من عمليات الدفع:")
+        self.rollup_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #333;")
+
+        self.period_dropdown = QComboBox()
+        self.period_dropdown.addItem("شهري", "month")
+        self.period_dropdown.addItem("أسبوعي", "week")
+        self.period_dropdown.addItem("يومي", "day")
+        self.period_dropdown.setStyleSheet("padding: 8px; font-size: 16px;")
+        self.period_dropdown.currentIndexChanged.connect(
+            lambda _: self.rollup_model.set_period(self.period_dropdown.currentData()))
+
+        self.rollup_model = RollupTableModel(store)
+        self.rollup_table = QTableView()
+        self.rollup_table.setModel(self.rollup_model)
+        self.rollup_table.setMinimumSize(800, 250)
+        self.rollup_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        for column in range(self.rollup_model.columnCount()):
+            self.rollup_table.setColumnWidth(column, 200)
+        rollup_header = self.rollup_table.horizontalHeader()
+        rollup_header.setStyleSheet("QHeaderView::section { background-color: #333; color: white; font-weight: bold; padding: 12px; }")
+        rollup_header.setStretchLastSection(True)
+        self.rollup_table.verticalHeader().setDefaultSectionSize(40)
+        self.rollup_table.setAlternatingRowColors(True)
+        self.rollup_table.setStyleSheet(self.earnings_table.styleSheet())
+
+        rollup_layout = QHBoxLayout()
+        rollup_layout.addWidget(self.rollup_label)
+        rollup_layout.addWidget(self.period_dropdown)
+        rollup_layout.addStretch()
+        self.layout.addLayout(rollup_layout)
+        self.layout.addWidget(self.rollup_table)
 
         # Text fields and buttons moved to bottom
         self.monthly_earnings_label = QLabel("أرباح الشهر:")
@@ -996,8 +4545,7 @@ class MonthlyEarningsTab(QWidget):
         self.earnings_input.setStyleSheet("padding: 8px; font-size: 14px;")
 
         self.month_dropdown = QComboBox()
-        months_arabic = ["يناير", "فبراير", "مارس", "أبريل", "مايو", "يونيو", "يوليو", "أغسطس", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر"]
-        self.month_dropdown.addItems(months_arabic)
+        self.month_dropdown.addItems(ARABIC_MONTHS)
         self.month_dropdown.setStyleSheet("padding: 8px; font-size: 18px;")
 
         self.add_earnings_button = QPushButton("إضافة الربح")
@@ -1035,50 +4583,26 @@ class MonthlyEarningsTab(QWidget):
             try:
                 earnings_amount = float(earnings_value)
                 entry = {"month": selected_month, "amount": earnings_amount}
-                self.data["monthly_earnings"].append(entry)  # Add to data
+                self.store.add("monthly_earnings", entry)  # Add to data
                 self.earnings_input.clear()  # Clear the input field after adding
                 QMessageBox.information(self, "نجاح", f"تمت إضافة أرباح {earnings_amount} لشهر {selected_month} بنجاح.")
-                self.add_earning_to_table(selected_month, earnings_amount)  # Add entry to table
             except ValueError:
                 QMessageBox.warning(self, "خطأ في المدخلات", "يرجى إدخال قيمة عددية صحيحة للأرباح.")
         else:
             QMessageBox.warning(self, "خطأ في المدخلات", "يرجى ملء حقل الأرباح قبل إضافة الربح.")
 
-    def load_earnings_table(self):
-        """ Load earnings data into the table """
-        for entry in self.data["monthly_earnings"]:
-            self.add_earning_to_table(entry["month"], entry["amount"])
-
-    def add_earning_to_table(self, month, amount):
-        """ Add an earning entry to the table """
-        row_position = self.earnings_table.rowCount()
-        self.earnings_table.insertRow(row_position)
-
-        month_item = QTableWidgetItem(month)
-        month_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-        month_item.setFont(QFont("Arial", 12, QFont.Bold))
-        self.earnings_table.setItem(row_position, 0, month_item)
-
-        amount_item = QTableWidgetItem(str(amount))
-        amount_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-        amount_item.setFont(QFont("Arial", 12, QFont.Bold))
-        self.earnings_table.setItem(row_position, 1, amount_item)
-
     def remove_selected_earning(self):
         """ Remove the selected earning from the table and data """
-        selected_row = self.earnings_table.currentRow()  # Get the selected row
+        selected_row = current_row(self.earnings_table)  # Get the selected row
         if selected_row >= 0:
             # Get the month and amount of the selected row
-            month = self.earnings_table.item(selected_row, 0).text() if self.earnings_table.item(selected_row, 0) else None
-            amount = self.earnings_table.item(selected_row, 1).text() if self.earnings_table.item(selected_row, 1) else None
+            entry = self.earnings_model.record(selected_row)
+            month = entry.get("month")
+            amount = entry.get("amount")
             
-            if month and amount:
-                # Remove from data
-                self.data["monthly_earnings"] = [
-                    entry for entry in self.data["monthly_earnings"] if entry["month"] != month or str(entry["amount"]) != amount
-                ]
-                # Remove from table
-                self.earnings_table.removeRow(selected_row)
+            if month and amount is not None:
+                # Remove from data and table
+                self.store.remove("monthly_earnings", entry["id"])
                 QMessageBox.information(self, "تم الحذف", f"تمت إزالة أرباح {amount} لشهر {month} بنجاح.")
             else:
                 QMessageBox.warning(self, "خطأ", "لم يتم العثور على العناصر للحذف.")
@@ -1088,9 +4612,10 @@ class MonthlyEarningsTab(QWidget):
 
 
 class ExpensesTab(QWidget):
-    def __init__(self, data):
+    def __init__(self, store):
         super().__init__()
-        self.data = data
+        self.store = store
+        self.data = store.data
         self.layout = QVBoxLayout()
 
         # Set layout direction to right-to-left
@@ -1147,9 +4672,14 @@ class ExpensesTab(QWidget):
         self.remove_selected_button.clicked.connect(self.remove_selected)
 
         # Expenses Table
-        self.expenses_table = QTableWidget()
-        self.expenses_table.setColumnCount(2)
-        self.expenses_table.setHorizontalHeaderLabels(["الوصف", "المبلغ"])
+        self.expenses_model = RecordTableModel(store, "expenses", [
+            TableColumn("الوصف", "description"),
+            TableColumn("المبلغ", "amount"),
+            TableColumn("التاريخ", "date"),
+        ])
+
+        self.expenses_table = QTableView()
+        self.expenses_table.setModel(self.expenses_model)
         self.expenses_table.setLayoutDirection(Qt.RightToLeft)
 
         # Table styling
@@ -1168,12 +4698,12 @@ class ExpensesTab(QWidget):
         self.expenses_table.verticalHeader().setDefaultSectionSize(50)
         self.expenses_table.setAlternatingRowColors(True)
         self.expenses_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 font-size: 16px;
                 border: 1px solid #ddd;
                 gridline-color: #ddd;
             }
-            QTableWidget::item {
+            QTableView::item {
                 text-align: center;
                 font-weight: bold;
             }
@@ -1182,27 +4712,18 @@ class ExpensesTab(QWidget):
         self.layout.addWidget(self.expenses_table)
         self.layout.addLayout(form_layout)
 
+        self.import_button, self.export_button = transfer_buttons(self, store, "expenses", self.expenses_table)
+
         button_layout = QHBoxLayout()
         button_layout.addStretch()
         button_layout.addWidget(self.add_expense_button)
         button_layout.addWidget(self.remove_selected_button)
+        button_layout.addWidget(self.import_button)
+        button_layout.addWidget(self.export_button)
         button_layout.addStretch()
         self.layout.addLayout(button_layout)
 
         self.setLayout(self.layout)
-        self.load_expenses_to_table()   
-        
-
-    def load_expenses_to_table(self):
-        for expense in self.data.get("expenses", []):
-            row_position = self.expenses_table.rowCount()
-            self.expenses_table.insertRow(row_position)
-            description_item = QTableWidgetItem(expense["description"])
-            description_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-            self.expenses_table.setItem(row_position, 0, description_item)
-            amount_item = QTableWidgetItem(str(expense["amount"]))
-            amount_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-            self.expenses_table.setItem(row_position, 1, amount_item)
 
     def add_expense(self):
         description = self.description_input.text()
@@ -1218,17 +4739,9 @@ class ExpensesTab(QWidget):
             QMessageBox.warning(self, "خطأ في الإدخال", "يرجى إدخال مبلغ صحيح.")
             return
 
-        expense_data = {"description": description, "amount": amount}
-        self.data["expenses"].append(expense_data)
-
-        row_position = self.expenses_table.rowCount()
-        self.expenses_table.insertRow(row_position)
-        description_item = QTableWidgetItem(description)
-        description_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-        self.expenses_table.setItem(row_position, 0, description_item)
-        amount_item = QTableWidgetItem(str(amount))
-        amount_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-        self.expenses_table.setItem(row_position, 1, amount_item)
+        expense_data = {"description": description, "amount": amount,
+                        "date": datetime.now().strftime(DATE_FORMAT)}
+        self.store.add("expenses", expense_data)
 
         QMessageBox.information(self, "تمت الإضافة", f"تمت إضافة المصروف:\nالوصف: {description}\nالمبلغ: {amount}")
         self.description_input.clear()
@@ -1241,18 +4754,10 @@ class ExpensesTab(QWidget):
             rows_to_remove = set(index.row() for index in selected_indexes if index.column() == 0)
 
             if rows_to_remove:
-                for row in sorted(rows_to_remove, reverse=True):
-                    # Remove data from the data source
-                    description = self.expenses_table.item(row, 0).text()
-                    amount = self.expenses_table.item(row, 1).text()
-
-                    self.data["expenses"] = [
-                        expense for expense in self.data["expenses"]
-                        if not (expense["description"] == description and str(expense["amount"]) == amount)
-                    ]
-
-                    # Remove row from the table
-                    self.expenses_table.removeRow(row)
+                with bulk_update(self.expenses_table), self.store.batch():
+                    for expense in [self.expenses_model.record(row) for row in rows_to_remove]:
+                        # Remove data from the data source, the table follows the model
+                        self.store.remove("expenses", expense["id"])
 
                 QMessageBox.information(self, "تم الحذف", "تمت إزالة المصروفات المحددة.")
             else:
@@ -1262,8 +4767,293 @@ class ExpensesTab(QWidget):
 
 
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = BarbershopApp()
+class ReportTableModel(QAbstractTableModel):
+    """ Read-only table of already formatted report rows """
+
+    def __init__(self, headers=(), rows=()):
+        super().__init__()
+        self.headers = list(headers)
+        self.rows = list(rows)
+
+    def set_report(self, headers, rows):
+        self.beginResetModel()
+        self.headers = list(headers)
+        self.rows = list(rows)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            return self.rows[index.row()][index.column()]
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+
+class AnalyticsTab(QWidget):
+    REPORTS = [
+        ("hour", "الإيرادات حسب الساعة"),
+        ("weekday", "الإيرادات حسب يوم الأسبوع"),
+        ("day", "الإيرادات اليومية"),
+        ("packages", "أفضل الباقات"),
+        ("profit", "صافي الربح الشهري"),
+        ("inventory", "قيمة المخزون"),
+    ]
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.data = store.data
+        self.stale = True
+
+        # Set layout direction to right-to-left for Arabic language support
+        self.setLayoutDirection(Qt.RightToLeft)
+
+        self.layout = QVBoxLayout()
+
+        # Report and period selectors
+        selector_layout = QHBoxLayout()
+        selector_layout.addWidget(QLabel("التقرير:"))
+        self.report_combo = QComboBox()
+        for key, title in self.REPORTS:
+            self.report_combo.addItem(title, key)
+        self.report_combo.currentIndexChanged.connect(self.refresh)
+        selector_layout.addWidget(self.report_combo)
+        selector_layout.addWidget(QLabel("الفترة:"))
+        self.year_combo = QComboBox()
+        self.year_combo.currentIndexChanged.connect(self.refresh)
+        selector_layout.addWidget(self.year_combo)
+        selector_layout.addStretch()
+        self.layout.addLayout(selector_layout)
+
+        self.summary_label = QLabel()
+        self.summary_label.setStyleSheet("font-size: 18px; font-weight: bold; color: #333;")
+        self.layout.addWidget(self.summary_label)
+
+        self.report_model = ReportTableModel()
+        self.report_table = QTableView()
+        self.report_table.setModel(self.report_model)
+        self.report_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.report_table.setMinimumSize(800, 400)
+        self.report_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        # Style header
+        header = self.report_table.horizontalHeader()
+        header.setStyleSheet("QHeaderView::section { background-color: #333; color: white; font-weight: bold; padding: 12px; }")
+        header.setStretchLastSection(True)
+
+        # Row height and alternating colors with hover effect
+        self.report_table.verticalHeader().setDefaultSectionSize(40)
+        self.report_table.setAlternatingRowColors(True)
+        self.report_table.setStyleSheet("""
+            QTableView { border: 1px solid #ddd; gridline-color: #ddd; font-size: 14px; }
+            QTableView::item { padding: 8px; text-align: center; }  /* Center-align text in items */
+            QTableView::item:alternate { background-color: #f9f9f9; }
+            QTableView::item:selected { background-color: #d9edf7; }
+            QTableView::item:hover { background-color: #f5f5f5; }
+        """)
+        self.layout.addWidget(self.report_table)
+
+        self.setLayout(self.layout)
+        self.refresh_years()
+
+        # Reports are recomputed when the tab is next shown, not on every checkout
+        store.subscribe(self.on_store_change)
+
+    def refresh_years(self):
+        selected = self.year_combo.currentData()
+        self.year_combo.blockSignals(True)
+        self.year_combo.clear()
+        self.year_combo.addItem("كل الفترات", None)
+        for year in sorted({month[:4] for month in self.store.aggregates.by_month}, reverse=True):
+            self.year_combo.addItem(year, year)
+        self.year_combo.setCurrentIndex(max(self.year_combo.findData(selected), 0))
+        self.year_combo.blockSignals(False)
+
+    def on_store_change(self, entry, position):
+        if entry["op"] != "load":
+            self.stale = True
+            if self.isVisible():
+                self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale:
+            self.refresh()
+
+    def refresh(self):
+        self.stale = False
+        if self.year_combo.count() - 1 != len({month[:4] for month in self.store.aggregates.by_month}):
+            self.refresh_years()
+        report = self.report_combo.currentData()
+        year = self.year_combo.currentData()
+
+        if report == "hour":
+            headers = ["الساعة", "الإيرادات", "عدد العمليات"]
+            rows = [(f"{hour:02d}:00", f"{amount:.2f}", str(count))
+                    for hour, (amount, count) in enumerate(revenue_by_hour(self.store, year))]
+            summary = ""
+        elif report == "weekday":
+            headers = ["اليوم", "الإيرادات", "عدد العمليات"]
+            rows = [(ARABIC_WEEKDAYS[weekday], f"{amount:.2f}", str(count))
+                    for weekday, (amount, count) in enumerate(revenue_by_weekday(self.store, year))]
+            summary = ""
+        elif report == "day":
+            headers = ["اليوم", "الإيرادات", "عدد العمليات"]
+            days, (total, count) = revenue_by_day(self.store, year)
+            rows = [(day, f"{amount:.2f}", str(day_count)) for day, amount, day_count in days]
+            summary = f"الإجمالي: ${total:.2f} في {count} عملية"
+        elif report == "packages":
+            headers = ["الباقة", "الإيرادات", "عدد العمليات"]
+            rows = [(package, f"{amount:.2f}", str(count))
+                    for package, amount, count in top_packages(self.store, year)]
+            summary = ""
+        elif report == "profit":
+            headers = ["الشهر", "الإيرادات", "الربح المسجل يدويًا", "المصروفات", "صافي الربح"]
+            profit = monthly_profit(self.store, year)
+            rows = [(f"{ARABIC_MONTHS[int(month[5:7]) - 1]} {month[:4]}", f"{revenue:.2f}",
+                     "" if manual is None else f"{manual:.2f}", f"{spent:.2f}", f"{net:.2f}")
+                    for month, revenue, manual, spent, net in profit]
+            undated = expenses_by_month(self.data["expenses"]).get(None)
+            summary = f"صافي الربح: ${sum(row[4] for row in profit):.2f}"
+            if undated:
+                summary += f"   (مصروفات بدون تاريخ: ${undated:.2f})"
+        else:
+            headers = ["المكون", "الكمية", "السعر", "القيمة"]
+            items, total = inventory_valuation(self.data["inventory"])
+            rows = [(component, f"{quantity:g}", f"{price:.2f}", f"{value:.2f}")
+                    for component, quantity, price, value in items]
+            summary = f"إجمالي قيمة المخزون: ${total:.2f}"
+
+        self.report_model.set_report(headers, rows)
+        self.summary_label.setText(summary)
+
+
+def startup_splash():
+    """ Plain splash drawn without decoding any image, so it is up as soon as Qt is """
+    pixmap = QPixmap(420, 160)
+    pixmap.fill(QColor("#2b2b2b"))
+    painter = QPainter(pixmap)
+    painter.setPen(QColor("white"))
+    painter.setFont(QFont("Arial", 28, QFont.Bold))
+    painter.drawText(pixmap.rect(), Qt.AlignCenter, "Beko Barber")
+    painter.end()
+    splash = QSplashScreen(pixmap)
+    splash.showMessage("جاري تحميل البيانات...", Qt.AlignBottom | Qt.AlignHCenter, QColor("white"))
+    return splash
+
+
+def open_store_in_background(app, config):
+    """ Open the store on a worker thread while the event loop keeps the splash painted """
+    result = {}
+
+    def load():
+        try:
+            result["store"] = open_store(config)
+        except BaseException as error:
+            result["error"] = error
+
+    loader = threading.Thread(target=load, name="store-loader", daemon=True)
+    loader.start()
+    while loader.is_alive():
+        app.processEvents()
+        loader.join(0.02)
+    if "error" in result:
+        raise result["error"]
+    return result["store"]
+
+
+def write_startup_profile(timings, path):
+    """ One line per startup phase; to stderr unless a path is given or the build has no console """
+    report = "".join(f"startup: {label}: {elapsed:.1f} ms\n" for label, elapsed in timings)
+    if not path and sys.stderr is not None:
+        sys.stderr.write(report)
+        return
+    with open(path or STARTUP_PROFILE_FILE, 'w', encoding='utf-8') as file:
+        file.write(report)
+
+
+def main(argv=None):
+    today = datetime.now().strftime("%Y-%m-%d")
+    parser = argparse.ArgumentParser(description="Beko Barber")
+    parser.add_argument("--receipts-pdf", metavar="PATH",
+                        help="reprint the receipts and daily summaries of a date range to PDF instead of opening the window")
+    parser.add_argument("--from", dest="first_day", type=parse_day, default=today, metavar="YYYY-MM-DD")
+    parser.add_argument("--to", dest="last_day", type=parse_day, default=today, metavar="YYYY-MM-DD")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes; above 1, PATH is a directory that gets one PDF per day")
+    parser.add_argument("--serve", nargs="?", const="", metavar="ADDRESS",
+                        help="own the data for several terminals instead of opening the window; "
+                             "terminals set \"server\" in barbershop_config.json to the same address")
+    parser.add_argument("--startup-profile", nargs="?", const="", metavar="PATH",
+                        help="time the imports and each startup phase up to the first paint, write them to PATH "
+                             "(standard error by default) and quit")
+    args, qt_args = parser.parse_known_args(argv)
+
+    if args.serve is not None:
+        serve(load_config(), args.serve)
+        return 0
+
+    if args.receipts_pdf:
+        pages = export_receipts(args.receipts_pdf, args.first_day, args.last_day, args.jobs)
+        print(f"{pages} pages written to {args.receipts_pdf}")
+        return 0
+
+    started = time.perf_counter()
+    timings = [("imports", (IMPORTS_FINISHED - IMPORTS_STARTED) * 1000), ("module", (started - IMPORTS_FINISHED) * 1000)]
+
+    def phase(label):
+        nonlocal started
+        now = time.perf_counter()
+        timings.append((label, (now - started) * 1000))
+        started = now
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    phase("qt")
+    splash = startup_splash()
+    splash.show()
+    app.processEvents()
+    phase("splash")
+    try:
+        store = open_store_in_background(app, load_config())
+    except SnapshotInvalid as error:
+        # Nothing has been written over the file; it is left as it is for the user to restore
+        splash.close()
+        QMessageBox.critical(None, "خطأ في ملف البيانات",
+                             f"تعذرت قراءة ملف البيانات ولم يتم تعديله.\nيرجى استعادته من نسخة احتياطية.\n\n{error}")
+        return 1
+    phase("store")
+    window = BarbershopApp(store, timings)
+    if args.startup_profile is not None:
+        # A tab built in the background would be counted as part of the first paint
+        window.config["prewarm_tabs"] = False
     window.show()
-    sys.exit(app.exec_())
+    splash.close()
+    phase("window")
+
+    if args.startup_profile is not None:
+        def report():
+            phase("first paint")
+            timings.append(("total", (time.perf_counter() - IMPORTS_STARTED) * 1000))
+            write_startup_profile(timings, args.startup_profile)
+            # Quitting skips closeEvent, which is what flushes and closes the store otherwise
+            store.close()
+            app.quit()
+
+        QTimer.singleShot(0, report)
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,252 @@
+""" Timings of the data layer and the tabs against synthetic shop histories.
+
+Each size gets its own temporary directory holding a generated
+barbershop_data.json; the app is then started there under the offscreen Qt
+platform. Results are written as JSON so two runs can be compared:
+
+    python benchmarks/bench_data_layer.py --sizes 1000x100,100000x10000 --output before.json
+    python benchmarks/bench_data_layer.py --sizes 1000x100,100000x10000 --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import barbershop_app as app  # noqa: E402
+
+PRESETS = {
+    "small": [(1000, 100)],
+    "medium": [(1000, 100), (100000, 10000)],
+    "large": [(1000, 100), (100000, 10000), (1000000, 100000)],
+}
+
+FIRST_NAMES = ["محمد", "أحمد", "محمود", "مصطفى", "عمر", "يوسف", "إبراهيم", "خالد", "طارق", "حسن",
+               "علي", "كريم", "سامي", "ياسر", "هشام", "وليد", "عبد الله", "أيمن", "رامي", "زياد"]
+FAMILY_NAMES = ["عاشور", "السيد", "عبد الرحمن", "الشافعي", "منصور", "النجار", "حسين", "فؤاد",
+                "الجمال", "سليمان", "عثمان", "رضوان", "الشريف", "بدوي", "قاسم", "مراد"]
+PACKAGES = [("قص شعر", 120.0), ("حلاقة ذقن", 60.0), ("قص وحلاقة", 160.0), ("تنظيف بشرة", 250.0),
+            ("صبغة", 300.0), ("حمام كريم", 200.0), ("تسريحة عريس", 1500.0), ("قص أطفال", 80.0)]
+COMPONENTS = ["شفرات", "كريم حلاقة", "جل", "صبغة", "مناشف", "شامبو", "بلسم", "كولونيا"]
+
+
+def generate_shop(directory, earnings, customers, seed=1):
+    """ Write a barbershop_data.json with the given history sizes, streaming the earnings so 1M fits in memory """
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=730)
+    span = int((now - start).total_seconds())
+    # Evenly spread ascending timestamps, as a shop that has been open two years would have
+    stamps = sorted(rng.randrange(span) for _ in range(earnings))
+    path = os.path.join(directory, app.DATA_FILE)
+    with open(path, 'w', encoding='utf-8') as file:
+        def section(name, records):
+            file.write(f'"{name}": [')
+            for index, record in enumerate(records):
+                file.write(("," if index else "") + json.dumps(record, ensure_ascii=False))
+            file.write("],\n")
+
+        file.write("{\n")
+        section("packages", ({"id": index + 1, "description": description, "price": price}
+                             for index, (description, price) in enumerate(PACKAGES)))
+        section("inventory", ({"id": index + 1, "component": component, "quantity": rng.randrange(20, 100),
+                               "price": float(rng.randrange(10, 500))} for index, component in enumerate(COMPONENTS)))
+        section("customers", ({"id": index + 1,
+                               "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(FAMILY_NAMES)}",
+                               "mobile": f"01{rng.choice('0125')}{rng.randrange(10 ** 8):08d}",
+                               "visits": rng.randrange(50)} for index in range(customers)))
+
+        def earning(index, stamp):
+            description, price = rng.choice(PACKAGES)
+            record = {"id": index + 1, "date": (start + timedelta(seconds=stamp)).strftime(app.DATE_FORMAT),
+                      "amount": price, "package": description, "package_id": PACKAGES.index((description, price)) + 1,
+                      "quantity": 1}
+            if customers and rng.random() < 0.3:
+                record["customer_id"] = rng.randrange(customers) + 1
+            return record
+
+        section("earnings", (earning(index, stamp) for index, stamp in enumerate(stamps)))
+        section("monthly_earnings", [])
+        section("expenses", ({"id": index + 1, "description": rng.choice(COMPONENTS), "amount": float(rng.randrange(50, 2000)),
+                              "date": (start + timedelta(days=index)).strftime(app.DATE_FORMAT)} for index in range(730)))
+        file.write('"next_ids": ' + json.dumps({"packages": len(PACKAGES) + 1, "inventory": len(COMPONENTS) + 1,
+                                                "customers": customers + 1, "earnings": earnings + 1,
+                                                "monthly_earnings": 1, "expenses": 731}))
+        file.write("\n}\n")
+    return path
+
+
+def timed(function, repeat=1):
+    """ Seconds of the fastest and the median of repeat calls, and the last result """
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return {"min": times[0], "median": times[len(times) // 2], "repeat": repeat}, result
+
+
+def run_size(earnings, customers, repeat):
+    """ Every scenario against one generated history; returns {scenario: timing} """
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+
+    # A modal box would block an unattended run
+    QMessageBox.information = QMessageBox.warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    results = {}
+    qt_app = QApplication.instance() or QApplication([])
+    directory = tempfile.mkdtemp(prefix="barbershop-bench-")
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        results["generate"], path = timed(lambda: generate_shop(directory, earnings, customers))
+        results["snapshot_bytes"] = os.path.getsize(path)
+        results["load_data"], data = timed(app.load_data, repeat)
+        results["save_data"], _ = timed(lambda: app.save_data(data, os.path.join(directory, "copy.json")), repeat)
+        del data
+
+        # First start archives past months in the background; time that apart from a warm start
+        results["startup_first"], store = timed(app.JournalStore)
+        results["compaction"], _ = timed(lambda: store.compactor and store.compactor.join())
+        store.close()
+        # Each start closes its store again, so repeats don't pile up writer threads and locks
+        results["startup"], _ = timed(lambda: app.JournalStore().close(), repeat)
+        store = app.JournalStore()
+
+        checkouts = 200
+        results["checkout"], _ = timed(lambda: [app.record_earning(store, 120.0, "قص شعر", 1) for _ in range(checkouts)])
+        results["checkout"]["per_call"] = results["checkout"]["min"] / checkouts
+        results["flush"], _ = timed(store.flush)
+
+        index = app.CustomerSearchIndex(store)
+        results["search_index_build"], _ = timed(index.rebuild)
+        queries = ["محم", "عبد الر", "يوسف عا", "0100", "0125"]
+        results["search"], _ = timed(lambda: [index.search(query) for query in queries], repeat)
+        results["search"]["per_query"] = results["search"]["min"] / len(queries)
+        store.close()
+
+        # Tabs are timed one by one below, so they must not be built in the background first
+        with open(app.CONFIG_FILE, 'w', encoding='utf-8') as file:
+            json.dump({"prewarm_tabs": False}, file)
+        results["window"], window = timed(app.BarbershopApp)
+        window.show()
+        qt_app.processEvents()
+        for position, (attribute, _, _) in enumerate(window.tab_factories):
+            if getattr(window, attribute) is not None:
+                continue  # Built with the window
+            results[f"tab_{attribute}"], _ = timed(lambda: (window.ensure_tab(position), qt_app.processEvents()))
+
+        # Picking a past month loads it from the archive the first time; later walks are served from memory
+        month_combo = window.earnings_tab.month_combo
+
+        def walk_months():
+            for position in range(1, min(month_combo.count(), 13)):
+                month_combo.setCurrentIndex(position)
+                qt_app.processEvents()
+            month_combo.setCurrentIndex(0)
+            qt_app.processEvents()
+
+        # The first walk reads the months from the archive; the minimum of the repeats would hide that
+        results["earnings_month_filter_first"], _ = timed(walk_months)
+        results["earnings_month_filter"], _ = timed(walk_months, repeat)
+        customer_tab = window.customer_tab
+
+        def search_tab():
+            for query in queries:
+                customer_tab.search_input.setText(query)
+                customer_tab.search_customer()
+                qt_app.processEvents()
+            customer_tab.search_input.clear()
+            customer_tab.search_customer()
+
+        results["customer_tab_search"], _ = timed(search_tab, repeat)
+        inventory_tab = window.inventory_tab
+        results["change_quantity"], _ = timed(
+            lambda: [inventory_tab.change_quantity(row % 4, change) for row in range(50) for change in (1, -1)], repeat)
+        window.close()
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    """ Print the ratio of every timing to the same one in a previous report; above 1 is slower """
+    before = {(run["earnings"], run["customers"]): run["results"] for run in previous["runs"]}
+    for run in current["runs"]:
+        old = before.get((run["earnings"], run["customers"]))
+        if old is None:
+            continue
+        print(f"{run['earnings']} earnings, {run['customers']} customers")
+        for name, timing in run["results"].items():
+            if isinstance(timing, dict) and isinstance(old.get(name), dict) and old[name]["min"]:
+                ratio = timing["min"] / old[name]["min"]
+                flag = "  <-- slower" if ratio > 1.25 else ""
+                print(f"  {name:28} {old[name]['min']:10.4f}s -> {timing['min']:10.4f}s  x{ratio:.2f}{flag}")
+
+
+def parse_sizes(text):
+    if text in PRESETS:
+        return PRESETS[text]
+    sizes = []
+    for item in text.split(","):
+        earnings, _, customers = item.partition("x")
+        sizes.append((int(earnings), int(customers or 0)))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Beko Barber data layer and tabs")
+    parser.add_argument("--sizes", default="small",
+                        help="small, medium, large or a list like 1000x100,100000x10000 (earnings x customers)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each repeatable scenario")
+    parser.add_argument("--output", help="write the JSON report here instead of printing it")
+    parser.add_argument("--compare", metavar="REPORT", help="print ratios against an earlier JSON report")
+    args = parser.parse_args(argv)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": app.load_numpy() is not None,
+        "runs": [],
+    }
+    for earnings, customers in parse_sizes(args.sizes):
+        print(f"running {earnings} earnings, {customers} customers", file=sys.stderr)
+        report["runs"].append({"earnings": earnings, "customers": customers,
+                               "results": run_size(earnings, customers, args.repeat)})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare(report, json.load(file))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
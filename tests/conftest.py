@@ -0,0 +1,35 @@
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def qt_app():
+    from PyQt5.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def journal_store(tmp_path, monkeypatch):
+    """ Opens JournalStores on files in a fresh directory; all are closed after the test """
+    import barbershop_app as app
+
+    monkeypatch.chdir(tmp_path)
+    stores = []
+
+    def open_store(**kwargs):
+        kwargs.setdefault("write_interval", 0)
+        store = app.JournalStore(str(tmp_path / app.DATA_FILE), str(tmp_path / app.JOURNAL_FILE),
+                                 archive_dir=str(tmp_path / app.EARNINGS_ARCHIVE_DIR), **kwargs)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        if store.writer is not None and store.writer.is_alive():
+            store.close()
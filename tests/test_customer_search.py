@@ -0,0 +1,46 @@
+import pytest
+
+import barbershop_app as app
+
+
+@pytest.fixture
+def search(journal_store):
+    store = journal_store()
+    store.add_many("customers", [
+        {"name": "محمد أحمد عاشور", "mobile": "01001234567", "visits": 0},
+        {"name": "أحمد يوسف", "mobile": "01251234567", "visits": 0},
+        {"name": "مصطفى إبراهيم", "mobile": "٠١٠٠٩٨٧٦٥٤٣", "visits": 0},
+    ])
+    return store, app.CustomerSearchIndex(store)
+
+
+def test_empty_query_shows_everyone(search):
+    store, index = search
+    assert index.search("   ") is None
+
+
+@pytest.mark.parametrize("query", ["ـ", "َ", "ـــ", " ُّ ـ "])
+def test_query_of_only_tatweel_or_diacritics_matches_nothing(search, query):
+    store, index = search
+    assert index.search(query) == []
+
+
+def test_name_prefixes_match_loosely(search):
+    store, index = search
+    assert index.search("احمد") == [0, 1]
+    assert index.search("عاش مح") == [0]
+    assert index.search("ابراهيم") == [2]
+
+
+def test_mobile_prefix_folds_arabic_digits(search):
+    store, index = search
+    assert index.search("0100") == [0, 2]
+    assert index.search("٠١٢٥") == [1]
+
+
+def test_new_customers_are_found_without_a_rebuild(search):
+    store, index = search
+    index.search("محمد")
+    store.add("customers", {"name": "محمود", "mobile": "01099999999", "visits": 0})
+    assert not index.stale
+    assert index.search("محم") == [0, 3]
@@ -0,0 +1,63 @@
+import pytest
+
+import barbershop_app as app
+
+
+def test_customer_and_package_totals_follow_checkouts(journal_store, qt_app):
+    store = journal_store()
+    package = store.add("packages", {"description": "قص شعر", "price": 120.0})
+    customer = store.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    customers_tab = app.CustomersTab(store)
+    packages_tab = app.PackagesTab(store)
+    changed = []
+    customers_tab.customers_model.dataChanged.connect(lambda first, last: changed.append(first.column()))
+
+    earning = app.record_earning(store, 240.0, "قص شعر", package["id"], customer["id"], 2)
+    assert customers_tab.customers_model.index(0, 3).data() == "240.00"
+    assert packages_tab.packages_model.index(0, 3).data() == "240.00"
+    store.remove("earnings", earning["id"])
+    assert 3 in changed
+    assert customers_tab.customers_model.index(0, 3).data() == "0.00"
+    assert packages_tab.packages_model.index(0, 3).data() == "0.00"
+
+
+def test_customer_history_dialog(journal_store, qt_app):
+    store = journal_store()
+    customer = store.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    app.record_earning(store, 120.0, "قص شعر", customer_id=customer["id"])
+    app.record_earning(store, 60.0, "حلاقة ذقن", customer_id=customer["id"])
+    app.record_earning(store, 80.0, "قص أطفال")
+    dialog = app.CustomerHistoryDialog(store, customer)
+    assert [row[1:] for row in dialog.history_model.rows] == [("حلاقة ذقن", "1", "60.00"), ("قص شعر", "1", "120.00")]
+
+
+def test_checkout_dropped_by_a_conflict_prints_no_receipt(journal_store, qt_app, monkeypatch):
+    monkeypatch.setattr(app.QMessageBox, "warning", staticmethod(lambda parent, title, text: pytest.fail(text)))
+    first, second = journal_store(), journal_store()
+    component = first.add("inventory", {"component": "شفرات", "quantity": 10, "price": 5.0})
+    first.add("packages", {"description": "قص شعر", "price": 120.0, "materials": [[component["id"], 1]]})
+    second.poll()
+    tab = app.PackagesTab(second)
+    receipts = []
+    tab.preview_receipt = tab.direct_print_receipt = receipts.append
+    tab.packages_table.setCurrentIndex(tab.packages_model.index(0, 0))
+
+    tab.checkout()
+    assert len(receipts) == 1
+    assert second.get("inventory", component["id"])["quantity"] == 9
+
+    first.poll()
+    persist = second.persist
+
+    def racing(entry):
+        if entry["c"] == "inventory":
+            first.update("inventory", component["id"], {"quantity": 30})
+        persist(entry)
+
+    second.persist = racing
+    tab.checkout()
+    del second.persist
+    assert len(receipts) == 1
+    assert len(second.data["earnings"]) == 1
+    assert len(second.data["stock_movements"]) == 1
+    assert second.get("inventory", component["id"])["quantity"] == 30
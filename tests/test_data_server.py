@@ -0,0 +1,91 @@
+import json
+import socket
+import asyncio
+import threading
+
+import pytest
+
+import barbershop_app as app
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def server(request, tmp_path, monkeypatch):
+    """ A --serve process in a thread, on a Unix socket, over either backend """
+    monkeypatch.chdir(tmp_path)
+    if request.param == "sqlite":
+        store = app.SqliteStore(str(tmp_path / "shop.db"), write_interval=0)
+    else:
+        store = app.JournalStore(write_interval=0)
+    address = str(tmp_path / "server.sock")
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def run():
+        task = asyncio.ensure_future(app.StoreServer(store).run(address))
+        while not (tmp_path / "server.sock").exists():
+            await asyncio.sleep(0.01)
+        ready.set()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    task = loop.create_task(run())
+    thread = threading.Thread(target=loop.run_until_complete, args=(task,), daemon=True)
+    thread.start()
+    ready.wait(5)
+    yield address
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+    store.close()
+
+
+def test_update_of_a_record_another_terminal_deleted(server):
+    first, second = app.RemoteStore(server), app.RemoteStore(server)
+    conflicts = []
+    second.subscribe_conflicts(conflicts.append)
+    customer = first.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    second.poll()
+    first.remove("customers", customer["id"])
+
+    second.update("customers", customer["id"], {"visits": 1})
+    assert len(conflicts) == 1
+    assert second.get("customers", customer["id"]) is None
+    # The connection survived the refused update
+    assert second.add("customers", {"name": "أحمد", "mobile": "0101", "visits": 0})["id"] == customer["id"] + 1
+    first.close()
+    second.close()
+
+
+def test_a_failing_request_gets_an_error_reply(server, capsys):
+    client = socket.socket(socket.AF_UNIX)
+    client.connect(server)
+    stream = client.makefile('rwb')
+
+    def request(message):
+        stream.write((message if isinstance(message, bytes) else json.dumps(message).encode("utf-8")) + b"\n")
+        stream.flush()
+        while True:
+            received = json.loads(stream.readline())
+            if "reply" in received:
+                return received["reply"]
+
+    assert "data" in request({"op": "hello"})
+    assert request({"op": "add", "c": "customers", "r": {"name": "محمد", "mobile": "0100"}})["id"] == 1
+    assert "error" in request({"op": "upd", "c": "customers", "id": 1, "r": 5})
+    assert "error" in request({"op": "add", "c": "no such collection", "r": {}})
+    assert "error" in request(b'{"op": "upd", "c": "customers", "id": 1, "r": {"vis')  # Torn
+    assert "error" in request(b"\xff not json")
+    assert "data" in request({"op": "hello"})
+    client.close()
+
+
+def test_lost_server_is_reported_as_an_unsaved_change(server):
+    store = app.RemoteStore(server)
+    conflicts = []
+    store.subscribe_conflicts(conflicts.append)
+    store.socket.shutdown(socket.SHUT_RDWR)
+    store.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    assert [conflict.entry["op"] for conflict in conflicts] == ["add"]
+    assert store.data["customers"] == []
+    store.close()
@@ -0,0 +1,165 @@
+import pytest
+
+import barbershop_app as app
+
+
+@pytest.fixture(params=["numpy", "python"])
+def vectorized(request, monkeypatch):
+    """ Runs a test once with numpy and once through the plain loops it falls back to """
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        assert app.load_numpy() is not None
+    else:
+        monkeypatch.setattr(app, "numpy", None)
+    return request.param
+
+
+def earning(record_id, date, amount, package=None, customer_id=None):
+    record = {"id": record_id, "date": date, "amount": amount, "quantity": 1}
+    if package is not None:
+        record["package"] = package
+    if customer_id is not None:
+        record["customer_id"] = customer_id
+    return record
+
+
+EARNINGS = [
+    earning(1, "2024-03-01 09:15:00", 120.0, "قص شعر", 7),
+    earning(2, "2024-03-01 18:40:00", 60.0, "حلاقة ذقن"),
+    earning(3, "2024-03-02 10:00:00", 160.0, "قص وحلاقة", 7),
+    earning(4, "2024-03-31 23:59:59", 300.0, "صبغة", 8),
+    earning(5, "2024-04-01 00:00:00", 80.0, "قص أطفال"),
+]
+
+
+@pytest.fixture(params=["ascending", "shuffled"])
+def ledger(request):
+    """ Stamps in id order use bisected slices; out of order they go through position lists """
+    records = [dict(record) for record in EARNINGS]
+    if request.param == "shuffled":
+        records[0]["date"], records[4]["date"] = records[4]["date"], records[0]["date"]
+    ledger = app.EarningsLedger(records)
+    assert ledger.stamps_ascending == (request.param == "ascending")
+    return ledger
+
+
+def march():
+    return app.month_bounds("2024-03")
+
+
+def expected_march(ledger):
+    return [record for record in ledger if record["date"].startswith("2024-03")]
+
+
+def test_sum_between(vectorized, ledger):
+    march_earnings = expected_march(ledger)
+    assert ledger.sum_between(*march()) == (sum(record["amount"] for record in march_earnings), len(march_earnings))
+    assert ledger.sum_between(*app.month_bounds("2025-01")) == (0, 0)
+
+
+def test_daily_totals(vectorized, ledger):
+    expected = {}
+    for record in expected_march(ledger):
+        bucket = expected.setdefault(record["date"][:10], [0.0, 0])
+        bucket[0] += record["amount"]
+        bucket[1] += 1
+    assert ledger.daily_totals(*march()) == expected
+    assert ledger.daily_totals(*app.month_bounds("2025-01")) == {}
+
+
+def test_breakdown_matches_the_running_aggregates(vectorized, ledger):
+    aggregates = app.EarningsAggregates(expected_march(ledger))
+    breakdown = ledger.breakdown(*march())
+    for name in ("hour", "weekday", "package"):
+        assert breakdown[name] == aggregates.buckets(name)
+
+
+def test_paths_agree(monkeypatch, ledger):
+    pytest.importorskip("numpy")
+    results = [(ledger.sum_between(*march()), ledger.daily_totals(*march()), ledger.breakdown(*march()))]
+    monkeypatch.setattr(app, "numpy", None)
+    results.append((ledger.sum_between(*march()), ledger.daily_totals(*march()), ledger.breakdown(*march())))
+    assert results[0] == results[1]
+
+
+def test_revenue_by_day_for_a_year_and_for_all_time(journal_store, vectorized):
+    store = journal_store()
+    store.add_many("earnings", [dict(record) for record in EARNINGS])
+    days, total = app.revenue_by_day(store, "2024")
+    assert total == [720.0, 5]
+    assert days[0] == ("2024-04-01", 80.0, 1)
+    assert days[-1] == ("2024-03-01", 180.0, 2)
+    assert app.revenue_by_day(store) == (days, total)
+
+
+def test_customer_history(vectorized, ledger):
+    assert [record["id"] for record in ledger.customer_history(7)] == [1, 3]
+    assert [record["id"] for record in ledger.customer_history(8)] == [4]
+    assert ledger.customer_history(9) == []
+
+
+def test_aggregate_lookups():
+    aggregates = app.EarningsAggregates([dict(record, package_id=index % 2 + 1) for index, record in enumerate(EARNINGS)])
+    assert aggregates.customer_total(7) == 280.0
+    assert aggregates.customer_count(7) == 2
+    assert aggregates.customer_total(9) == 0.0
+    assert aggregates.package_total(1) == 120.0 + 160.0 + 80.0
+    assert aggregates.package_total(2) == 60.0 + 300.0
+    assert aggregates.day_total("2024-03-01") == 180.0
+    assert aggregates.day_total("2024-03-05") == 0.0
+    aggregates.remove(dict(EARNINGS[0], package_id=1))
+    assert aggregates.customer_total(7) == 160.0
+    assert aggregates.package_total(1) == 240.0
+
+
+def test_customer_earnings_loads_archived_months_only_when_needed(journal_store):
+    store = journal_store()
+    store.add_many("earnings", [dict(record) for record in EARNINGS])
+    store.close()
+    store = journal_store()
+    store.compactor.join()  # Past months go to the archive on the first start
+    store.close()
+
+    store = journal_store()
+    assert store.archive.unloaded_months() == ["2024-03", "2024-04"]
+    assert len(store.data["earnings"]) == 0
+    assert [record["id"] for record in app.customer_earnings(store, 7)] == [1, 3]
+    assert store.archive.unloaded_months() == []
+
+    store = journal_store()
+    assert app.customer_earnings(store, 9) == []
+    assert store.archive.unloaded_months() == ["2024-03", "2024-04"]
+
+
+def test_merge_puts_an_older_month_in_front():
+    ledger = app.EarningsLedger([dict(record) for record in EARNINGS[3:]])
+    assert ledger.merge([dict(record) for record in EARNINGS]) == 3
+    assert list(ledger) == EARNINGS
+    assert ledger.stamps_ascending
+    assert ledger.merge([dict(record) for record in EARNINGS[:2]]) == 0
+
+
+def test_merge_fills_gaps_in_id_order():
+    ledger = app.EarningsLedger([dict(EARNINGS[0]), dict(EARNINGS[4])])
+    assert ledger.merge([dict(record) for record in EARNINGS[1:4]]) == 3
+    assert [record["id"] for record in ledger] == [1, 2, 3, 4, 5]
+    assert list(ledger) == EARNINGS
+
+
+def test_insert_out_of_date_order_is_noticed():
+    ledger = app.EarningsLedger([dict(EARNINGS[0]), dict(EARNINGS[2])])
+    ledger.insert(1, earning(2, "2024-05-01 10:00:00", 60.0))
+    assert [record["id"] for record in ledger] == [1, 2, 3]
+    assert not ledger.stamps_ascending
+
+
+def test_set_fields_keeps_the_position_and_odd_values():
+    ledger = app.EarningsLedger([dict(record) for record in EARNINGS])
+    ledger.set_fields(3, {"amount": 175.5, "note": "خصم"})
+    ledger.set_fields(4, {"date": "2024-03-31"})  # Not in DATE_FORMAT, so it is kept as written
+    assert ledger.position(3) == 2
+    assert ledger.get(3) == dict(EARNINGS[2], amount=175.5, note="خصم")
+    assert ledger.get(4)["date"] == "2024-03-31"
+    ledger.set_fields(4, {"date": "2024-03-30 08:00:00"})
+    assert ledger.get(4) == dict(EARNINGS[3], date="2024-03-30 08:00:00")
+    assert 4 not in ledger.extras
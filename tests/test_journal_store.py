@@ -0,0 +1,331 @@
+import os
+import types
+from datetime import datetime
+
+import pytest
+
+import barbershop_app as app
+
+
+def customer(name):
+    return {"name": name, "mobile": "", "visits": 0}
+
+
+def test_compaction_writes_the_snapshot_outside_the_journal_lock(journal_store, monkeypatch):
+    store = journal_store()
+    for index in range(5):
+        store.add("customers", customer(f"زبون {index}"))
+    store.flush()
+    held = []
+    write_snapshot_temp = app.write_snapshot_temp
+
+    def watched(data, path):
+        held.append(store.lock.thread_lock.locked())
+        return write_snapshot_temp(data, path)
+
+    monkeypatch.setattr(app, "write_snapshot_temp", watched)
+    store.start_compaction()
+    store.compactor.join()
+    assert held == [False]
+    assert len(app.load_data(store.path)["customers"]) == 5
+
+
+def test_journal_fsync_runs_outside_the_lock(journal_store, monkeypatch):
+    store = journal_store()
+    held = []
+    fsync = app.os.fsync
+
+    def watched(descriptor):
+        held.append(store.lock.thread_lock.locked())
+        fsync(descriptor)
+
+    monkeypatch.setattr(app.os, "fsync", watched)
+    store.add("customers", customer("زبون"))
+    store.flush()
+    assert held and not any(held)
+
+
+def fake_msvcrt(failures):
+    """ msvcrt.locking whose LK_LOCK fails the way a lock held elsewhere for over ten seconds does """
+    calls = []
+
+    def locking(fileno, mode, length):
+        calls.append(mode)
+        if mode != module.LK_UNLCK and len(calls) <= failures:
+            raise OSError(36, "Resource deadlock avoided")
+
+    module = types.SimpleNamespace(LK_LOCK=1, LK_NBLCK=2, LK_UNLCK=0, locking=locking)
+    return module, calls
+
+
+def test_windows_lock_keeps_waiting_past_lk_lock_giving_up(tmp_path, monkeypatch):
+    module, calls = fake_msvcrt(failures=2)
+    monkeypatch.setattr(app, "fcntl", None)
+    monkeypatch.setattr(app, "msvcrt", module, raising=False)
+    lock = app.FileLock(str(tmp_path / "data.lock"))
+    with lock:
+        assert calls == [module.LK_LOCK] * 3
+    lock.close()
+
+
+def test_windows_lock_times_out_into_a_conflict(journal_store, monkeypatch):
+    store = journal_store()
+    module, calls = fake_msvcrt(failures=float("inf"))
+    monkeypatch.setattr(app, "fcntl", None)
+    monkeypatch.setattr(app, "msvcrt", module, raising=False)
+    monkeypatch.setattr(app, "LOCK_TIMEOUT", 0)
+    with pytest.raises(TimeoutError):
+        store.lock.acquire()
+    assert not store.lock.thread_lock.locked()
+
+    conflicts = []
+    store.subscribe_conflicts(conflicts.append)
+    store.add("customers", customer("زبون"))
+    assert [conflict.entry["op"] for conflict in conflicts] == ["add"]
+    assert store.data["customers"] == []
+    store.poll()  # Skipped until the lock comes free
+
+
+def earning(date, amount):
+    return {"date": date, "amount": amount, "package": "قص شعر", "quantity": 1}
+
+
+def names(store):
+    return [record["name"] for record in store.data["customers"]]
+
+
+def test_journal_replays_and_drops_a_torn_line(journal_store):
+    store = journal_store()
+    store.add("customers", customer("أحمد"))
+    store.add("customers", customer("محمد"))
+    store.update("customers", 1, {"visits": 3})
+    store.remove("customers", 2)
+    store.close()
+    with open(store.journal_path, 'ab') as journal:
+        journal.write(b'{"n": 5, "op": "add", "c": "custo')  # Cut off by a crash
+
+    store = journal_store()
+    assert names(store) == ["أحمد"]
+    assert store.get("customers", 1)["visits"] == 3
+    store.add("customers", customer("عمر"))
+    store.close()
+    # A deleted id is not handed out again, and the torn line is gone for good
+    assert [record["id"] for record in journal_store().data["customers"]] == [1, 3]
+
+
+def test_two_instances_merge_and_rebase(journal_store):
+    first, second = journal_store(), journal_store()
+    first.add("customers", customer("أحمد"))
+    second.add("customers", customer("محمد"))
+    assert [(record["id"], record["name"]) for record in second.data["customers"]] == [(1, "أحمد"), (2, "محمد")]
+    first.poll()
+    assert names(first) == ["أحمد", "محمد"]
+    assert first.data["journal_seq"] == second.data["journal_seq"] == 2
+
+
+def test_stale_update_is_refused(journal_store):
+    first, second = journal_store(), journal_store()
+    first.add("customers", customer("أحمد"))
+    second.poll()
+    conflicts = []
+    second.subscribe_conflicts(conflicts.append)
+    first.update("customers", 1, {"name": "أحمد علي"})
+    second.update("customers", 1, {"name": "أحمد حسن"})
+    assert [conflict.reason for conflict in conflicts] == ["عدّلت نسخة أخرى من البرنامج نفس البيانات"]
+    assert second.get("customers", 1)["name"] == "أحمد علي"
+    # Other fields of the same record still go through
+    second.update("customers", 1, {"visits": 2})
+    assert len(conflicts) == 1
+    first.poll()
+    assert first.get("customers", 1)["visits"] == 2
+
+
+def test_update_of_a_record_deleted_elsewhere_is_refused(journal_store):
+    first, second = journal_store(), journal_store()
+    first.add("customers", customer("أحمد"))
+    second.poll()
+    conflicts = []
+    second.subscribe_conflicts(conflicts.append)
+    first.remove("customers", 1)
+    second.update("customers", 1, {"visits": 1})
+    assert [conflict.reason for conflict in conflicts] == ["حذفت نسخة أخرى من البرنامج هذا السجل"]
+    assert second.data["customers"] == []
+
+
+def test_background_compaction_folds_the_journal_into_the_snapshot(journal_store, monkeypatch):
+    monkeypatch.setattr(app, "COMPACT_THRESHOLD", 3)
+    store = journal_store()
+    for name in ("أحمد", "محمد", "عمر"):
+        store.add("customers", customer(name))
+    store.flush()
+    assert store.compactor is not None
+    store.compactor.join()
+    # Entries written while compacting land in the fresh journal
+    store.add("customers", customer("يوسف"))
+    store.flush()
+    assert not os.path.exists(store.compacting_path)
+    assert [record["name"] for record in app.read_snapshot(store.path)[0]["customers"]] == ["أحمد", "محمد", "عمر"]
+    store.close()
+    assert names(journal_store()) == ["أحمد", "محمد", "عمر", "يوسف"]
+
+
+def test_compaction_interrupted_by_a_crash_is_finished_on_restart(journal_store):
+    store = journal_store()
+    store.add("customers", customer("أحمد"))
+    store.add("customers", customer("محمد"))
+    store.close()
+    # The crash came after the rotation, with the new snapshot half written
+    os.replace(store.journal_path, store.compacting_path)
+    open(store.journal_path, 'wb').close()
+    with open(store.path + ".tmp", 'wb') as file:
+        file.write(b'{"customers": [')
+    os.makedirs(store.archive_dir, exist_ok=True)
+    orphan = os.path.join(store.archive_dir, "2024-03.1.json")
+    app.save_data([], orphan)
+
+    store = journal_store()
+    assert names(store) == ["أحمد", "محمد"]
+    store.compactor.join()
+    assert not os.path.exists(store.compacting_path)
+    assert not os.path.exists(orphan)
+    assert [record["name"] for record in app.read_snapshot(store.path)[0]["customers"]] == ["أحمد", "محمد"]
+
+
+def test_past_months_are_archived_one_file_each(journal_store):
+    today = datetime.now().strftime(app.DATE_FORMAT)
+    store = journal_store()
+    store.add_many("earnings", [earning("2024-03-05 10:00:00", 120.0), earning("2024-04-01 09:00:00", 60.0),
+                                earning("2024-03-20 12:30:00", 160.0), earning(today, 80.0)])
+    store.close()
+
+    store = journal_store()  # Finds past months in the ledger and compacts them away
+    store.compactor.join()
+    store.close()
+    store = journal_store()
+    index = store.data["earnings_archive"]
+    assert sorted(index) == ["2024-03", "2024-04"]
+    assert [list(run) for run in index["2024-03"]["runs"]] == [[1, 1], [3, 3]]
+    assert sorted(os.listdir(store.archive_dir)) == sorted(entry["file"] for entry in index.values())
+    assert [record["id"] for record in store.data["earnings"]] == [4]
+    assert store.aggregates.count == 4
+    assert store.aggregates.month_total("2024-03") == 280.0
+
+    assert store.load_month("2024-03") == 2
+    assert [record["id"] for record in store.data["earnings"]] == [1, 3, 4]
+
+    # A late sale for an archived month joins that month's file
+    store.add("earnings", earning("2024-03-31 20:00:00", 60.0))
+    store.close()
+    store = journal_store()
+    store.compactor.join()
+    store.close()
+    store = journal_store()
+    assert [record["id"] for record in store.archive.read("2024-03")] == [1, 3, 5]
+    assert len(os.listdir(store.archive_dir)) == 2
+
+
+def test_all_or_nothing_undoes_a_sale_whose_stock_update_conflicts(journal_store):
+    first, second = journal_store(), journal_store()
+    component = first.add("inventory", {"component": "شفرات", "quantity": 10, "price": 5.0})
+    customer_record = first.add("customers", customer("أحمد"))
+    second.poll()
+    conflicts = []
+    second.subscribe_conflicts(conflicts.append)
+    persist = second.persist
+
+    def racing(entry):
+        # The other instance restocks between this sale's movement and its quantity update
+        if entry["c"] == "inventory":
+            first.update("inventory", component["id"], {"quantity": 30})
+        persist(entry)
+
+    second.persist = racing
+    with second.batch(), second.all_or_nothing() as dropped:
+        earning_record = app.record_earning(second, 120.0, "قص شعر", customer_id=customer_record["id"])
+        app.post_stock_movement(second, [(component["id"], -2)], app.STOCK_SALE, earning_record["id"])
+    assert [conflict.entry["c"] for conflict in dropped] == ["inventory"]
+    assert conflicts == dropped
+    del second.persist
+
+    for store in (first, second):
+        store.poll()
+        assert len(store.data["earnings"]) == 0 and store.aggregates.count == 0
+        assert store.data["stock_movements"] == []
+        assert store.get("customers", customer_record["id"])["visits"] == 0
+        assert store.get("inventory", component["id"])["quantity"] == 30
+    assert second.undo_log is None
+
+
+def test_all_or_nothing_keeps_everything_without_conflicts(journal_store):
+    store = journal_store()
+    component = store.add("inventory", {"component": "شفرات", "quantity": 10, "price": 5.0})
+    with store.all_or_nothing() as conflicts:
+        earning_record = app.record_earning(store, 120.0, "قص شعر")
+        app.post_stock_movement(store, [(component["id"], -2)], app.STOCK_SALE, earning_record["id"])
+    assert conflicts == []
+    assert store.get("inventory", component["id"])["quantity"] == 8
+    assert [movement["earning_id"] for movement in store.data["stock_movements"]] == [earning_record["id"]]
+
+
+def directory_state(path):
+    return {name: (path / name).read_bytes() for name in sorted(os.listdir(path)) if (path / name).is_file()}
+
+
+def test_read_only_store_leaves_the_files_alone(journal_store, tmp_path):
+    store = journal_store()
+    store.add_many("earnings", [earning("2024-03-05 10:00:00", 120.0), earning("2024-04-01 09:00:00", 60.0)])
+    store.close()
+    with open(store.journal_path, 'ab') as journal:
+        journal.write(b'{"n": 9, "op": "add"')  # A torn line a writer would cut off
+    before = directory_state(tmp_path)
+
+    reader = journal_store(read_only=True)
+    assert [record["id"] for record in reader.data["earnings"]] == [1, 2]
+    assert reader.compactor is None and reader.writer is None
+    conflicts = []
+    reader.subscribe_conflicts(conflicts.append)
+    reader.add("customers", customer("أحمد"))
+    assert [conflict.reason for conflict in conflicts] == ["البيانات مفتوحة للقراءة فقط"]
+    reader.close()
+    assert directory_state(tmp_path) == before
+
+
+def held_open_elsewhere(monkeypatch, store, refusals):
+    """ os.replace refusing to rename the journal, as Windows does while another process has it open """
+    replace = app.os.replace
+    calls = []
+
+    def refusing(source, target):
+        if source == store.journal_path:
+            calls.append(source)
+            if len(calls) <= refusals:
+                raise PermissionError(13, "The process cannot access the file", source)
+        replace(source, target)
+
+    monkeypatch.setattr(app.os, "replace", refusing)
+    monkeypatch.setattr(app.time, "sleep", lambda seconds: None)
+    return calls
+
+
+def test_rotation_waits_for_a_journal_open_elsewhere(journal_store, monkeypatch):
+    store = journal_store()
+    store.add("customers", customer("أحمد"))
+    calls = held_open_elsewhere(monkeypatch, store, refusals=3)
+    store.start_compaction()
+    store.compactor.join()
+    assert len(calls) == 4
+    assert [record["name"] for record in app.read_snapshot(store.path)[0]["customers"]] == ["أحمد"]
+
+
+def test_rotation_still_refused_is_tried_again_later(journal_store, monkeypatch):
+    store = journal_store()
+    store.add("customers", customer("أحمد"))
+    held_open_elsewhere(monkeypatch, store, refusals=app.ROTATE_ATTEMPTS)
+    store.start_compaction()
+    assert store.compactor is None
+    assert not os.path.exists(store.compacting_path)
+    store.add("customers", customer("محمد"))
+    store.start_compaction()
+    store.compactor.join()
+    store.close()
+    assert names(journal_store()) == ["أحمد", "محمد"]
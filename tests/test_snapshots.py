@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import barbershop_app as app
+
+TRUNCATED = '{"customers": [{"id": 1, "name": "أحمد", "mobile": "", "visits": 0}], "earn'.encode("utf-8")
+
+
+def test_truncated_snapshot_is_refused_not_emptied(journal_store, tmp_path):
+    path = tmp_path / app.DATA_FILE
+    path.write_bytes(TRUNCATED)
+    with pytest.raises(app.SnapshotInvalid, match="cannot be decoded as json"):
+        journal_store()
+    (tmp_path / (app.JOURNAL_FILE + app.COMPACTING_SUFFIX)).write_bytes(b"")
+    with pytest.raises(app.SnapshotInvalid):
+        app.compact_journal(str(path), str(tmp_path / (app.JOURNAL_FILE + app.COMPACTING_SUFFIX)))
+    assert path.read_bytes() == TRUNCATED
+
+
+def test_msgpack_snapshot_without_the_package_says_so(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "msgpack", None)
+    path = tmp_path / app.DATA_FILE
+    path.write_bytes(b"\x81\xa9customers\x90")
+    with pytest.raises(app.SnapshotInvalid, match="needs the msgpack package"):
+        app.read_snapshot(str(path))
+
+
+def test_archive_files_are_named_after_their_codec(tmp_path, monkeypatch):
+    pytest.importorskip("msgpack")
+    monkeypatch.setattr(app, "snapshot_codec", app.SNAPSHOT_CODECS["msgpack"])
+    data = {"earnings": []}
+    archive = app.JsonEarningsArchive(str(tmp_path), data)
+    archive.write("2024-03", [{"id": 1, "date": "2024-03-01 10:00:00", "amount": 120.0}])
+    assert data["earnings_archive"]["2024-03"]["file"].endswith(".msgpack")
+    assert [record["id"] for record in archive.read("2024-03")] == [1]
+
+
+def test_unreferenced_month_files_of_either_codec_are_removed(tmp_path):
+    data = {"earnings": []}
+    archive = app.JsonEarningsArchive(str(tmp_path), data)
+    archive.write("2024-03", [{"id": 1, "date": "2024-03-01 10:00:00", "amount": 120.0}])
+    for name in ("2024-02.1.json", "2024-02.2.msgpack"):
+        (tmp_path / name).write_bytes(b"[]")
+    archive.remove_unreferenced()
+    assert os.listdir(tmp_path) == [data["earnings_archive"]["2024-03"]["file"]]
+
+
+def test_window_reports_an_unreadable_snapshot(tmp_path):
+    (tmp_path / app.DATA_FILE).write_bytes(TRUNCATED)
+    code = (f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(app.__file__))!r}); "
+            "import barbershop_app as app; "
+            "app.QMessageBox.critical = staticmethod(lambda parent, title, text: print(title)); "
+            "sys.exit(app.main([]))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, timeout=120,
+                            env=dict(os.environ, QT_QPA_PLATFORM="offscreen"))
+    assert result.returncode == 1, result.stderr
+    assert result.stdout.strip() == "خطأ في ملف البيانات"
+    assert (tmp_path / app.DATA_FILE).read_bytes() == TRUNCATED
@@ -0,0 +1,52 @@
+import barbershop_app as app
+
+
+def open_store(path):
+    return app.SqliteStore(str(path / "shop.db"), write_interval=0)
+
+
+def test_deleted_ids_are_not_reused_after_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = open_store(tmp_path)
+    store.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    newest = store.add("customers", {"name": "أحمد", "mobile": "0101", "visits": 0})
+    app.record_earning(store, 100.0, customer_id=newest["id"])
+    store.remove("customers", newest["id"])
+    store.close()
+
+    store = open_store(tmp_path)
+    customer = store.add("customers", {"name": "يوسف", "mobile": "0102", "visits": 0})
+    assert customer["id"] == newest["id"] + 1
+    assert store.aggregates.customer_total(customer["id"]) == 0.0
+    store.close()
+
+
+def test_next_ids_survive_a_cleared_collection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = open_store(tmp_path)
+    store.add_many("expenses", [{"description": "شامبو", "amount": 50.0} for _ in range(3)])
+    store.clear("expenses")
+    store.close()
+
+    store = open_store(tmp_path)
+    assert store.add("expenses", {"description": "جل", "amount": 20.0})["id"] == 4
+    store.close()
+
+
+def test_read_only_store_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = open_store(tmp_path)
+    app.record_earning(store, 100.0, "قص شعر")
+    store.close()
+    database = tmp_path / "shop.db"
+    before = database.read_bytes()
+
+    reader = app.SqliteStore(str(database), read_only=True)
+    assert [record["amount"] for record in reader.data["earnings"]] == [100.0]
+    assert reader.writer is None
+    conflicts = []
+    reader.subscribe_conflicts(conflicts.append)
+    reader.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    assert len(conflicts) == 1
+    reader.close()
+    assert database.read_bytes() == before
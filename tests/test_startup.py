@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import barbershop_app as app
+
+APP_PATH = os.path.abspath(app.__file__)
+
+
+def run(tmp_path, *arguments):
+    environment = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    return subprocess.run([sys.executable, *arguments], cwd=tmp_path, env=environment, capture_output=True,
+                          text=True, timeout=120)
+
+
+def test_numpy_is_not_imported_at_startup(tmp_path):
+    code = f"import sys; sys.path.insert(0, {os.path.dirname(APP_PATH)!r}); import barbershop_app; print('numpy' in sys.modules)"
+    assert run(tmp_path, "-c", code).stdout.strip() == "False"
+
+
+def test_startup_profile_stops_at_the_first_paint(tmp_path):
+    result = run(tmp_path, APP_PATH, "--startup-profile", "profile.txt")
+    assert result.returncode == 0, result.stderr
+    labels = [line.split(": ")[1] for line in (tmp_path / "profile.txt").read_text(encoding="utf-8").splitlines()]
+    assert labels[-3:] == ["window", "first paint", "total"]
+    # Only the tab shown first is built; the others are not prewarmed into the measurement
+    built = labels[labels.index("store") + 1:labels.index("window")]
+    assert len(built) == 1
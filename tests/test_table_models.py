@@ -0,0 +1,57 @@
+import pytest
+from PyQt5.QtCore import Qt, QModelIndex, qInstallMessageHandler
+from PyQt5.QtTest import QAbstractItemModelTester
+
+import barbershop_app as app
+
+
+@pytest.fixture
+def tester_warnings(qt_app):
+    warnings = []
+    previous = qInstallMessageHandler(lambda kind, context, message: warnings.append(message))
+    yield warnings
+    qInstallMessageHandler(previous)
+
+
+def expense_model(store):
+    model = app.RecordTableModel(store, "expenses", [app.TableColumn("الوصف", "description", parse=str),
+                                                     app.TableColumn("المبلغ", "amount")])
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Warning)
+    return model, tester
+
+
+def expense(number):
+    return {"description": f"مصروف {number}", "amount": float(number), "date": "2026-01-01 10:00:00"}
+
+
+def test_row_changes_are_announced_before_the_store_changes(journal_store, tester_warnings):
+    store = journal_store()
+    model, tester = expense_model(store)
+    first = store.add("expenses", expense(1))
+    store.add_many("expenses", [expense(2), expense(3)])
+    store.update("expenses", first["id"], {"description": "تعديل"})
+    store.remove("expenses", first["id"])
+    store.clear("expenses")
+    assert model.rowCount() == 0
+    assert tester_warnings == []
+
+
+def test_batched_changes_reset_the_model_once(journal_store, tester_warnings):
+    store = journal_store()
+    model, tester = expense_model(store)
+    resets = []
+    model.modelReset.connect(lambda: resets.append(model.rowCount()))
+    with store.batch():
+        for number in range(5):
+            store.add("expenses", expense(number))
+        store.remove("expenses", store.data["expenses"][0]["id"])
+    assert resets == [4]
+    with store.batch():
+        store.add("expenses", expense(9))
+    assert model.rowCount() == 5
+    assert tester_warnings == []
+
+
+def test_invalid_index_has_no_flags(journal_store, qt_app):
+    model, tester = expense_model(journal_store())
+    assert model.flags(QModelIndex()) == Qt.NoItemFlags
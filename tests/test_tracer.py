@@ -0,0 +1,43 @@
+import barbershop_app as app
+
+
+def test_report_goes_to_a_file_without_a_console(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app.sys, "stderr", None)
+    tracer = app.Tracer("1")
+    tracer.record("save_data", 0, 2_500_000)
+    tracer.dump()
+    report = (tmp_path / app.TRACE_REPORT_FILE).read_text(encoding="utf-8")
+    assert "save_data" in report.splitlines()[1]
+
+
+def test_chrome_trace_goes_to_the_named_file(tmp_path):
+    path = tmp_path / "trace.json"
+    tracer = app.Tracer(str(path))
+    tracer.record("save_data", 1_000, 2_000)
+    tracer.dump()
+    assert app.json.loads(path.read_text(encoding="utf-8"))["traceEvents"][0]["name"] == "save_data"
+
+
+def test_store_load_and_save_paths_are_traced(journal_store, monkeypatch):
+    tracer = app.Tracer("1")
+    monkeypatch.setattr(app, "TRACER", tracer)
+    store = journal_store()
+    store.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    store.flush()
+    store.start_compaction()
+    store.compactor.join()
+    assert {"JournalStore.load", "DataStore.commit", "JournalStore.write_lines", "compact_journal"} <= tracer.stats.keys()
+    assert tracer.stats["DataStore.commit"][0] == 1
+
+
+def test_sqlite_store_is_traced(tmp_path, monkeypatch):
+    tracer = app.Tracer("1")
+    monkeypatch.setattr(app, "TRACER", tracer)
+    monkeypatch.chdir(tmp_path)
+    store = app.open_store(dict(app.DEFAULT_CONFIG, storage="sqlite", database=str(tmp_path / "shop.db"),
+                                write_interval=0))
+    store.add("customers", {"name": "محمد", "mobile": "0100", "visits": 0})
+    store.close()
+    assert {"open_store", "SqliteStore.__init__", "DataStore.commit", "SqliteStore.execute_statements"} <= \
+        tracer.stats.keys()